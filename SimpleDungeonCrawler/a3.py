@@ -1,360 +1,172 @@
-import tkinter as tk
-from tkinter import messagebox
-from PIL import Image, ImageTk
 import time
-GAME_LEVELS = {
-    # dungeon layout: max moves allowed
-    "game1.txt": 7,
-    "game2.txt": 12,
-    "game3.txt": 19,
-}
-
-PLAYER = "O"
-KEY = "K"
-DOOR = "D"
-WALL = "#"
-MOVE_INCREASE = "M"
-SPACE = " "
-
-DIRECTIONS = {
-    "W": (-1, 0),
-    "S": (1, 0),
-    "D": (0, 1),
-    "A": (0, -1)
-}
-
-INVESTIGATE = "I"
-QUIT = "Q"
-HELP = "H"
-
-VALID_ACTIONS = [INVESTIGATE, QUIT, HELP, *DIRECTIONS.keys()]
-
-HELP_MESSAGE = f"Here is a list of valid actions: {VALID_ACTIONS}"
-
-INVALID = "That's invalid."
-
-WIN_TEXT = "You have won the game with your strength and honour!"
-
-LOSE_TEST = "You have lost all your strength and honour."
-LOSE_TEXT = "You have lost all your strength and honour."
+#When the game started loading, for time to first frame
+STARTED=time.perf_counter()
+import importlib.machinery
+import importlib.util
+import sys
+import types
+import assets
+import instrumentation
+from fov import DEFAULT_RADIUS, FieldOfView
+
+
+def lazy_import(name):
+    """Returns a module that is only loaded when one of its attributes is
+    first used, so startup doesn't pay for what it may never need
+    Args:
+    name: the module's full name (PIL.Image)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    package=sys.modules.get(name.rpartition('.')[0])
+    if package is not None and type(package) is not types.ModuleType:
+        #find_spec would load a lazily imported package to read its path; read its spec without loading it
+        package_spec=types.ModuleType.__getattribute__(package, '__spec__')
+        spec=importlib.machinery.PathFinder.find_spec(name, package_spec.submodule_search_locations)
+    else:
+        spec=importlib.util.find_spec(name)
+    loader=importlib.util.LazyLoader(spec.loader)
+    spec.loader=loader
+    module=importlib.util.module_from_spec(spec)
+    sys.modules[name]=module
+    loader.exec_module(module)
+    return module
+
+
+#Only loaded once a window is opened, so headless users of the maps and sprites don't pay for Tk
+tk=lazy_import('tkinter')
+messagebox=lazy_import('tkinter.messagebox')
+#Only needed for scaling or compositing tiles that aren't cached
+Image=lazy_import('PIL.Image')
+ImageTk=lazy_import('PIL.ImageTk')
+from engine import (
+    GAME_LEVELS, PLAYER, KEY, DOOR, WALL, MOVE_INCREASE, SPACE, DIRECTIONS,
+    INVESTIGATE, QUIT, HELP, VALID_ACTIONS, HELP_MESSAGE, INVALID, WIN_TEXT,
+    LOSE_TEST, LOSE_TEXT, NO_KEY_TEXT, MOVED, BLOCKED, PICKED_UP, LOCKED, WON,
+    LOST, Event, Display, load_game, Entity, Wall, Item, Key, MoveIncrease,
+    Door, Player, GameLogic,
+)
 
 # Fill these in with your details
 __author__ = "{{Joseph Fernando}} ({{s46424873}})"
 __email__ = "j.fernando@uqconnect.edu.au"
 __date__ = "30/10/20"
 
+#Most map renders per second; moves in between are drawn together
+FRAME_RATE=60
+#Most cells a map shows across or down; larger levels scroll with the player
+VIEW_CELLS=24
+#Cells kept between the player and the edge of a scrolling map
+CAMERA_MARGIN=4
+#Most tiles drawn as canvas items of their own; maps showing more are composited into one image
+COMPOSITE_TILES=256
+#Colour of the map canvas (dark grey), behind see-through parts of tiles
+MAP_BACKGROUND='#a9a9a9'
+#Cells the player sees around them in the dark; None shows the whole map. python a3.py --fog [radius] turns it on
+FOG_RADIUS=None
+#What cell_picture gives cells the player hasn't seen; they aren't drawn at all, leaving the map FOG_COLOUR there
+FOG_PICTURE='fog'
+FOG_COLOUR='black'
+
+
+class SpriteCache:
+    """Decoded, resized images shared by everything that draws tiles."""
 
-class Display:
-    """Display of the dungeon."""
+    def __init__(self):
+        """Construct an empty cache of Tk photos and PIL images keyed by
+        (file, size)."""
+        self._photos = {}
+        self._images = {}
 
-    def __init__(self, game_information, dungeon_size):
-        """Construct a view of the dungeon.
+    def get(self, picture, size):
+        """Returns the photo for picture resized to a size x size square.
 
-        Parameters:
-            game_information (dict<tuple<int, int>: Entity): Dictionary 
-                containing the position and the corresponding Entity
-            dungeon_size (int): the width of the dungeon.
-        """
-        self._game_information = game_information
-        self._dungeon_size = dungeon_size
+        The first time the pair is asked for, Tk reads the image already
+        scaled from the assets cache, scaling it there first if need be;
+        the same photo is handed back after that.
 
-    def display_game(self, player_pos):
-        """Displays the dungeon.
-        
-        Parameters:
-            player_pos (tuple<int, int>): The position of the Player
-        """
-        dungeon = ""
-
-        for i in range(self._dungeon_size):
-            rows = ""
-            for j in range(self._dungeon_size):
-                position = (i, j)
-                entity = self._game_information.get(position)
-
-                if entity is not None:
-                    char = entity.get_id()
-                elif position == player_pos:
-                    char = PLAYER
-                else:
-                    char = SPACE
-                rows += char
-            if i < self._dungeon_size - 1:
-                rows += "\n"
-            dungeon += rows
-        print(dungeon)
-
-    def display_moves(self, moves):
-        """Displays the number of moves the Player has left.
-        
         Parameters:
-            moves (int): THe number of moves the Player can preform. 
+            picture (str): The image file (example.gif)
+            size (int): The square size of the image in pixels
         """
-        print(f"Moves left: {moves}\n")
-
-
-def load_game(filename):
-    """Create a 2D array of string representing the dungeon to display.
-    
-    Parameters:
-        filename (str): A string representing the name of the level.
-
-    Returns:
-        (list<list<str>>): A 2D array of strings representing the 
-            dungeon.
-    """
-    dungeon_layout = []
-
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-            dungeon_layout.append(list(line))
+        photo = self._photos.get((picture, size))
+        if photo is None:
+            photo = self._load_photo(picture, size)
+            self._photos[(picture, size)] = photo
+        return photo
 
-    return dungeon_layout
+    def _load_photo(self, picture, size):
+        """Returns a new photo of picture resized to a size x size square,
+        read by Tk from the assets cache, or scaled by PIL if it can't be
+        cached.
 
-
-class Entity:
-    """ """
-
-    _id = "Entity"
-
-    def __init__(self):
-        """
-        Something the player can interact with
+        Parameters:
+            picture (str): The image file (example.gif)
+            size (int): The square size of the image in pixels
         """
-        self._collidable = True
-
-    def get_id(self):
-        """ """
-        return self._id
-
-    def set_collide(self, collidable):
-        """ """
-        self._collidable = collidable
-
-    def can_collide(self):
-        """ """
-        return self._collidable
-
-    def __str__(self):
-        return f"{self.__class__.__name__}({self._id!r})"
-
-    def __repr__(self):
-        return str(self)
-
-
-class Wall(Entity):
-    """ """
-
-    _id = WALL
-    
-    def __init__(self):
-        """ """
-        super().__init__()
-        self.set_collide(False)
-
-
-class Item(Entity):
-    """ """
-    def on_hit(self, game):
-        """ """
-        raise NotImplementedError
-
-
-class Key(Item):
-    """ """
-
-    _id = KEY
-
-    def on_hit(self, game):
-        """ """
-        player = game.get_player()
-        player.add_item(self)
-        game.get_game_information().pop(player.get_position())
+        path = assets.scaled(picture, size)
+        if path is not None:
+            return tk.PhotoImage(file=path)
+        return ImageTk.PhotoImage(Image.open(picture).resize((size, size)))
 
+    def get_image(self, picture, size):
+        """Returns picture resized to a size x size square as an RGBA PIL
+        image, for compositing.
 
-class MoveIncrease(Item):
-    """ """
-
-    _id = MOVE_INCREASE
-
-    def __init__(self, moves=5):
-        """ """
-        super().__init__()
-        self._moves = moves
-
-    def on_hit(self, game):
-        """ """
-        player = game.get_player()
-        player.change_move_count(self._moves)
-        game.get_game_information().pop(player.get_position())
-
-
-class Door(Entity):
-    """ """
-    _id = DOOR
-
-    def on_hit(self, game):
-        """ """
-        player = game.get_player()
-        for item in player.get_inventory():
-            if item.get_id() == KEY:
-                game.set_win(True)
-                return
-
-        messagebox.showinfo(title=None, message="You don't have the key!")
-
-
-class Player(Entity):
-    """ """
-
-    _id = PLAYER
-
-    def __init__(self, move_count):
-        """ """
-        super().__init__()
-        self._move_count = move_count
-        self._inventory = []
-        self._position = None
-
-    def set_position(self, position):
-        """ """
-        self._position = position
-
-    def get_position(self):
-        """ """
-        return self._position
-
-    def change_move_count(self, number):
-        """
         Parameters:
-            number (int): number to be added to move count
+            picture (str): The image file (example.gif)
+            size (int): The square size of the image in pixels
         """
-        self._move_count += number
+        image = self._images.get((picture, size))
+        if image is None:
+            image = self._load_image(picture, size)
+            self._images[(picture, size)] = image
+        return image
 
-    def moves_remaining(self):
-        """ """
-        return self._move_count
+    def _load_image(self, picture, size):
+        """Returns a new RGBA PIL image of picture resized to a size x size
+        square, from the assets cache if it can be cached.
 
-    def add_item(self, item):
-        """Adds item (Item) to inventory
+        Parameters:
+            picture (str): The image file (example.gif)
+            size (int): The square size of the image in pixels
         """
-        self._inventory.append(item)
-
-    def get_inventory(self):
-        """ """
-        return self._inventory
-
-
-class GameLogic():
-    """ """
-    def __init__(self, dungeon_name):
-        """ """
-        self._dungeon = load_game(dungeon_name)
-        self._dungeon_size = len(self._dungeon)
-        self._player = Player(GAME_LEVELS[dungeon_name])
-        self._game_information = self.init_game_information()
-        self._win = False
-
-    def get_positions(self, entity):
-        """ """
-        positions = []
-        for row, line in enumerate(self._dungeon):
-            for col, char in enumerate(line):
-                if char == entity:
-                    positions.append((row, col))
-
-        return positions
-
-    def init_game_information(self):
-        """ """
-        player_pos = self.get_positions(PLAYER)[0]
-        key_position = self.get_positions(KEY)[0]
-        door_position = self.get_positions(DOOR)[0]
-        wall_positions = self.get_positions(WALL)
-        move_increase_positions = self.get_positions(MOVE_INCREASE)
-        self._player.set_position(player_pos)
-
-        information = {
-            key_position: Key(),
-            door_position: Door(),
-        }
-
-        for wall in wall_positions:
-            information[wall] = Wall()
-
-        for move_increase in move_increase_positions:
-            information[move_increase] = MoveIncrease()
-        return information
-    def get_player(self):
-        """ """
-        return self._player
-
-    def get_entity(self, position):
-        """ """
-        return self._game_information.get(position)
-
-    def get_entity_in_direction(self, direction):
-        """ """
-        new_position = self.new_position(direction)
-        return self.get_entity(new_position)
+        path = assets.scaled(picture, size)
+        if path is not None:
+            return Image.open(path).convert('RGBA')
+        return Image.open(picture).resize((size, size)).convert('RGBA')
 
-    def get_game_information(self):
-        """ """
-        return self._game_information
+    def drop_size(self, size):
+        """Forgets every photo cached at size.
 
-    def get_dungeon_size(self):
-        """ """
-        return self._dungeon_size
-
-    def move_player(self, direction):
-        """ """
-        new_pos = self.new_position(direction)
-        self.get_player().set_position(new_pos)
-
-    def collision_check(self, direction):
-        """
-        Check to see if a player can travel in a given direction
         Parameters:
-            direction (str): a direction for the player to travel in.
-
-        Returns:
-            (bool): False if the player can travel in that direction without colliding otherwise True.
+            size (int): The square size that is no longer drawn
         """
-        new_pos = self.new_position(direction)
-        entity = self.get_entity(new_pos)
-        if entity is not None and not entity.can_collide():
-            return True
-        
-        return not (0 <= new_pos[0] < self._dungeon_size and 0 <= new_pos[1] < self._dungeon_size)
+        for cache in (self._photos, self._images):
+            for key in [key for key in cache if key[1] == size]:
+                del cache[key]
 
-    def new_position(self, direction):
-        """ """
-        x, y = self.get_player().get_position()
-        dx, dy = DIRECTIONS[direction]
-        return x + dx, y + dy
+    def clear(self):
+        """Forgets every cached photo and image."""
+        self._photos.clear()
+        self._images.clear()
 
-    def check_game_over(self):
-        """ """
-        return self.get_player().moves_remaining() <= 0
+    def __len__(self):
+        return len(self._photos)
 
-    def set_win(self, win):
-        """ """
-        self._win = win
 
-    def won(self):
-        """ """
-        return self._win
+SPRITES = SpriteCache()
 
-class AbstractGrid(tk.Canvas):
+
+#Not a tk.Canvas subclass: it never called Canvas.__init__ and draws on canvases it makes, and subclassing would load tkinter on import
+class AbstractGrid:
     """Base class for UI elements"""
-    def __init__(self, master, dungeon_name):
-        self._game=GameLogic(dungeon_name)
-        self._door=Door()
-        self._key=Key()
-        self._move_increase=MoveIncrease()
-        self._player=Player(5)
-        self._wall=Wall()
+    def __init__(self, master, game):
+        """Args:
+        master: the window to draw in
+        game: the game being played (GameLogic), shared by every element
+        """
+        self._game=game
         self._master=master
     def get_bbox(self, position):
         pass
@@ -369,52 +181,91 @@ class AbstractGrid(tk.Canvas):
 
         Args:
         picture: the image to be used (example.gif)
-        frame: the frame to put the image in (tk.frame, etc.)
+        frame: the canvas to put the image on (tk.Canvas)
         size: the square resize of the image in pixels (int)
         placement: the placement of the image from the top left (list)
 
+        Returns:
+        int: the id of the canvas item showing the image
         """
-        
-        load=Image.open(picture)
-        load=load.resize((size, size))
-        render=ImageTk.PhotoImage(load)
-        img=tk.Label(frame, image=render, bd=0, highlightthickness=0)
-        img.image=render
-        img.place(x=placement[0], y=placement[1])
+        #A canvas item rather than a Label widget; SPRITES keeps the photo alive
+        return self.tile(picture, frame, size, placement)
+
+    def tile(self, picture, canvas, size, placement):
+        """Draws a cached square image as an item on a canvas.
+
+        Args:
+        picture: the image to be used (example.gif)
+        canvas: the canvas to draw on (tk.Canvas)
+        size: the square size of the image in pixels (int)
+        placement: the placement of the image from the top left (list)
+
+        Returns:
+        int: the id of the new canvas item
+        """
+        return canvas.create_image(placement[0], placement[1], image=SPRITES.get(picture, size), anchor='nw')
 
 class GameApp(AbstractGrid):
-    def __init__(self, master, task='TASK_TWO', dungeon_name='game2.txt'):
+    def __init__(self, master, task='TASK_TWO', dungeon_name='game2.txt', game=None, frame_rate=FRAME_RATE, recorder=None, fog_radius=FOG_RADIUS):
         """Binds keys to UI elements, creates initial window
         Args:
         task: which mode to use (TASK_ONE, TASK_TWO)
         dungeon_name: which game to use (game1.txt, etc.)
+        game: an already loaded game to play instead of loading dungeon_name
+        frame_rate: most renders per second (int)
+        recorder: a replay.ReplayWriter to record every action to, if any
+        fog_radius: how far the player sees, hiding cells they haven't seen (TASK_TWO);
+            None shows the whole map
 
         """
-        super().__init__(master, dungeon_name)
+        if game is None:
+            game=GameLogic(dungeon_name)
+        super().__init__(master, game)
         self._master.title('Key Cave Adventure Game')
         self._heading_frame=tk.Frame(self._master, bg='green', width=800, height=100)
         self._heading_frame.grid(row=0, column=0, columnspan=2)
         self._heading=tk.Label(self._heading_frame, text='Key Cave Adventure Game', bg='medium spring green', padx=330)
         self._heading.pack(side=tk.RIGHT)
         self._player=self._game.get_player()
-        self._initial_move_count=self._player.moves_remaining()
+        #Snapshots of the game before each move, latest last, for undo
+        self._history=[]
         self._task=task
         self._dungeon_name=dungeon_name
+        #Render scheduling: cells waiting to be drawn, the pending after() id
+        self._frame_interval=1/frame_rate
+        self._dirty=set()
+        self._render_pending=None
+        self._last_render=0
+        self._recorder=recorder
         
+        self._field_of_view=None
         if task=='TASK_ONE':
-            self._dungeon_map=DungeonMap(self._master, dungeon_name)
+            self._dungeon_map=DungeonMap(self._master, self._game)
         else:
-            self._dungeon_map=AdvancedDungeonMap(self._master, dungeon_name)
-            self._status_bar=StatusBar(self._master, dungeon_name)
+            if fog_radius is not None:
+                self._field_of_view=FieldOfView(self._game.get_grid(), fog_radius)
+            self._dungeon_map=AdvancedDungeonMap(self._master, self._game, field_of_view=self._field_of_view)
+            self._status_bar=StatusBar(self._master, self._game)
             self.moves_remaining=self._status_bar._moves_remaining_frame.create_text(100, 80, text=f'{self._player.moves_remaining()} moves remaining')
-        self._keypad=KeyPad(self._master, dungeon_name)
+        self._keypad=KeyPad(self._master, self._game)
         
-        self._keypad._keypad_frame.bind('<Button-1>', self.play)
+        #event kind: method reacting to it
+        self._handlers={
+            MOVED: self.on_moved,
+            PICKED_UP: self.on_picked_up,
+            BLOCKED: self.on_blocked,
+            LOCKED: self.on_locked,
+            WON: self.on_won,
+            LOST: self.on_lost,
+        }
+        self._keypad._keypad_frame.bind('<Button-1>', self.click)
         
         self._master.bind('<w>', self.play)
         self._master.bind('<a>', self.play)
         self._master.bind('<s>', self.play)
         self._master.bind('<d>', self.play)
+        self._master.bind('<u>', self.undo)
+        self._master.bind('<Control-z>', self.undo)
         
         self._status_bar._quit.bind('<Button-1>', self.quit)
         self._status_bar._new_game.bind('<Button-1>', self.restart)
@@ -437,69 +288,128 @@ class GameApp(AbstractGrid):
             return None
         else:
             try:
-                self._status_bar._moves_remaining_frame.itemconfig(self.moves_remaining, text=f'{self._player.moves_remaining()-1} moves remaining')
+                self._status_bar._moves_remaining_frame.itemconfig(self.moves_remaining, text=f'{self._player.moves_remaining()} moves remaining')
             except:
                 self.moves_remaining=self._status_bar._moves_remaining_frame.create_text(100, 80, text=f'{self._player.moves_remaining()} moves remaining')
     def play(self, event):
-        """Binds keys to UI elements, creates initial window
+        """Moves the player for a W, A, S or D key press
         Args:
-        event:key presses and mouse click
+        event: the key press
 
         """
-        #Game already lost
-        if self._player.moves_remaining()==0:
-            return
-            print('ok')
-        #Moving with keypad
-        if str(self._keypad.pixel_to_direction(event.x, event.y)) in 'WASD':
-            self._direction=str(self._keypad.pixel_to_direction(event.x, event.y))
-
-        #Moving with keys
-        elif (str(event.keysym)).upper() in 'WASD':
-            self._direction=(str(event.keysym)).upper()
-        else:
+        direction=str(event.keysym).upper()
+        if direction in DIRECTIONS:
+            self.move(direction)
+
+    def click(self, event):
+        """Moves the player for a click on the keypad
+        Args:
+        event: the mouse click
+
+        """
+        direction=self._keypad.pixel_to_direction(event.x, event.y)
+        if direction is not None:
+            self.move(direction)
+
+    def move(self, direction):
+        """Plays a direction and reacts to what happened
+        Args:
+        direction: letter of the direction to move (W, A, S, D)
+
+        """
+        if self._recorder is not None:
+            self._recorder.record(direction)
+        self._history.append(self._game.snapshot())
+        events=self._game.step(direction)
+        #A finished game ignores moves, leaving nothing to undo
+        if not events:
+            self._history.pop()
+        self.handle(events)
+
+    def undo(self, event=None):
+        """Takes back the last move, if any, however many times in a row
+        Args:
+        event: the key press, if undone with one
+
+        """
+        if not self._history:
             return
-        if not self._game.collision_check(self._direction):
-            self._game.move_player(self._direction)
-            self._dungeon_map._player_position=self._game.get_player().get_position()
-            entity = self._game.get_entity(self._player.get_position())
-            
-         
-        
-            # process on_hit and check win state
-            if entity is not None:
-                entity.on_hit(self._game)
-                if str(entity)==str(Key()):
-                    self._dungeon_map._key_position=self._game.get_positions(KEY)
-                if str(entity)==str(MoveIncrease()):
-                    self._dungeon_map._move_increase_position=self._game.get_positions(MOVE_INCREASE)
-                    self.movesleft()
-                if self._game.won():
-                    self.update()
-                    self._win_box=messagebox.askquestion(title='You won!', message=f'You have finished the level with a score of {self._count-1}. \n\nWould you like to play again?')
-                    if self._win_box=='yes':
-                        self.restart()
-                    if self._win_box=='no':
-                        self.quit()
-                        return
-                        
-        
-        #Invalid move
-        else:
-            messagebox.showinfo(title=None, message=INVALID)
-        
+        if self._recorder is not None:
+            self._recorder.record_undo()
+        self._dirty.update(self._game.restore(self._history.pop()))
+        self.schedule_render()
 
-        self.update()
-        #Game lost
-        if self._game.check_game_over():
-            messagebox.showinfo(title=None, message=LOSE_TEST)
+    def handle(self, events):
+        """Passes each game event to the handler for its kind
+        Args:
+        events: the events of one step (list of Event)
+
+        """
+        #Nothing happens once the game is over
+        if not events:
             return
-        
-    def update(self):
-        """Updates timer, map and moves remaining"""
-        self._dungeon_map.draw_grid()
+        #Every step costs a move, blocked or not, so the counter needs a render
+        self.schedule_render()
+        for game_event in events:
+            handler=self._handlers.get(game_event.kind)
+            if handler is not None:
+                handler(game_event)
+
+    def schedule_render(self):
+        """Asks for a render, at most one per frame; a render already
+        waiting will draw this change too"""
+        if self._render_pending is not None:
+            return
+        wait=self._last_render+self._frame_interval-time.perf_counter()
+        self._render_pending=self._master.after(max(0, int(wait*1000)), self.render)
+
+    def render(self):
+        """Draws everything that changed since the last render"""
+        if self._render_pending is not None:
+            self._master.after_cancel(self._render_pending)
+            self._render_pending=None
+        #The map redraws the player's cells itself
+        self._dungeon_map.redraw(self._dirty)
+        self._dirty.clear()
         self.movesleft()
-        self._player.change_move_count(-1)
+        self._last_render=time.perf_counter()
+
+    def on_moved(self, game_event):
+        """Moves the player on the map"""
+        self.schedule_render()
+
+    def on_picked_up(self, game_event):
+        """Clears the picked up item from the map"""
+        self._dirty.add(game_event.position)
+        self.schedule_render()
+
+    def on_blocked(self, game_event):
+        """Tells the player the move was invalid"""
+        self.render()
+        messagebox.showinfo(title=None, message=INVALID)
+
+    def on_locked(self, game_event):
+        """Tells the player the door needs the key"""
+        self.render()
+        messagebox.showinfo(title=None, message=NO_KEY_TEXT)
+
+    def on_won(self, game_event):
+        """Offers another game after a win"""
+        self.render()
+        self._win_box=messagebox.askquestion(title='You won!', message=f'You have finished the level with a score of {self._count-1}. \n\nWould you like to play again?')
+        if self._win_box=='yes':
+            self.restart()
+        if self._win_box=='no':
+            self.quit()
+
+    def on_lost(self, game_event):
+        """Tells the player they are out of moves"""
+        self.render()
+        messagebox.showinfo(title=None, message=LOSE_TEST)
+
+    def update(self):
+        """Updates map and moves remaining now, without waiting for a frame"""
+        self.render()
 
     def quit(self, event=None):
         """Destroys window"""
@@ -511,141 +421,402 @@ class GameApp(AbstractGrid):
         event: triggers after mouse click on quit
 
         """
-        #Restore moves, clear inventory
-        self._game._player.change_move_count(self._initial_move_count-self._player.moves_remaining()+1)
-        self._game._player._inventory.clear()
-        #Reset entity positions and win
-        self._game._game_information = self._game.init_game_information()
-        self._game._win = False
-        #Reset entity positions (for dungeon map)
-        self._dungeon_map._player_position=self._game.get_player().get_position()
-        self._dungeon_map._key_position=self._game.get_positions(KEY)[0]
-        try:
-            self._dungeon_map._move_increase_position=self._game.get_positions(MOVE_INCREASE)[0]
-        except:
-            self._dungeon_map._move_increase_position=None
-        self._dungeon_map=AdvancedDungeonMap(self._master, self._dungeon_name)
-        #Redraw grid, moves and timer
-        self._dungeon_map.draw_grid()
+        if self._recorder is not None:
+            self._recorder.record_restart()
+        #Back to the state the level was loaded in; only the cells that changed need drawing
+        self._dirty.update(self._game.reset())
+        self._history.clear()
         self._count=0
-        self.movesleft()
+        if self._field_of_view is not None:
+            #A new game has seen nothing yet
+            self._dirty.update(self._field_of_view.reset())
+        self.render()
         
+class TileItems:
+    """Draws every slot of a map as a canvas image item of its own, reused
+    for whatever the slot shows. Slots showing FOG_PICTURE are hidden
+    items, which Tk doesn't draw"""
+    name='items'
+
+    def __init__(self, canvas, slots, spacing, size):
+        """Args:
+        canvas: the map's canvas (tk.Canvas)
+        slots: the (row, column) of every tile (list)
+        spacing: pixels from one tile to the next (float)
+        size: the square size of the tiles in pixels (int)
+
+        """
+        self._canvas=canvas
+        self._size=size
+        #slot: (canvas item of the floor, canvas item showing what is on the cell)
+        self._items={}
+        for row, column in slots:
+            x, y=column*spacing, row*spacing
+            self._items[(row, column)]=(
+                canvas.create_image(x, y, image=SPRITES.get('empty.gif', size), anchor='nw', state='hidden'),
+                canvas.create_image(x, y, image='', anchor='nw', state='hidden'))
+        #Slots whose items are hidden, every one until it is first shown
+        self._hidden=set(self._items)
+
+    def show(self, slot, picture):
+        """Draws picture (or nothing, for None) on a slot, or hides the slot
+        for FOG_PICTURE"""
+        floor, item=self._items[slot]
+        if picture==FOG_PICTURE:
+            if slot not in self._hidden:
+                self._hidden.add(slot)
+                self._canvas.itemconfig(floor, state='hidden')
+                self._canvas.itemconfig(item, state='hidden')
+            return
+        image=SPRITES.get(picture, self._size) if picture is not None else ''
+        if slot in self._hidden:
+            self._hidden.discard(slot)
+            self._canvas.itemconfig(floor, state='normal')
+            self._canvas.itemconfig(item, image=image, state='normal')
+        else:
+            self._canvas.itemconfig(item, image=image)
+
+    def flush(self):
+        """Items are up to date as soon as they are configured"""
+
+class CompositeFrame:
+    """Draws a whole map as one image: tiles are pasted into a PIL frame,
+    and once per render the part of it that changed is copied into the
+    single Tk photo the canvas shows. Slots showing FOG_PICTURE are
+    filled with FOG_COLOUR rather than drawn"""
+    name='composite'
+
+    def __init__(self, canvas, slots, spacing, size):
+        """Args:
+        canvas: the map's canvas (tk.Canvas)
+        slots: the (row, column) of every tile (list)
+        spacing: pixels from one tile to the next (float)
+        size: the square size of the tiles in pixels (int)
+
+        """
+        self._canvas=canvas
+        self._size=size
+        self._spacing=spacing
+        rows=max(row for row, column in slots)+1
+        columns=max(column for row, column in slots)+1
+        self._frame=Image.new('RGB', (int((columns-1)*spacing)+size, int((rows-1)*spacing)+size), MAP_BACKGROUND)
+        #picture: the tile pasted for it, empty floor already under it
+        self._tiles={}
+        self._photo=ImageTk.PhotoImage(self._frame)
+        canvas.create_image(0, 0, image=self._photo, anchor='nw')
+        #left, top, right, bottom pixels changed since the last flush
+        self._changed=None
+
+    def corner(self, slot):
+        """Returns the (x, y) pixel of a slot's top left corner"""
+        return int(slot[1]*self._spacing), int(slot[0]*self._spacing)
+
+    def tile_image(self, picture):
+        """Returns the tile for picture (None for an empty cell) over the
+        empty floor, as an RGB image"""
+        tile=self._tiles.get(picture)
+        if tile is None:
+            tile=Image.new('RGBA', (self._size, self._size), MAP_BACKGROUND)
+            tile.alpha_composite(SPRITES.get_image('empty.gif', self._size))
+            if picture is not None:
+                tile.alpha_composite(SPRITES.get_image(picture, self._size))
+            tile=self._tiles[picture]=tile.convert('RGB')
+        return tile
+
+    def show(self, slot, picture):
+        """Draws picture (or nothing, for None) on a slot of the frame"""
+        x, y=self.corner(slot)
+        box=(x, y, x+self._size, y+self._size)
+        if picture==FOG_PICTURE:
+            self._frame.paste(FOG_COLOUR, box)
+        else:
+            self._frame.paste(self.tile_image(picture), (x, y))
+        if self._changed is None:
+            self._changed=box
+        else:
+            self._changed=(min(self._changed[0], x), min(self._changed[1], y),
+                max(self._changed[2], box[2]), max(self._changed[3], box[3]))
+
+    def flush(self):
+        """Copies the part of the frame that changed into the photo"""
+        if self._changed is None:
+            return
+        left, top, right, bottom=self._changed
+        self._changed=None
+        width, height=self._frame.size
+        if (right-left)*(bottom-top)*2>=width*height:
+            self._photo.paste(self._frame)
+        else:
+            patch=ImageTk.PhotoImage(self._frame.crop((left, top, right, bottom)))
+            self._canvas.tk.call(str(self._photo), 'copy', str(patch), '-to', left, top)
+
+class Camera:
+    """Which part of the level a map shows: all of it if it fits, else a
+    window of it that scrolls to keep the player away from its edges"""
+    def __init__(self, game, cells=VIEW_CELLS, margin=CAMERA_MARGIN):
+        """Args:
+        game: the game being played (GameLogic)
+        cells: most rows and columns to show at once (int)
+        margin: how close the player may get to an edge of the window
+            before it scrolls (int)
+
+        """
+        self._game=game
+        self._rows=min(cells, game.get_height())
+        self._columns=min(cells, game.get_width())
+        self._margin=min(margin, (min(self._rows, self._columns)-1)//2)
+        self._origin=None
+        self.follow()
+
+    def get_size(self):
+        """Returns (rows, columns) of the window"""
+        return self._rows, self._columns
+
+    def get_origin(self):
+        """Returns the (row, column) of the level cell in the top left corner"""
+        return self._origin
+
+    def follow(self):
+        """Centres the window on the player if they have come within the
+        margin of one of its edges
+        Returns:
+        bool: True if the window moved
+        """
+        row, column=self._game.get_player().get_position()
+        if self._origin is not None:
+            top, left=self._origin
+            if (top+self._margin<=row<top+self._rows-self._margin
+                    and left+self._margin<=column<left+self._columns-self._margin):
+                return False
+        origin=(min(max(0, row-self._rows//2), self._game.get_height()-self._rows),
+                min(max(0, column-self._columns//2), self._game.get_width()-self._columns))
+        moved=origin!=self._origin
+        self._origin=origin
+        return moved
+
+    def slots(self):
+        """Returns every (row, column) of the window, row by row"""
+        return [(row, column) for row in range(self._rows) for column in range(self._columns)]
+
+    def to_level(self, slot):
+        """Returns the level position shown in a slot of the window"""
+        return self._origin[0]+slot[0], self._origin[1]+slot[1]
+
+    def to_slot(self, position):
+        """Returns the slot of the window showing a level position, None if
+        it is out of view"""
+        row=position[0]-self._origin[0]
+        column=position[1]-self._origin[1]
+        if 0<=row<self._rows and 0<=column<self._columns:
+            return row, column
+        return None
+
 class DungeonMap(AbstractGrid):
-    def __init__(self, master, dungeon_name):
-        """Draws grid and gets positions of entities
+    #entity id: (fill colour, text)
+    _STYLES={
+        DOOR: ('red', 'Nest'),
+        WALL: ('grey', ''),
+        KEY: ('yellow', 'Trash'),
+        MOVE_INCREASE: ('orange', 'Banana'),
+    }
+
+    def __init__(self, master, game):
+        """Draws grid of the game's entities
         Args:
-        dungeon_name: which game to use (game1.txt, etc.)
+        game: the game being played (GameLogic)
 
         """
-        super().__init__(master, dungeon_name)
-        self._player_position=self._game.get_player().get_position()
-        self._key_position=self._game.get_positions(KEY)[0]
-        try:
-            self._move_increase_position=self._game.get_positions(MOVE_INCREASE)[0]
-        except:
-            self._move_increase_position=None
-        self.draw_grid()
-        
-    def draw_grid(self):
-        """Creates map"""
-        self._dungeon_map_frame=tk.Canvas(self._master, bg='dark grey', width=600, height=600)
-        
+        super().__init__(master, game)
+        self._dungeon_map_frame=tk.Canvas(self._master, bg=MAP_BACKGROUND, width=600, height=600)
         self._dungeon_map_frame.grid(row=1, column=0)
-        row=0
-        while self._game._dungeon_size>row:
-            column=0
-            while self._game._dungeon_size>column:
-                
-                self._rectangle_placement=(column*(600/self._game._dungeon_size),row*(600/self._game._dungeon_size),
-                (column+1)*(600/self._game._dungeon_size),(row+1)*(600/self._game._dungeon_size))
-                
-                self._text_placement=600*(2*column+1)/self._game._dungeon_size/2, 600*(2*row+1)/self._game._dungeon_size/2
-                
-                if self._player_position==(row, column):
-                    self._dungeon_map_frame.create_rectangle(self._rectangle_placement, fill='medium spring green')
-                    self._dungeon_map_frame.create_text(self._text_placement, text='Ibis')
-
-                elif str(self._game.get_entity((row, column)))==str(Door()):
-                    self._dungeon_map_frame.create_rectangle(self._rectangle_placement, fill='red')
-                    self._dungeon_map_frame.create_text(self._text_placement, text='Nest')
-
-                elif str(self._game.get_entity((row, column)))==str(Wall()):
-                    self._dungeon_map_frame.create_rectangle(self._rectangle_placement, fill='grey')
+        self._camera=Camera(self._game)
+        #slot of the camera's window: (rectangle item, text item), reused as the camera moves
+        self._cells={}
+        #slot: style it is drawn with
+        self._shown={}
+        self._drawn_player_position=self._game.get_player().get_position()
+        self.draw_grid()
 
-                elif self._key_position==((row, column)):
-                    self._dungeon_map_frame.create_rectangle(self._rectangle_placement, fill='yellow')
-                    self._dungeon_map_frame.create_text(self._text_placement, text='Trash')
+    def cell_style(self, position):
+        """Works out how a cell should look
+        Args:
+        position: the (row, column) of the cell
+        Returns:
+        tuple: fill colour and text for the cell, None if the cell is empty
+        """
+        if self._game.get_player().get_position()==position:
+            return 'medium spring green', 'Ibis'
+        entity=self._game.get_entity(position)
+        if entity is not None:
+            return self._STYLES.get(entity.get_id())
+        return None
 
-                elif self._move_increase_position==((row, column)) and self._move_increase_position!=None:
-                    self._dungeon_map_frame.create_rectangle(self._rectangle_placement, fill='orange')
-                    self._dungeon_map_frame.create_text(self._text_placement, text='Banana')
-                    
-                column+=1
-            row+=1
+    def draw_grid(self):
+        """Creates map, or brings every cell of an existing map up to date"""
+        self._camera.follow()
+        if not self._cells:
+            size=600/max(self._camera.get_size())
+            for row, column in self._camera.slots():
+                self._rectangle_placement=(column*size, row*size, (column+1)*size, (row+1)*size)
+                self._text_placement=size*(2*column+1)/2, size*(2*row+1)/2
+                self._cells[(row, column)]=(
+                    self._dungeon_map_frame.create_rectangle(self._rectangle_placement, state='hidden'),
+                    self._dungeon_map_frame.create_text(self._text_placement, text=''))
+        self._shown.clear()
+        self.draw_slots(self._cells)
+
+    def redraw(self, positions=()):
+        """Updates the cells that may have changed since the last draw,
+        scrolling the map if the player has neared its edge
+        Args:
+        positions: cells to update as well as the player's old and new ones
+        """
+        player_position=self._game.get_player().get_position()
+        if self._camera.follow():
+            self.draw_slots(self._cells)
+        else:
+            positions=set(positions)
+            positions.update((self._drawn_player_position, player_position))
+            self.draw_slots([self._camera.to_slot(position) for position in positions])
+        self._drawn_player_position=player_position
+
+    def draw_slots(self, slots):
+        """Shows the cell the camera puts in each slot, leaving alone those
+        that already show the right thing
+        Args:
+        slots: slots of the camera's window; None entries are skipped
+        """
+        for slot in slots:
+            if slot is None:
+                continue
+            style=self.cell_style(self._camera.to_level(slot))
+            if slot in self._shown and self._shown[slot]==style:
+                continue
+            self._shown[slot]=style
+            rectangle, text=self._cells[slot]
+            if style is None:
+                self._dungeon_map_frame.itemconfig(rectangle, state='hidden')
+                self._dungeon_map_frame.itemconfig(text, text='')
+            else:
+                self._dungeon_map_frame.itemconfig(rectangle, state='normal', fill=style[0])
+                self._dungeon_map_frame.itemconfig(text, text=style[1])
 
 class AdvancedDungeonMap(AbstractGrid):
-    def __init__(self, master, dungeon_name):
-        """Draws grid and gets positions of entities
+    #entity id: image drawn for it
+    _PICTURES={
+        DOOR: 'door.gif',
+        WALL: 'wall.gif',
+        KEY: 'key.gif',
+        MOVE_INCREASE: 'moveIncrease.gif',
+    }
+
+    def __init__(self, master, game, backend=None, field_of_view=None):
+        """Draws grid of the game's entities
         Args:
-        dungeon_name: which game to use (game1.txt, etc.)
+        game: the game being played (GameLogic)
+        backend: how to draw tiles, TileItems or CompositeFrame; by default
+            composited when the map shows more than COMPOSITE_TILES of them
+        field_of_view: what the player has seen (fov.FieldOfView); cells it
+            hides aren't drawn, leaving them FOG_COLOUR. By default every cell is drawn
 
         """
-        super().__init__(master, dungeon_name)
-        self._player_position=self._game.get_player().get_position()
-        self._key_position=self._game.get_positions(KEY)[0]
-        self._door_position=self._game.get_positions(DOOR)[0]
-        try:
-            self._move_increase_position=self._game.get_positions(MOVE_INCREASE)[0]
-        except:
-            self._move_increase_position=None
+        super().__init__(master, game)
+        #Hidden cells leave the canvas showing through
+        background=MAP_BACKGROUND if field_of_view is None else FOG_COLOUR
+        self._dungeon_map_frame=tk.Canvas(self._master, bg=background, width=600, height=600)
+        self._dungeon_map_frame.grid(row=1, column=0)
+        self._camera=Camera(self._game)
+        if backend is None:
+            rows, columns=self._camera.get_size()
+            backend=CompositeFrame if rows*columns>COMPOSITE_TILES else TileItems
+        self._backend=backend
+        self._field_of_view=field_of_view
+        self._size=None
+        #Draws the tiles of the camera's window, reused as the camera moves
+        self._tiles=None
+        #slot: image it is drawn with
+        self._shown={}
+        self._drawn_player_position=self._game.get_player().get_position()
         self.draw_grid()
-        
+
+    def cell_picture(self, position):
+        """Works out which image should be drawn on a cell
+        Args:
+        position: the (row, column) of the cell
+        Returns:
+        str: the image for the cell, None if the cell is empty
+        """
+        if self._field_of_view is not None and not self._field_of_view.is_shown(position):
+            return FOG_PICTURE
+        if self._game.get_player().get_position()==position:
+            return 'player.gif'
+        entity=self._game.get_entity(position)
+        if entity is not None:
+            return self._PICTURES.get(entity.get_id())
+        return None
+
     def draw_grid(self):
-        """Creates map"""
-        #Ensures window isn't clogged up by previous renditions of map
-        try:
-            self._dungeon_map_frame.destroy()
-        except:
-            pass
-        self._dungeon_map_frame=tk.Canvas(self._master, bg='dark grey', width=600, height=600)
-        self._dungeon_map_frame.grid(row=1, column=0)
-        row=0
-        while self._game._dungeon_size>row:
-            column=0
-            while self._game._dungeon_size>column:
-                self._size=int(600/self._game._dungeon_size)
-                self._placement=[column*(600/self._game._dungeon_size), row*(600/self._game._dungeon_size)]
-                self.picture('empty.gif', self._dungeon_map_frame,self._size,
-                self._placement)
-                if self._player_position==(row, column):
-                    self.picture('player.gif', self._dungeon_map_frame,self._size,
-                self._placement)
-                                       
-                elif self._door_position==((row, column)):
-                    self.picture('door.gif', self._dungeon_map_frame,self._size,
-                self._placement)
-                    
-                elif str(self._game.get_entity((row, column)))==str(Wall()):
-                    self.picture('wall.gif', self._dungeon_map_frame,self._size,
-                self._placement)
-                     
-                elif self._key_position==((row, column)):
-                    self.picture('key.gif', self._dungeon_map_frame,self._size,
-                self._placement)
-    
-                elif self._move_increase_position==((row, column)) and self._move_increase_position!=None:
-                    self.picture('moveIncrease.gif', self._dungeon_map_frame,self._size,
-                    self._placement)
-                
-                column+=1
-            row+=1
+        """Creates map, or brings every cell of an existing map up to date"""
+        self._camera.follow()
+        if self._field_of_view is not None:
+            self._field_of_view.update(self._game.get_player().get_position())
+        spacing=600/max(self._camera.get_size())
+        size=int(spacing)
+        if self._size!=size:
+            #Photos and items at the old cell size will never be drawn again
+            if self._size is not None:
+                SPRITES.drop_size(self._size)
+            self._dungeon_map_frame.delete('all')
+            self._size=size
+            self._tiles=self._backend(self._dungeon_map_frame, self._camera.slots(), spacing, size)
+        self._shown.clear()
+        self.draw_slots(self._camera.slots())
+        self._tiles.flush()
+
+    def redraw(self, positions=()):
+        """Updates the cells that may have changed since the last draw,
+        scrolling the map if the player has neared its edge
+        Args:
+        positions: cells to update as well as the player's old and new ones
+        """
+        player_position=self._game.get_player().get_position()
+        positions=set(positions)
+        if self._field_of_view is not None:
+            #Only cells coming into (or out of) view look different
+            positions.update(self._field_of_view.update(player_position))
+        if self._camera.follow():
+            self.draw_slots(self._camera.slots())
+        else:
+            positions.update((self._drawn_player_position, player_position))
+            self.draw_slots([self._camera.to_slot(position) for position in positions])
+        self._tiles.flush()
+        self._drawn_player_position=player_position
+
+    def get_backend(self):
+        """Returns the class drawing the tiles (TileItems or CompositeFrame)"""
+        return self._backend
+
+    def draw_slots(self, slots):
+        """Shows the cell the camera puts in each slot, leaving alone those
+        that already show the right image
+        Args:
+        slots: slots of the camera's window; None entries are skipped
+        """
+        for slot in slots:
+            if slot is None:
+                continue
+            picture=self.cell_picture(self._camera.to_level(slot))
+            if slot in self._shown and self._shown[slot]==picture:
+                continue
+            self._shown[slot]=picture
+            self._tiles.show(slot, picture)
 
 class KeyPad(AbstractGrid):
-    def __init__(self, master, dungeon_name):
+    def __init__(self, master, game):
         """Creates keypad
         Args:
-        dungeon_name: which game to use (game1.txt, etc.) (not nessesary)"""
-        super().__init__(master, dungeon_name)
+        game: the game being played (GameLogic) (not nessesary)"""
+        super().__init__(master, game)
         self._keypad_frame=tk.Canvas(self._master, width=200, height=100)
         self._keypad_frame.grid(row=1, column=1)
         self._keypad_frame.create_rectangle(0,100,66,50, fill='grey')
@@ -681,11 +852,11 @@ class KeyPad(AbstractGrid):
             return 'S'
     
 class StatusBar(AbstractGrid):
-    def __init__(self, master, dungeon_name):
+    def __init__(self, master, game):
         """Creates status bar
         Args:
-        dungeon_name: which game to use (game1.txt, etc.) to know number of moves"""
-        super().__init__(master, dungeon_name)
+        game: the game being played (GameLogic) to know number of moves"""
+        super().__init__(master, game)
         self._moves_remaining=3
         self._statusbar_frame=tk.Frame(self._master, width=600, height=100)
         self._statusbar_frame.grid(row=2, column=0, columnspan=2)
@@ -719,8 +890,19 @@ class StatusBar(AbstractGrid):
         self._quit.pack()
 
 if __name__ == "__main__":
+    import argparse
+    parser=argparse.ArgumentParser(description='Key Cave Adventure Game')
+    parser.add_argument('--fog', type=int, nargs='?', const=DEFAULT_RADIUS, default=FOG_RADIUS, metavar='RADIUS',
+        help=f'only show cells the player has seen, seeing RADIUS cells around them (default {DEFAULT_RADIUS})')
+    args=parser.parse_args()
     root=tk.Tk()
-    app=GameApp(root)
+    #Off unless DUNGEON_PROFILE is set, so normal games run unwrapped; installed once tkinter has loaded, so Tk methods can be counted
+    profiler=instrumentation.from_environment(sys.modules[__name__])
+    app=GameApp(root, fog_radius=args.fog)
+    if profiler is not None:
+        instrumentation.attach(root, profiler)
+        #Idle callbacks run in turn, so this one runs once the first frame is drawn
+        root.after_idle(lambda: profiler.record('first_frame', time.perf_counter()-STARTED))
     root.mainloop()
 
 
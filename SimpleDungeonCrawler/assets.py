@@ -0,0 +1,110 @@
+"""Tile images scaled once and kept on disk.
+
+Drawing a tile at a cell size means decoding its .gif and resizing it,
+which needs PIL. Each size of each image is instead saved once as a PNG
+under __assets__ beside the image, named after the image's modification
+time and size in bytes, so an edited image is scaled again rather than
+shown stale. Tk reads PNGs itself, so a game whose tiles are all cached
+starts without importing PIL at all.
+
+The sizes games usually draw at can be cached ahead of time:
+
+    python assets.py [image.gif ...]
+"""
+import glob
+import os
+import sys
+
+CACHE_DIRECTORY = "__assets__"
+# Cell sizes a 600 pixel map draws at, 3 to 24 cells across, and the
+# status bar's 50 pixel icons
+COMMON_SIZES = tuple(sorted({50, *(int(600 / cells)
+                                   for cells in range(3, 25))}))
+
+
+def cached_path(picture, size, cache_directory=None):
+    """Returns where picture scaled to size would be cached, whether or
+    not it is.
+
+    Parameters:
+        picture (str): The image file (example.gif).
+        size (int): The square size of the image in pixels.
+        cache_directory (str): Where to cache it, by default __assets__
+            beside the image.
+    """
+    if cache_directory is None:
+        cache_directory = os.path.join(os.path.dirname(picture),
+                                       CACHE_DIRECTORY)
+    stat = os.stat(picture)
+    stem = os.path.splitext(os.path.basename(picture))[0]
+    return os.path.join(cache_directory, f"{stem}-{size}-"
+                        f"{stat.st_mtime_ns:x}-{stat.st_size:x}.png")
+
+
+def scaled(picture, size, cache_directory=None):
+    """Returns the path of picture scaled to a size x size square PNG,
+    scaling and saving it first if it isn't cached.
+
+    Parameters:
+        picture (str): The image file (example.gif).
+        size (int): The square size of the image in pixels.
+        cache_directory (str): As for cached_path.
+
+    Returns:
+        (str): The cached PNG, or None if it can't be written (a read only
+            directory), in which case the caller scales picture itself.
+    """
+    path = cached_path(picture, size, cache_directory)
+    if os.path.exists(path):
+        return path
+    from PIL import Image
+
+    directory = os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(picture))[0]
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so a game starting meanwhile never
+        # reads half an image
+        temporary = f"{path}.{os.getpid()}.tmp"
+        Image.open(picture).resize((size, size)).save(temporary, "PNG")
+        os.replace(temporary, path)
+        # Older versions of the image at this size will never be read
+        for stale in glob.glob(os.path.join(
+                glob.escape(directory), f"{glob.escape(stem)}-{size}-*.png")):
+            if stale != path:
+                os.remove(stale)
+    except OSError:
+        return None
+    return path
+
+
+def warm(pictures, sizes=COMMON_SIZES, cache_directory=None):
+    """Cache pictures at every size given.
+
+    Returns:
+        (int): The number of images that weren't cached already.
+    """
+    made = 0
+    for picture in pictures:
+        for size in sizes:
+            if not os.path.exists(cached_path(picture, size,
+                                              cache_directory)):
+                scaled(picture, size, cache_directory)
+                made += 1
+    return made
+
+
+def main(argv):
+    """Cache images at COMMON_SIZES from the command line."""
+    pictures = argv[1:] or sorted(glob.glob("*.gif"))
+    if not pictures:
+        print(__doc__.strip())
+        return 2
+    made = warm(pictures)
+    print(f"{made} images scaled, {len(pictures) * len(COMMON_SIZES)} "
+          f"cached at sizes {', '.join(map(str, COMMON_SIZES))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,281 @@
+"""Many players stepping through the same level at once.
+
+BatchEngine holds each player's position, moves left, key and win as one
+array per field and plays a whole vector of directions per step, with the
+same rules as GameLogic.step: a blocked move still costs a move, pickups
+are per player, and a player who has won or run out of moves is left
+alone. NumPy is used when it is installed; without it the same arrays are
+plain lists stepped one player at a time.
+"""
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from engine import (DIRECTIONS, KEY, DOOR, WALL, MOVE_INCREASE, MOVED,
+                    BLOCKED, PICKED_UP, LOCKED, WON, LOST, Event)
+
+# Directions in the order their action numbers refer to
+ACTIONS = tuple(DIRECTIONS)
+ACTION_NUMBERS = {action: number for number, action in enumerate(ACTIONS)}
+
+# What a cell holds, in the cell kinds array
+EMPTY_CELL, KEY_CELL, DOOR_CELL, BOOST_CELL = range(4)
+_CELL_KINDS = {KEY: KEY_CELL, DOOR: DOOR_CELL, MOVE_INCREASE: BOOST_CELL}
+
+StepResult = namedtuple("StepResult", ["moved", "blocked", "picked_up",
+                                       "locked", "won", "lost"])
+StepResult.__doc__ = """What each player's last step did, one flag per
+player for each Event kind GameLogic.step can emit."""
+
+
+class BatchEngine:
+    """A number of independent players on one level.
+
+    Cells are numbered row by row on the level with a blocked border added
+    around it, so moving is adding an offset and walls and edges are one
+    lookup in the passability mask.
+    """
+
+    def __init__(self, game, count):
+        """Start count players from the state game is in now.
+
+        Parameters:
+            game (GameLogic): The level and the state every player starts
+                in; it is not changed.
+            count (int): The number of players.
+        """
+        grid = game.get_grid()
+        width, height = grid.get_width(), grid.get_height()
+        self._count = count
+        self._stride = stride = width + 2
+        self._offsets = [dx * stride + dy for dx, dy in DIRECTIONS.values()]
+
+        cells = (height + 2) * stride
+        passable = bytearray(cells)
+        row_mask = grid.tobytes().translate(
+            bytes(byte != ord(WALL) for byte in range(256)))
+        for row in range(height):
+            start = (row + 1) * stride + 1
+            passable[start:start + width] = row_mask[row * width:
+                                                     (row + 1) * width]
+        kinds = bytearray(cells)
+        self._boost_cells = []
+        gains = []
+        # cell: the entity GameLogic would report in events there
+        self._entities = {}
+        for position, entity in game.get_game_information().get_entities(
+                ).items():
+            kind = _CELL_KINDS.get(entity.get_id())
+            if kind is None:
+                continue
+            cell = self._cell(position)
+            kinds[cell] = kind
+            self._entities[cell] = entity
+            if kind == BOOST_CELL:
+                self._boost_cells.append(cell)
+                gains.append(entity.get_moves())
+
+        player = game.get_player()
+        self._start = (self._cell(player.get_position()),
+                       player.moves_remaining(),
+                       any(item.get_id() == KEY
+                           for item in player.get_inventory()),
+                       game.won())
+
+        if numpy is not None:
+            self._passable = numpy.frombuffer(passable, dtype=bool)
+            self._kinds = numpy.frombuffer(kinds, dtype=numpy.uint8)
+            self._offsets = numpy.array(self._offsets, dtype=numpy.int64)
+            self._boost_index = numpy.full(cells, -1, dtype=numpy.int64)
+            self._boost_index[self._boost_cells] = range(len(gains))
+            self._gains = numpy.array(gains, dtype=numpy.int64)
+        else:
+            self._passable = passable
+            self._kinds = kinds
+            self._boost_index = {cell: index for index, cell
+                                 in enumerate(self._boost_cells)}
+            self._gains = gains
+        self.reset()
+
+    def _cell(self, position):
+        """Returns the cell number of a (row, column) position."""
+        row, column = position
+        return (row + 1) * self._stride + column + 1
+
+    def _position(self, cell):
+        """Returns the (row, column) position of a cell number."""
+        row, column = divmod(int(cell), self._stride)
+        return row - 1, column - 1
+
+    def reset(self):
+        """Put every player back in the starting state."""
+        cell, moves, has_key, won = self._start
+        count = self._count
+        boosts = len(self._boost_cells)
+        if numpy is not None:
+            self._cells = numpy.full(count, cell, dtype=numpy.int64)
+            self._moves = numpy.full(count, moves, dtype=numpy.int64)
+            self._has_key = numpy.full(count, has_key, dtype=bool)
+            self._won = numpy.full(count, won, dtype=bool)
+            self._used = numpy.zeros((count, boosts), dtype=bool)
+        else:
+            self._cells = [cell] * count
+            self._moves = [moves] * count
+            self._has_key = [has_key] * count
+            self._won = [won] * count
+            self._used = [0] * count
+
+    def __len__(self):
+        return self._count
+
+    def get_positions(self):
+        """Returns each player's (row, column) position."""
+        return [self._position(cell) for cell in self._cells]
+
+    def moves_remaining(self):
+        """Returns each player's moves left, as an array or list."""
+        return self._moves
+
+    def has_key(self):
+        """Returns whether each player holds the key."""
+        return self._has_key
+
+    def won(self):
+        """Returns whether each player has won."""
+        return self._won
+
+    def finished(self):
+        """Returns whether each player has won or run out of moves."""
+        if numpy is not None:
+            return self._won | (self._moves <= 0)
+        return [won or moves <= 0
+                for won, moves in zip(self._won, self._moves)]
+
+    def _action_numbers(self, actions):
+        """Returns actions as numbers into ACTIONS."""
+        if numpy is not None and isinstance(actions, numpy.ndarray) \
+                and actions.dtype.kind in "iu":
+            return actions
+        numbers = [ACTION_NUMBERS[action] if isinstance(action, str)
+                   else int(action) for action in actions]
+        if numpy is not None:
+            return numpy.array(numbers, dtype=numpy.int64)
+        return numbers
+
+    def step(self, actions):
+        """Plays one direction for every player.
+
+        Parameters:
+            actions (sequence): One DIRECTIONS key, or its number in
+                ACTIONS, per player.
+
+        Returns:
+            (StepResult): What happened to each player.
+        """
+        actions = self._action_numbers(actions)
+        if len(actions) != self._count:
+            raise ValueError(f"{len(actions)} actions for {self._count} "
+                             f"players")
+        if numpy is not None:
+            return self._step_arrays(actions)
+        return self._step_lists(actions)
+
+    def _step_arrays(self, actions):
+        """step, vectorised with NumPy."""
+        active = ~self._won & (self._moves > 0)
+        targets = self._cells + self._offsets[actions]
+        blocked = active & ~self._passable[targets]
+        moved = active & ~blocked
+        self._cells = cells = numpy.where(moved, targets, self._cells)
+
+        kinds = numpy.where(moved, self._kinds[cells], EMPTY_CELL)
+        keys = (kinds == KEY_CELL) & ~self._has_key
+        self._has_key |= keys
+
+        boosts = numpy.flatnonzero(kinds == BOOST_CELL)
+        indices = self._boost_index[cells[boosts]]
+        fresh = ~self._used[boosts, indices]
+        boosts, indices = boosts[fresh], indices[fresh]
+        self._used[boosts, indices] = True
+        self._moves[boosts] += self._gains[indices]
+        picked_up = keys.copy()
+        picked_up[boosts] = True
+
+        doors = kinds == DOOR_CELL
+        locked = doors & ~self._has_key
+        won = doors & self._has_key
+        self._won |= won
+        self._moves -= active
+        lost = active & ~won & (self._moves <= 0)
+        return StepResult(moved, blocked, picked_up, locked, won, lost)
+
+    def _step_lists(self, actions):
+        """step, one player at a time."""
+        count = self._count
+        moved = [False] * count
+        blocked = [False] * count
+        picked_up = [False] * count
+        locked = [False] * count
+        won = [False] * count
+        lost = [False] * count
+        for player, action in enumerate(actions):
+            if self._won[player] or self._moves[player] <= 0:
+                continue
+            target = self._cells[player] + self._offsets[action]
+            if not self._passable[target]:
+                blocked[player] = True
+            else:
+                moved[player] = True
+                self._cells[player] = target
+                kind = self._kinds[target]
+                if kind == KEY_CELL and not self._has_key[player]:
+                    self._has_key[player] = picked_up[player] = True
+                elif kind == BOOST_CELL:
+                    bit = 1 << self._boost_index[target]
+                    if not self._used[player] & bit:
+                        self._used[player] |= bit
+                        self._moves[player] += self._gains[
+                            self._boost_index[target]]
+                        picked_up[player] = True
+                elif kind == DOOR_CELL:
+                    if self._has_key[player]:
+                        self._won[player] = won[player] = True
+                    else:
+                        locked[player] = True
+            self._moves[player] -= 1
+            lost[player] = not won[player] and self._moves[player] <= 0
+        return StepResult(moved, blocked, picked_up, locked, won, lost)
+
+    def events(self, result, player, actions):
+        """Rebuild the events GameLogic.step would have returned for one
+        player's part of a step.
+
+        Parameters:
+            result (StepResult): What step returned.
+            player (int): Which player.
+            actions (sequence): The actions that were passed to step.
+
+        Returns:
+            (list<Event>): The player's events, in GameLogic's order.
+        """
+        position = self._position(self._cells[player])
+        events = []
+        if result.blocked[player]:
+            action = self._action_numbers([actions[player]])[0]
+            events.append(Event(BLOCKED, self._position(
+                self._cells[player] + self._offsets[action]), None))
+        elif result.moved[player]:
+            events.append(Event(MOVED, position, None))
+            entity = self._entities.get(self._cells[player])
+            if result.picked_up[player]:
+                events.append(Event(PICKED_UP, position, entity))
+            elif result.locked[player]:
+                events.append(Event(LOCKED, position, entity))
+        if result.won[player]:
+            events.append(Event(WON, position, None))
+        elif result.lost[player]:
+            events.append(Event(LOST, position, None))
+        return events
@@ -0,0 +1,709 @@
+"""Benchmark suite for the dungeon crawler's hot paths.
+
+Run from this directory (the game loads levels and images relative to it):
+
+    python benchmarks.py                      # every benchmark
+    python benchmarks.py parse step redraw    # just these
+    python benchmarks.py --quick --json results.json
+
+Each benchmark plays generated levels at several sizes, wall densities and
+MoveIncrease densities, prints a table and, with --json, adds its results
+as one more run to a JSON file, so later runs can be compared against
+earlier ones. The map
+benchmarks draw with Tk when there is a display (xvfb-run gives one on
+headless machines) and on an offscreen stand-in for the canvas otherwise,
+which times the game's own drawing code but not Tk's.
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+from engine import (PLAYER, KEY, DOOR, WALL, MOVE_INCREASE, SPACE,
+                    DIRECTIONS, PICKED_UP, Display, load_game, GameLogic)
+from levels import load_text, load_binary, save_binary
+
+# (size, wall density, MoveIncrease density) of the levels the benchmarks
+# play, and the smaller ones --quick plays instead
+LEVELS = ((100, 0.2, 0.0), (100, 0.2, 0.01), (1000, 0.2, 0.0),
+          (1000, 0.4, 0.001))
+QUICK_LEVELS = ((50, 0.2, 0.0), (50, 0.2, 0.02), (200, 0.3, 0.001))
+
+
+def generate_level(size, seed=0, wall_density=0.2, boost_density=0.0):
+    """Create the rows of a square level with a border of walls.
+
+    The player, key, door and a MoveIncrease sit in the corners, with more
+    MoveIncreases scattered over the level when boost_density is given.
+
+    Parameters:
+        size (int): The width and height of the level.
+        seed (int): Seed for the random placement.
+        wall_density (float): Chance an inner cell is a wall.
+        boost_density (float): Chance an inner cell is a MoveIncrease.
+
+    Returns:
+        (list<str>): The rows of the level in the load_game text format.
+    """
+    rng = random.Random(seed)
+    # Random bytes below the threshold become walls
+    threshold = int(wall_density * 256)
+    table = bytes((WALL if byte < threshold else SPACE).encode()[0]
+                  for byte in range(256))
+    wall = WALL.encode()
+    rows = [bytearray(wall * size)]
+    for _ in range(size - 2):
+        rows.append(bytearray(wall + rng.randbytes(size - 2).translate(table)
+                              + wall))
+    rows.append(bytearray(wall * size))
+
+    for _ in range(int(boost_density * (size - 2) ** 2)):
+        rows[rng.randrange(1, size - 1)][rng.randrange(1, size - 1)] = \
+            ord(MOVE_INCREASE)
+    for (row, column), char in (((1, 1), PLAYER), ((1, size - 2), KEY),
+                                ((size - 2, size - 2), DOOR),
+                                ((size - 2, 1), MOVE_INCREASE)):
+        rows[row][column] = ord(char)
+    return [row.decode() for row in rows]
+
+
+def write_level(rows, directory, name):
+    """Write level rows to directory/name and return the path."""
+    path = os.path.join(directory, name)
+    with open(path, "w") as file:
+        file.write("\n".join(rows))
+    return path
+
+
+@contextlib.contextmanager
+def _generated(levels):
+    """Write a generated level for each (size, wall density, MoveIncrease
+    density) to a temporary directory.
+
+    Yields:
+        (list<tuple<dict, str>>): The columns describing each level in a
+            result, and its path.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        written = []
+        for size, wall_density, boost_density in levels:
+            rows = generate_level(size, wall_density=wall_density,
+                                  boost_density=boost_density)
+            path = write_level(rows, directory, f"level{len(written)}.txt")
+            written.append(({"size": size, "walls": wall_density,
+                             "boosts": boost_density}, path))
+        yield written
+
+
+def _best_of(function, repeats):
+    """Returns the fastest of repeats calls of function, in seconds."""
+    best = None
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_parse(levels=LEVELS, repeats=3):
+    """Time reading a level file with load_game, and into a Grid from the
+    text and binary formats."""
+    results = []
+    with _generated(levels) as written:
+        for level, path in written:
+            binary = path[:-len(".txt")] + ".lvl"
+            save_binary(load_text(path), binary)
+            results.append({
+                **level,
+                "load_game_ms": _best_of(lambda: load_game(path),
+                                         repeats) * 1000,
+                "text_ms": _best_of(lambda: load_text(path), repeats) * 1000,
+                "binary_ms": _best_of(lambda: load_binary(binary),
+                                      repeats) * 1000,
+            })
+    return results
+
+
+def bench_setup(levels=LEVELS, repeats=3):
+    """Time loading a GameLogic, init_game_information on its own, and
+    resetting a game to how it was loaded, as restarting does."""
+    results = []
+    with _generated(levels) as written:
+        for level, path in written:
+            game = GameLogic(path, 1)
+            results.append({
+                **level,
+                "gamelogic_ms": _best_of(lambda: GameLogic(path, 1),
+                                         repeats) * 1000,
+                "init_information_ms": _best_of(game.init_game_information,
+                                                repeats) * 1000,
+                "reset_ms": _best_of(game.reset, repeats) * 1000,
+            })
+    return results
+
+
+def _measure_load(path):
+    """Return the seconds, peak bytes and retained bytes of a GameLogic
+    load of path."""
+    gc.collect()
+    start = time.perf_counter()
+    game = GameLogic(path, 1)
+    elapsed = time.perf_counter() - start
+    del game
+    # Tracing slows allocation down, so memory is a separate load
+    gc.collect()
+    tracemalloc.start()
+    game = GameLogic(path, 1)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, retained
+
+
+def bench_load(sizes=(100, 1000, 3000)):
+    """Measure the time and memory GameLogic takes to load square levels
+    from text and binary level files."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            text = write_level(generate_level(size), directory,
+                               f"load{size}.txt")
+            binary = os.path.join(directory, f"load{size}.lvl")
+            save_binary(load_text(text), binary, size * size)
+            for level_format, path in (("text", text), ("binary", binary)):
+                elapsed, peak, retained = _measure_load(path)
+                results.append({
+                    "size": size,
+                    "format": level_format,
+                    "cells": size * size,
+                    "load_ms": elapsed * 1000,
+                    "peak_mb": peak / 2 ** 20,
+                    "retained_mb": retained / 2 ** 20,
+                })
+    return results
+
+
+def bench_step(levels=LEVELS, steps=100000):
+    """Count GameLogic.step calls per second on random directions, starting
+    the level again whenever a game ends."""
+    rng = random.Random(0)
+    actions = [rng.choice(tuple(DIRECTIONS)) for _ in range(steps)]
+    results = []
+    with _generated(levels) as written:
+        for level, path in written:
+            budget = level["size"] * 4
+            game = GameLogic(path, budget)
+            games = 1
+            start = time.perf_counter()
+            for action in actions:
+                game.step(action)
+                if game.won() or game.check_game_over():
+                    game = GameLogic(path, budget)
+                    games += 1
+            elapsed = time.perf_counter() - start
+            results.append({**level, "games": games,
+                            "steps_per_s": steps / elapsed})
+    return results
+
+
+def bench_solve(levels=((50, 0.2, 0.0), (100, 0.2, 0.005),
+                        (200, 0.25, 0.001))):
+    """Time the solver finding a route with a generous budget."""
+    import solver
+
+    results = []
+    with _generated(levels) as written:
+        for level, path in written:
+            game = GameLogic(path, level["size"] ** 2)
+            start = time.perf_counter()
+            route = solver.solve(game)
+            results.append({
+                **level,
+                "solve_ms": (time.perf_counter() - start) * 1000,
+                "route": len(route) if route is not None else None,
+            })
+    return results
+
+
+def bench_display(levels=((50, 0.2, 0.0), (200, 0.2, 0.0),
+                          (500, 0.2, 0.0)), repeats=3, steps=200):
+    """Time Display.display_game printing a whole level as text, and a
+    TerminalRenderer sending the changes to a 40x120 window after each
+    step."""
+    from textview import TerminalRenderer
+
+    rng = random.Random(0)
+    actions = [rng.choice(tuple(DIRECTIONS)) for _ in range(steps)]
+    results = []
+    with _generated(levels) as written:
+        for level, path in written:
+            game = GameLogic(path, steps + 1)
+            display = Display(game.get_game_information(), game.get_height(),
+                              game.get_width())
+            position = game.get_player().get_position()
+
+            def show():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    display.display_game(position)
+            whole = _best_of(show, repeats)
+
+            renderer = TerminalRenderer(game, 40, 120, io.StringIO(),
+                                        ansi=True)
+            renderer.render()
+            sent = 0
+            start = time.perf_counter()
+            for action in actions:
+                game.step(action)
+                sent += renderer.render()
+            elapsed = time.perf_counter() - start
+            results.append({**level,
+                            "display_ms": whole * 1000,
+                            "terminal_step_ms": elapsed / steps * 1000,
+                            "terminal_step_chars": sent / steps})
+    return results
+
+
+class _OffscreenCanvas:
+    """Stands in for tk.Canvas without a display, keeping its items as
+    dicts of their options."""
+
+    def __init__(self, master=None, **options):
+        self._items = {}
+        self._next_item = 1
+        # Tk commands run on images, such as photo copies, do nothing
+        self.tk = types.SimpleNamespace(call=lambda *args: None)
+
+    def grid(self, **options):
+        pass
+
+    def _create(self, coordinates, options):
+        item = self._next_item
+        self._next_item += 1
+        self._items[item] = dict(options, coordinates=coordinates)
+        return item
+
+    def create_rectangle(self, *coordinates, **options):
+        return self._create(coordinates, options)
+
+    def create_text(self, *coordinates, **options):
+        return self._create(coordinates, options)
+
+    def create_image(self, *coordinates, **options):
+        return self._create(coordinates, options)
+
+    def itemconfig(self, item, **options):
+        self._items[item].update(options)
+
+    def itemcget(self, item, option):
+        return self._items[item].get(option, "")
+
+    def coords(self, item):
+        coordinates = self._items[item]["coordinates"]
+        if len(coordinates) == 1:
+            coordinates = coordinates[0]
+        return [float(value) for value in coordinates]
+
+    def find_all(self):
+        return tuple(self._items)
+
+    def delete(self, *items):
+        if "all" in items:
+            self._items.clear()
+        for item in items:
+            self._items.pop(item, None)
+
+
+class _OffscreenPhoto:
+    """Stands in for ImageTk.PhotoImage, and tk.PhotoImage reading a file,
+    without a display."""
+
+    def __init__(self, image=None, **options):
+        self._image = image.copy() if image is not None else None
+
+    def paste(self, image):
+        self._image = image.copy()
+
+
+class _OffscreenRoot:
+    """Stands in for the Tk window without a display."""
+
+    def update(self):
+        pass
+
+
+@contextlib.contextmanager
+def _window():
+    """Yields (window, "tk") to draw maps in if there is a display, else
+    (stand-in, "offscreen") with a3 drawing on the stand-ins meanwhile."""
+    import tkinter as tk
+    import a3
+
+    a3.SPRITES.clear()
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        root = None
+    if root is not None:
+        root.withdraw()
+        try:
+            yield root, "tk"
+        finally:
+            a3.SPRITES.clear()
+            root.destroy()
+        return
+
+    saved = a3.tk, a3.ImageTk
+    a3.tk = types.SimpleNamespace(Canvas=_OffscreenCanvas,
+                                  PhotoImage=_OffscreenPhoto)
+    a3.ImageTk = types.SimpleNamespace(PhotoImage=_OffscreenPhoto)
+    try:
+        yield _OffscreenRoot(), "offscreen"
+    finally:
+        a3.SPRITES.clear()
+        a3.tk, a3.ImageTk = saved
+
+
+@contextlib.contextmanager
+def _uncached_sprites():
+    """Has a3 decode every tile each time it is drawn, as maps did before
+    SpriteCache, until the with block ends."""
+    import a3
+
+    class UncachedSprites(a3.SpriteCache):
+        """A sprite cache that forgets everything before each request."""
+
+        def get(self, picture, size):
+            """ """
+            self.clear()
+            return super().get(picture, size)
+
+        def get_image(self, picture, size):
+            """ """
+            self.clear()
+            return super().get_image(picture, size)
+
+    saved = a3.SPRITES
+    a3.SPRITES = UncachedSprites()
+    try:
+        yield
+    finally:
+        a3.SPRITES = saved
+
+
+def bench_redraw(levels=((12, 0.2, 0.0), (24, 0.2, 0.02), (48, 0.2, 0.02),
+                         (96, 0.2, 0.01), (300, 0.2, 0.01)), repeats=5,
+                 steps=200):
+    """Time building each kind of map, and AdvancedDungeonMap with each
+    backend, with no sprites decoded; redrawing every cell of it with every
+    tile decoded again (before the sprite cache) and from the cache (after);
+    and the incremental redraw after a step."""
+    import a3
+
+    rng = random.Random(0)
+    actions = [rng.choice(tuple(DIRECTIONS)) for _ in range(steps)]
+    results = []
+    with _window() as (root, display), _generated(levels) as written:
+        for level, path in written:
+            for name, make_map in (
+                    ("DungeonMap", a3.DungeonMap),
+                    ("AdvancedDungeonMap", lambda root, game:
+                     a3.AdvancedDungeonMap(root, game, a3.TileItems)),
+                    ("AdvancedDungeonMap", lambda root, game:
+                     a3.AdvancedDungeonMap(root, game, a3.CompositeFrame))):
+                game = GameLogic(path, steps + 1)
+                a3.SPRITES.clear()
+                start = time.perf_counter()
+                dungeon_map = make_map(root, game)
+                root.update()
+                build = time.perf_counter() - start
+
+                def draw():
+                    dungeon_map.draw_grid()
+                    root.update()
+                with _uncached_sprites():
+                    uncached = _best_of(draw, repeats)
+                full = _best_of(draw, repeats)
+
+                start = time.perf_counter()
+                for action in actions:
+                    events = game.step(action)
+                    dungeon_map.redraw([event.position for event in events
+                                        if event.kind == PICKED_UP])
+                    root.update()
+                incremental = (time.perf_counter() - start) / steps
+                results.append({
+                    **level,
+                    "map": name,
+                    "backend": dungeon_map.get_backend().name
+                    if name == "AdvancedDungeonMap" else "",
+                    "display": display,
+                    "items": len(
+                        dungeon_map._dungeon_map_frame.find_all()),
+                    "build_ms": build * 1000,
+                    "uncached_full_ms": uncached * 1000,
+                    "full_ms": full * 1000,
+                    "step_ms": incremental * 1000,
+                })
+    return results
+
+
+def bench_batch(players=4096, steps=100, size=100):
+    """Compare stepping many players one GameLogic at a time with one
+    BatchEngine, on the same random actions."""
+    import batch
+
+    rng = random.Random(0)
+    actions = [[rng.choice(batch.ACTIONS) for _ in range(players)]
+               for _ in range(steps)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_level(generate_level(size), directory, "batch.txt")
+        games = [GameLogic(path, steps * 2) for _ in range(players)]
+        start = time.perf_counter()
+        for step_actions in actions:
+            for game, action in zip(games, step_actions):
+                game.step(action)
+        single = time.perf_counter() - start
+
+        engine = batch.BatchEngine(GameLogic(path, steps * 2), players)
+        numbered = [engine._action_numbers(step_actions)
+                    for step_actions in actions]
+        start = time.perf_counter()
+        for step_actions in numbered:
+            engine.step(step_actions)
+        batched = time.perf_counter() - start
+    return [{
+        "players": players,
+        "steps": steps,
+        "backend": "numpy" if batch.numpy is not None else "python",
+        "gamelogic_per_s": players * steps / single,
+        "batch_per_s": players * steps / batched,
+    }]
+
+
+def bench_fov(levels=((100, 0.2, 0.0), (1000, 0.2, 0.0)), radii=(4, 8, 16),
+              steps=2000):
+    """Time FieldOfView.update per step of a random walk at several sight
+    radii, with the cells it says changed, and a fogged render of an
+    80 x 24 window around the player."""
+    from fov import FieldOfView
+
+    rng = random.Random(0)
+    actions = [rng.choice(tuple(DIRECTIONS)) for _ in range(steps)]
+    results = []
+    with _generated(levels) as written:
+        for level, path in written:
+            for radius in radii:
+                game = GameLogic(path, steps + 1)
+                field_of_view = FieldOfView(game.get_grid(), radius)
+                display = Display(game.get_game_information(),
+                                  game.get_height(), game.get_width(),
+                                  field_of_view)
+                player = game.get_player()
+                updating = rendering = 0.0
+                changed = 0
+                for action in actions:
+                    game.step(action)
+                    start = time.perf_counter()
+                    changed += len(field_of_view.update(
+                        player.get_position()))
+                    updating += time.perf_counter() - start
+                    row, column = player.get_position()
+                    top = max(0, min(row - 12, game.get_height() - 24))
+                    left = max(0, min(column - 40, game.get_width() - 80))
+                    start = time.perf_counter()
+                    display.render_rows(player.get_position(), top, left,
+                                        min(24, game.get_height()),
+                                        min(80, game.get_width()))
+                    rendering += time.perf_counter() - start
+                results.append({
+                    **level,
+                    "radius": radius,
+                    "update_us": updating / steps * 1e6,
+                    "changed_per_step": changed / steps,
+                    "render_us": rendering / steps * 1e6,
+                })
+    return results
+
+
+# Run in a fresh interpreter by bench_startup: imports a3, then draws the
+# first frame of game2.txt, with the asset cache in argv[1]
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import a3
+imported = time.perf_counter()
+import assets, benchmarks
+from engine import GameLogic
+assets.CACHE_DIRECTORY = sys.argv[1]
+with benchmarks._window() as (root, display):
+    begun = time.perf_counter()
+    if display == "tk":
+        a3.root = root
+        a3.GameApp(root)
+    else:
+        # GameApp needs a real window; draw what it draws from images
+        a3.AdvancedDungeonMap(root, GameLogic("game2.txt"))
+        for picture in ("clock.gif", "lightning.gif"):
+            a3.SPRITES.get(picture, 50)
+    root.update()
+    drawn = time.perf_counter()
+print(json.dumps({
+    "display": display,
+    "import_ms": (imported - start) * 1000,
+    "first_frame_ms": (imported - start + drawn - begun) * 1000,
+    "pil_loaded": "PIL._imaging" in sys.modules,
+    "numpy_loaded": "numpy" in sys.modules,
+}))
+"""
+
+
+def bench_startup(repeats=5):
+    """Time a fresh process importing a3 and drawing its first frame, with
+    the asset cache empty (the first start after an image changes) and
+    full, and the whole process start to exit."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for cache in ("cold", "warm"):
+            runs = []
+            for repeat in range(repeats):
+                cache_directory = os.path.join(
+                    directory, f"{cache}{repeat}" if cache == "cold"
+                    else cache)
+                start = time.perf_counter()
+                output = subprocess.run(
+                    [sys.executable, "-c", _STARTUP_SCRIPT, cache_directory],
+                    capture_output=True, text=True, check=True).stdout
+                runs.append({
+                    **json.loads(output),
+                    "process_ms": (time.perf_counter() - start) * 1000,
+                })
+            # The warm cache is filled by its first run, which isn't timed
+            if cache == "warm":
+                runs = runs[1:] or runs
+            best = min(runs, key=lambda run: run["first_frame_ms"])
+            results.append({"cache": cache, **best})
+    return results
+
+
+# name: (benchmark, its arguments under --quick)
+BENCHMARKS = {
+    "parse": (bench_parse, {"levels": QUICK_LEVELS}),
+    "setup": (bench_setup, {"levels": QUICK_LEVELS}),
+    "load": (bench_load, {"sizes": (100, 500)}),
+    "step": (bench_step, {"levels": QUICK_LEVELS, "steps": 20000}),
+    "solve": (bench_solve, {"levels": ((50, 0.2, 0.0), (100, 0.2, 0.005))}),
+    "display": (bench_display, {"levels": ((50, 0.2, 0.0),
+                                           (200, 0.2, 0.0))}),
+    "redraw": (bench_redraw, {"levels": ((12, 0.2, 0.0), (48, 0.2, 0.02)),
+                              "steps": 50}),
+    "batch": (bench_batch, {"players": 1024, "steps": 50}),
+    "fov": (bench_fov, {"levels": ((100, 0.2, 0.0),), "steps": 500}),
+    "startup": (bench_startup, {"repeats": 3}),
+}
+
+
+def _cell(value):
+    """Returns value as it is shown in a table."""
+    if isinstance(value, float):
+        return f"{value:,.3f}" if value < 100 else f"{value:,.0f}"
+    return str(value)
+
+
+def print_table(name, results):
+    """Print a benchmark's results, one row each under a header."""
+    print(name)
+    if not results:
+        return
+    columns = list(results[0])
+    rows = [[_cell(result[column]) for column in columns]
+            for result in results]
+    widths = [max(len(column), *(len(row[index]) for row in rows))
+              for index, column in enumerate(columns)]
+    for row in [columns] + rows:
+        print("  " + "  ".join(cell.rjust(width)
+                               for cell, width in zip(row, widths)))
+    print()
+
+
+def environment():
+    """Returns what results depend on besides the code, for comparing
+    runs."""
+    import batch
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": batch.numpy.__version__ if batch.numpy is not None else None,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def read_runs(filename):
+    """Returns the runs saved in a --json file, or an empty list if it
+    doesn't exist yet.
+
+    Raises:
+        ValueError: If filename doesn't hold benchmark runs.
+    """
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as file:
+        saved = json.load(file)
+    if not isinstance(saved, dict) or not isinstance(saved.get("runs"),
+                                                     list):
+        raise ValueError(f"{filename} doesn't hold benchmark runs")
+    return saved["runs"]
+
+
+def main(argv):
+    """Run the benchmarks named on the command line, or all of them."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="benchmark",
+                        help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--quick", action="store_true",
+                        help="smaller levels and fewer steps")
+    parser.add_argument("--json", metavar="FILE",
+                        help="add the results to the runs in FILE, "
+                        "a JSON file")
+    args = parser.parse_args(argv[1:])
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"no benchmark called {name}")
+    runs = []
+    if args.json:
+        try:
+            runs = read_runs(args.json)
+        except ValueError as error:
+            parser.error(str(error))
+
+    report = {"environment": environment(), "quick": args.quick,
+              "results": {}}
+    for name in args.names or BENCHMARKS:
+        benchmark, quick = BENCHMARKS[name]
+        results = benchmark(**quick) if args.quick else benchmark()
+        report["results"][name] = results
+        print_table(name, results)
+    if args.json:
+        runs.append(report)
+        with open(args.json, "w") as file:
+            json.dump({"runs": runs}, file, indent=2)
+            file.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,423 @@
+"""Distance fields for a level, measured once and cached on disk.
+
+A field holds the number of steps from one source cell to every cell of
+the level, by breadth first search around the walls. Fields are kept for
+the player's start, the key, the door and each MoveIncrease. Since walls
+never change during a game, "how far is the door from here" is then one
+lookup for the rest of the level's life. The fewest moves the level can
+be won with is worked out at the same time, so checking a budget is one
+comparison. That search gets a second in all, as levels dense with
+MoveIncreases can take the solver far longer near their fewest moves;
+when it gives up, the fewest moves are only known to lie within a range.
+
+Fields are saved under __distances__ next to the level, in a file named
+after the SHA-1 of the level file, so editing a level can't bring back
+stale distances:
+
+    python distances.py game1.txt game2.txt
+"""
+import os
+import struct
+import sys
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from engine import PLAYER, KEY, DOOR, WALL, MOVE_INCREASE, GameLogic
+from levels import level_digest
+from solver import UNKNOWN, UNREACHABLE, Solver
+
+CACHE_DIRECTORY = "__distances__"
+MAGIC = b"DCDF"
+VERSION = 2
+HEADER = struct.Struct("<4sHIIiiI")
+SOURCE = struct.Struct("<cii")
+
+# Distance of a wall or border cell while searching
+_BLOCKED = -2
+
+# SHA-1 of a level file: its DistanceFields, for this process
+_LOADED = {}
+# Longest the solver searches, over every budget tried together, while
+# finding the fewest moves a level can be won with
+BUDGET_SECONDS = 1.0
+
+
+class DistanceFields:
+    """Steps from the start, key, door and each MoveIncrease of a level to
+    every cell.
+
+    Fields are laid out row by row with a border cell around the level,
+    so the search never needs bounds checks.
+    """
+
+    def __init__(self, width, height, sources, fields, budgets):
+        """Construct the fields of a level.
+
+        Parameters:
+            width (int): The level's width.
+            height (int): The level's height.
+            sources (list<tuple<str, tuple<int, int>>>): The entity id and
+                position of each field's source.
+            fields (list<array>): One distance per bordered cell for each
+                source: UNREACHABLE for open cells that can't be
+                reached, _BLOCKED for walls and the border.
+            budgets (tuple<int, int>): The fewest moves the level could be
+                won with and the fewest known to win it, the same when the
+                search finished, or None if it can't be won.
+        """
+        self._width = width
+        self._height = height
+        self._stride = width + 2
+        self._sources = sources
+        self._fields = {}
+        for (entity, position), field in zip(sources, fields):
+            self._fields.setdefault(entity, {})[position] = field
+        self._budgets = budgets
+
+    @classmethod
+    def build(cls, game):
+        """Measure the fields of a level.
+
+        Parameters:
+            game (GameLogic): The level as loaded, before any moves.
+        """
+        grid = game.get_grid()
+        width, height = grid.get_width(), grid.get_height()
+        stride = width + 2
+        template = _template(grid)
+
+        sources = [(PLAYER, game.get_player().get_position())]
+        for entity in (KEY, DOOR, MOVE_INCREASE):
+            sources.extend((entity, position)
+                           for position in game.get_positions(entity))
+        fields = [_search(template, stride, position)
+                  for _, position in sources]
+        fields = cls(width, height, sources, fields, None)
+        fields._budgets = _budgets(game, fields)
+        return fields
+
+    def _index(self, position):
+        """Returns the field index of position, or None outside the level."""
+        row, column = position
+        if 0 <= row < self._height and 0 <= column < self._width:
+            return (row + 1) * self._stride + column + 1
+        return None
+
+    def _lookup(self, entity, source, position):
+        """Returns the distance from a source to position."""
+        sources = self._fields.get(entity, {})
+        field = sources.get(source) if source is not None else next(
+            iter(sources.values()), None)
+        index = self._index(position)
+        if field is None or index is None:
+            return UNREACHABLE
+        return max(field[index], UNREACHABLE)
+
+    def get_width(self):
+        """ """
+        return self._width
+
+    def get_height(self):
+        """ """
+        return self._height
+
+    def get_sources(self):
+        """Returns the (entity id, position) of every field's source."""
+        return list(self._sources)
+
+    def distance_to_key(self, position):
+        """Returns the fewest steps from position to the key, or
+        UNREACHABLE."""
+        return self._lookup(KEY, None, position)
+
+    def distance_to_door(self, position):
+        """Returns the fewest steps from position to the door, or
+        UNREACHABLE."""
+        return self._lookup(DOOR, None, position)
+
+    def distance_from_start(self, position):
+        """Returns the fewest steps from the player's start to position, or
+        UNREACHABLE."""
+        return self._lookup(PLAYER, None, position)
+
+    def distance_to_boost(self, boost, position):
+        """Returns the fewest steps from position to the MoveIncrease at
+        boost, or UNREACHABLE."""
+        return self._lookup(MOVE_INCREASE, boost, position)
+
+    def reachable(self, position):
+        """Returns True if the player can walk from the start to position."""
+        return self.distance_from_start(position) != UNREACHABLE
+
+    def unreachable_positions(self):
+        """Returns the open cells the player can never walk to, in reading
+        order."""
+        start = self._fields[PLAYER]
+        field = next(iter(start.values()))
+        stride = self._stride
+        return [(index // stride - 1, index % stride - 1)
+                for index, distance in enumerate(field)
+                if distance == UNREACHABLE]
+
+    def has_unreachable_regions(self):
+        """Returns True if some open cell can't be walked to from the
+        start."""
+        field = next(iter(self._fields[PLAYER].values()))
+        return UNREACHABLE in field
+
+    def min_budget(self):
+        """Returns the fewest moves the level can be won with, None if it
+        can't be won at all, or UNKNOWN if the search gave up first (see
+        budget_range)."""
+        if self._budgets is None:
+            return None
+        low, high = self._budgets
+        return low if low == high else UNKNOWN
+
+    def budget_range(self):
+        """Returns the fewest moves the level could be won with and the
+        fewest known to win it, or None if it can't be won at all."""
+        return self._budgets
+
+    def winnable(self, budget):
+        """Returns True if the level can be won from the start with budget
+        moves, False if it can't, or UNKNOWN if budget is within
+        budget_range and the search gave up before telling."""
+        if self._budgets is None:
+            return False
+        low, high = self._budgets
+        if budget >= high:
+            return True
+        return False if budget < low else UNKNOWN
+
+    def save(self, filename):
+        """Write the fields to filename."""
+        with open(filename, "wb") as file:
+            low, high = self._budgets or (UNREACHABLE, UNREACHABLE)
+            file.write(HEADER.pack(MAGIC, VERSION, self._width,
+                                   self._height, low, high,
+                                   len(self._sources)))
+            for entity, (row, column) in self._sources:
+                file.write(SOURCE.pack(entity.encode(), row, column))
+            for entity, position in self._sources:
+                self._fields[entity][position].tofile(file)
+
+    @classmethod
+    def read(cls, filename):
+        """Read fields written by save.
+
+        Raises:
+            ValueError: If filename doesn't hold distance fields.
+        """
+        with open(filename, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"{filename} is too short")
+            magic, version, width, height, low, high, count = \
+                HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{filename} is not distance fields "
+                                 f"version {VERSION}")
+            sources = []
+            for _ in range(count):
+                entity, row, column = SOURCE.unpack(file.read(SOURCE.size))
+                sources.append((entity.decode(), (row, column)))
+            cells = (width + 2) * (height + 2)
+            fields = []
+            for _ in sources:
+                field = array("i")
+                field.fromfile(file, cells)
+                fields.append(field)
+        return cls(width, height, sources, fields,
+                   None if low == UNREACHABLE else (low, high))
+
+
+def _template(grid):
+    """Returns the bordered field every search starts from: UNREACHABLE on
+    open cells and _BLOCKED on walls and the border. It is a NumPy array
+    when NumPy is installed, else an array."""
+    width, height = grid.get_width(), grid.get_height()
+    if numpy is not None:
+        template = numpy.full((height + 2, width + 2), _BLOCKED,
+                              dtype=numpy.int32)
+        template[1:-1, 1:-1] = numpy.where(grid.as_array() == ord(WALL),
+                                           _BLOCKED, UNREACHABLE)
+        return template.ravel()
+    stride = width + 2
+    template = array("i", [_BLOCKED]) * stride
+    for _ in range(height):
+        template.extend(array("i", [_BLOCKED]))
+        template.extend(array("i", [UNREACHABLE]) * width)
+        template.extend(array("i", [_BLOCKED]))
+    template.extend(array("i", [_BLOCKED]) * stride)
+    for row, column in grid.positions(WALL):
+        template[(row + 1) * stride + column + 1] = _BLOCKED
+    return template
+
+
+def _search(template, stride, source):
+    """Breadth first search from source over a copy of template, in which
+    open cells are UNREACHABLE and the rest _BLOCKED.
+
+    Returns:
+        (array): The distance to every cell; open cells that can't be
+            reached stay UNREACHABLE and walls stay _BLOCKED.
+    """
+    row, column = source
+    start = (row + 1) * stride + column + 1
+    if numpy is not None:
+        return _search_arrays(template, stride, start)
+    field = array("i", template)
+    field[start] = 0
+    frontier = [start]
+    distance = 0
+    while frontier:
+        distance += 1
+        grown = []
+        for index in frontier:
+            for neighbour in (index - stride, index + stride, index - 1,
+                              index + 1):
+                if field[neighbour] == UNREACHABLE:
+                    field[neighbour] = distance
+                    grown.append(neighbour)
+        frontier = grown
+    return field
+
+
+def _search_arrays(template, stride, start):
+    """_search, a whole wave at a time with NumPy."""
+    field = template.copy()
+    field[start] = 0
+    offsets = numpy.array([-stride, stride, -1, 1])
+    # Which entry of a wave last wrote each cell, to drop repeats
+    # without sorting
+    writer = numpy.empty(field.size, dtype=numpy.int64)
+    frontier = numpy.array([start])
+    distance = 0
+    while frontier.size:
+        distance += 1
+        neighbours = (frontier[:, None] + offsets).ravel()
+        neighbours = neighbours[field[neighbours] == UNREACHABLE]
+        entries = numpy.arange(neighbours.size)
+        writer[neighbours] = entries
+        frontier = neighbours[writer[neighbours] == entries]
+        field[frontier] = distance
+    return array("i", field.tobytes())
+
+
+def distance_field(grid, source):
+    """Returns the steps from source to every cell of grid.
+
+    Returns:
+        (array): One distance per cell, row by row with a border around
+            the level (width + 2 cells a row), as DistanceFields keeps
+            them: UNREACHABLE for open cells that can't be reached, less
+            than that for walls and the border.
+    """
+    return _search(_template(grid), grid.get_width() + 2, source)
+
+
+def _budgets(game, fields):
+    """Returns the fewest moves game could be won with from the start and
+    the fewest known to win it, or None if no budget is enough. The two
+    differ only when the searches ran out of BUDGET_SECONDS."""
+    start = game.get_player().get_position()
+    keys = game.get_positions(KEY)
+    if not keys or not game.get_positions(DOOR):
+        return None
+    to_key = fields.distance_to_key(start)
+    key_to_door = fields.distance_to_door(keys[0])
+    if UNREACHABLE in (to_key, key_to_door):
+        return None
+    deadline = time.perf_counter() + BUDGET_SECONDS
+    # Every waypoint the solver uses is the source of a field already
+    solver = Solver(game)
+    sources = fields.get_sources()
+    indices = [fields._index(position) for _, position in sources]
+    for entity, source in sources:
+        field = fields._fields[entity][source]
+        steps = {}
+        for (_, position), index in zip(sources, indices):
+            if field[index] >= 0:
+                steps[position] = field[index]
+        solver.add_distances(source, steps)
+    # The straight route always wins; MoveIncreases can only bring the
+    # smallest winning budget down from there
+    low, high = 1, to_key + key_to_door
+    while low < high:
+        middle = (low + high) // 2
+        winnable = solver.winnable(
+            middle, max_seconds=deadline - time.perf_counter())
+        if winnable is UNKNOWN:
+            break
+        if winnable:
+            high = middle
+        else:
+            low = middle + 1
+    return low, high
+
+
+def for_level(filename, game=None, cache_directory=None):
+    """Returns a level's distance fields, from this process's cache, then
+    the disk cache, building and saving them if neither has them.
+
+    Parameters:
+        filename (str): The level file.
+        game (GameLogic): The level freshly loaded, if it already is.
+        cache_directory (str): Where to keep fields, by default
+            __distances__ beside the level.
+    """
+    digest = level_digest(filename)
+    fields = _LOADED.get(digest)
+    if fields is not None:
+        return fields
+    if cache_directory is None:
+        cache_directory = os.path.join(os.path.dirname(filename),
+                                       CACHE_DIRECTORY)
+    path = os.path.join(cache_directory, digest + ".dist")
+    try:
+        fields = DistanceFields.read(path)
+    except (OSError, ValueError, EOFError, struct.error):
+        fields = DistanceFields.build(game if game is not None
+                                      else GameLogic(filename, 1))
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+            fields.save(path)
+        except OSError:
+            # A read only level directory still gets the fields, uncached
+            pass
+    _LOADED[digest] = fields
+    return fields
+
+
+def main(argv):
+    """Print what the distance fields say about each level named."""
+    if len(argv) < 2:
+        print(__doc__.strip())
+        return 2
+    for filename in argv[1:]:
+        fields = for_level(filename)
+        _, start = fields.get_sources()[0]
+        budgets = fields.budget_range()
+        if budgets is None:
+            winnable = "can't be won"
+        elif budgets[0] == budgets[1]:
+            winnable = f"winnable with {budgets[0]} moves"
+        else:
+            winnable = (f"winnable with {budgets[1]} moves, maybe as few "
+                        f"as {budgets[0]}")
+        print(f"{filename}: {fields.get_width()}x{fields.get_height()}, "
+              f"key {fields.distance_to_key(start)} steps from the start, "
+              f"door {fields.distance_to_door(start)}, "
+              f"unreachable cells {len(fields.unreachable_positions())}, "
+              f"{winnable}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
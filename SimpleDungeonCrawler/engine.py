@@ -0,0 +1,716 @@
+"""Rules of the dungeon crawler, kept free of any GUI imports so games can
+be loaded and played headless."""
+import bisect
+from collections import namedtuple
+from collections.abc import MutableMapping
+
+from levels import load_level
+
+GAME_LEVELS = {
+    # dungeon layout: max moves allowed
+    "game1.txt": 7,
+    "game2.txt": 12,
+    "game3.txt": 19,
+}
+
+PLAYER = "O"
+KEY = "K"
+DOOR = "D"
+WALL = "#"
+MOVE_INCREASE = "M"
+SPACE = " "
+# Drawn in text for cells hidden by a field of view (see fov.py)
+FOG = "."
+
+DIRECTIONS = {
+    "W": (-1, 0),
+    "S": (1, 0),
+    "D": (0, 1),
+    "A": (0, -1)
+}
+
+INVESTIGATE = "I"
+QUIT = "Q"
+HELP = "H"
+
+VALID_ACTIONS = [INVESTIGATE, QUIT, HELP, *DIRECTIONS.keys()]
+
+HELP_MESSAGE = f"Here is a list of valid actions: {VALID_ACTIONS}"
+
+INVALID = "That's invalid."
+
+WIN_TEXT = "You have won the game with your strength and honour!"
+
+LOSE_TEST = "You have lost all your strength and honour."
+LOSE_TEXT = "You have lost all your strength and honour."
+
+NO_KEY_TEXT = "You don't have the key!"
+
+# Kinds of event reported by GameLogic.step
+MOVED = "moved"
+BLOCKED = "blocked"
+PICKED_UP = "picked_up"
+LOCKED = "locked"
+WON = "won"
+LOST = "lost"
+
+# Something that happened during a step.
+#   kind (str): One of the event kinds above.
+#   position (tuple<int, int>): Where it happened.
+#   entity (Entity): The entity involved, if any.
+Event = namedtuple("Event", ["kind", "position", "entity"])
+
+# Everything about a game that changes as it is played; the level itself is
+# shared by every state of it.
+#   position (tuple<int, int>): Where the player is.
+#   moves (int): Moves the player has left.
+#   inventory (tuple<Item>): What the player holds.
+#   consumed (tuple<tuple<tuple<int, int>, Entity>>): Where each entity
+#       picked up was, and the entity, in the order they were taken.
+#   win (bool): Whether the game has been won.
+GameState = namedtuple("GameState", ["position", "moves", "inventory",
+                                     "consumed", "win"])
+
+class Display:
+    """Display of the dungeon."""
+
+    def __init__(self, game_information, dungeon_size, width=None,
+                 field_of_view=None):
+        """Construct a view of the dungeon.
+
+        Parameters:
+            game_information (dict<tuple<int, int>: Entity): Dictionary 
+                containing the position and the corresponding Entity
+            dungeon_size (int): the height of the dungeon.
+            width (int): the width of the dungeon, if it isn't square.
+            field_of_view (fov.FieldOfView): What the player has seen;
+                cells it hides are drawn as FOG. By default every cell is
+                drawn.
+        """
+        self._game_information = game_information
+        self._dungeon_size = dungeon_size
+        self._width = dungeon_size if width is None else width
+        self._field_of_view = field_of_view
+        # Row buffer reused by every render
+        self._buffer = bytearray()
+        self._walls = None
+
+    def _wall_cells(self):
+        """Returns the level's cells with everything but walls blanked, or
+        None if the game information isn't backed by a Grid. Walls never
+        change, so this is worked out once."""
+        if self._walls is None and isinstance(self._game_information,
+                                              GameInformation):
+            self._walls = self._game_information.get_grid().tobytes(
+                ).translate(_WALLS_ONLY)
+        return self._walls
+
+    def render_rows(self, player_pos, top=0, left=0, height=None, width=None):
+        """Returns the rows of a window onto the dungeon.
+
+        Parameters:
+            player_pos (tuple<int, int>): The position of the Player
+            top (int): The first row in the window.
+            left (int): The first column in the window.
+            height (int): Rows in the window, by default the rest of them.
+            width (int): Columns in the window, by default the rest of them.
+
+        Returns:
+            (list<str>): One string per row of the window.
+        """
+        if height is None:
+            height = self._dungeon_size - top
+        if width is None:
+            width = self._width - left
+        size = height * width
+        if len(self._buffer) != size:
+            self._buffer = bytearray(size)
+        buffer = self._buffer
+
+        walls = self._wall_cells()
+        if walls is not None:
+            for row in range(height):
+                start = (top + row) * self._width + left
+                buffer[row * width:(row + 1) * width] = \
+                    walls[start:start + width]
+            entities = self._game_information.get_entities()
+        else:
+            buffer[:] = SPACE.encode() * size
+            entities = self._game_information
+        for (row, column), entity in entities.items():
+            if top <= row < top + height and left <= column < left + width:
+                buffer[(row - top) * width + column - left] = \
+                    ord(entity.get_id())
+
+        # The player is only drawn on a cell nothing else is drawn on
+        row, column = player_pos
+        if top <= row < top + height and left <= column < left + width:
+            index = (row - top) * width + column - left
+            if buffer[index] == ord(SPACE):
+                buffer[index] = ord(PLAYER)
+
+        if self._field_of_view is not None:
+            shown = self._field_of_view.get_shown()
+            mask = bytearray(size)
+            for row in range(height):
+                start = (top + row) * self._width + left
+                mask[row * width:(row + 1) * width] = \
+                    shown[start:start + width]
+            # Shown cells are 0xFF in the mask and hidden ones 0, so one
+            # AND blanks the hidden cells and one OR writes FOG over them,
+            # each on the whole window as a single integer
+            cells = int.from_bytes(buffer, "big") & int.from_bytes(mask,
+                                                                  "big")
+            cells |= int.from_bytes(mask.translate(_FOG_OVER_HIDDEN), "big")
+            buffer[:] = cells.to_bytes(size, "big")
+        return [buffer[start:start + width].decode()
+                for start in range(0, size, width)]
+
+    def display_game(self, player_pos):
+        """Displays the dungeon.
+        
+        Parameters:
+            player_pos (tuple<int, int>): The position of the Player
+        """
+        print("\n".join(self.render_rows(player_pos)))
+
+    def display_moves(self, moves):
+        """Displays the number of moves the Player has left.
+        
+        Parameters:
+            moves (int): THe number of moves the Player can preform. 
+        """
+        print(f"Moves left: {moves}\n")
+
+
+def load_game(filename):
+    """Create a 2D array of string representing the dungeon to display.
+    
+    Parameters:
+        filename (str): A string representing the name of the level.
+
+    Returns:
+        (list<list<str>>): A 2D array of strings representing the 
+            dungeon.
+    """
+    dungeon_layout = []
+
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            dungeon_layout.append(list(line))
+
+    return dungeon_layout
+
+
+class Entity:
+    """ """
+
+    _id = "Entity"
+
+    def __init__(self):
+        """
+        Something the player can interact with
+        """
+        self._collidable = True
+
+    def get_id(self):
+        """ """
+        return self._id
+
+    def set_collide(self, collidable):
+        """ """
+        self._collidable = collidable
+
+    def can_collide(self):
+        """ """
+        return self._collidable
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({self._id!r})"
+
+    def __repr__(self):
+        return str(self)
+
+
+class Wall(Entity):
+    """ """
+
+    _id = WALL
+    
+    def __init__(self):
+        """ """
+        super().__init__()
+        self.set_collide(False)
+
+
+# Walls have no state, so every wall cell shares this one
+WALL_ENTITY = Wall()
+
+
+# bytes.translate table turning a shown mask's hidden cells (0) into FOG
+# and its shown ones (0xFF) into 0
+_FOG_OVER_HIDDEN = bytes(ord(FOG) if byte == 0 else 0 for byte in range(256))
+
+# bytes.translate table keeping walls and blanking every other cell
+_WALLS_ONLY = bytes(byte if byte == ord(WALL) else ord(SPACE)
+                    for byte in range(256))
+
+
+class GameInformation(MutableMapping):
+    """The entities of a level by position.
+
+    Walls are read straight out of the level's Grid and all share
+    WALL_ENTITY; only entities with state of their own (keys, doors,
+    MoveIncreases) are stored as objects. Empty cells hold nothing.
+    """
+
+    def __init__(self, grid, entities):
+        """Construct the view.
+
+        Parameters:
+            grid (Grid): The level, which is never changed.
+            entities (dict<tuple<int, int>: Entity>): The stateful entities.
+        """
+        self._grid = grid
+        self._entities = entities
+
+    def get_entities(self):
+        """Returns the dict of stateful entities by position."""
+        return self._entities
+
+    def get_grid(self):
+        """Returns the level the walls are read from."""
+        return self._grid
+
+    def __getitem__(self, position):
+        entity = self._entities.get(position)
+        if entity is not None:
+            return entity
+        if self._grid.get(position) == WALL:
+            return WALL_ENTITY
+        raise KeyError(position)
+
+    def get(self, position, default=None):
+        """Returns the entity at position, or default for an empty cell."""
+        entity = self._entities.get(position)
+        if entity is not None:
+            return entity
+        if self._grid.get(position) == WALL:
+            return WALL_ENTITY
+        return default
+
+    def __setitem__(self, position, entity):
+        self._entities[position] = entity
+
+    def __delitem__(self, position):
+        if position in self._entities:
+            del self._entities[position]
+        elif self._grid.get(position) == WALL:
+            raise TypeError(f"the wall at {position} is part of the level")
+        else:
+            raise KeyError(position)
+
+    def __iter__(self):
+        for position in self._grid.positions(WALL):
+            if position not in self._entities:
+                yield position
+        yield from self._entities
+
+    def __len__(self):
+        walls = sum(1 for position in self._entities
+                    if self._grid.get(position) == WALL)
+        return self._grid.count(WALL) - walls + len(self._entities)
+
+
+class Item(Entity):
+    """ """
+    def on_hit(self, game):
+        """ """
+        raise NotImplementedError
+
+
+class Key(Item):
+    """ """
+
+    _id = KEY
+
+    def on_hit(self, game):
+        """ """
+        player = game.get_player()
+        player.add_item(self)
+        game.remove_entity(player.get_position())
+        game.emit(PICKED_UP, player.get_position(), self)
+
+
+class MoveIncrease(Item):
+    """ """
+
+    _id = MOVE_INCREASE
+
+    def __init__(self, moves=5):
+        """ """
+        super().__init__()
+        self._moves = moves
+
+    def get_moves(self):
+        """Returns the moves picking this up gives the player."""
+        return self._moves
+
+    def on_hit(self, game):
+        """ """
+        player = game.get_player()
+        player.change_move_count(self._moves)
+        game.remove_entity(player.get_position())
+        game.emit(PICKED_UP, player.get_position(), self)
+
+
+class Door(Entity):
+    """ """
+    _id = DOOR
+
+    def on_hit(self, game):
+        """ """
+        player = game.get_player()
+        for item in player.get_inventory():
+            if item.get_id() == KEY:
+                game.set_win(True)
+                return
+
+        game.emit(LOCKED, player.get_position(), self)
+
+
+class Player(Entity):
+    """ """
+
+    _id = PLAYER
+
+    def __init__(self, move_count):
+        """ """
+        super().__init__()
+        self._move_count = move_count
+        self._inventory = []
+        self._position = None
+
+    def set_position(self, position):
+        """ """
+        self._position = position
+
+    def get_position(self):
+        """ """
+        return self._position
+
+    def change_move_count(self, number):
+        """
+        Parameters:
+            number (int): number to be added to move count
+        """
+        self._move_count += number
+
+    def moves_remaining(self):
+        """ """
+        return self._move_count
+
+    def add_item(self, item):
+        """Adds item (Item) to inventory
+        """
+        self._inventory.append(item)
+
+    def get_inventory(self):
+        """ """
+        return self._inventory
+
+
+def _discard(positions, position):
+    """Remove position from a sorted list of positions, if it is there."""
+    index = bisect.bisect_left(positions, position)
+    if index < len(positions) and positions[index] == position:
+        del positions[index]
+
+
+class GameLogic():
+    """ """
+
+    # Entity ids whose positions are indexed; walls never move, so their
+    # positions are read from the grid when asked for
+    _INDEXED = (PLAYER, KEY, DOOR, MOVE_INCREASE)
+
+    def __init__(self, dungeon_name, move_count=None):
+        """Load a level, in either format levels.py reads.
+
+        Parameters:
+            dungeon_name (str): The level's file name.
+            move_count (int): The moves allowed. Defaults to the budget
+                in the level's file, then to its GAME_LEVELS entry.
+        """
+        self._grid, budget = load_level(dungeon_name)
+        if move_count is None:
+            move_count = (budget if budget is not None
+                          else GAME_LEVELS[dungeon_name])
+        # The longer side, which sets how large a cell is drawn
+        self._dungeon_size = max(self._grid.get_width(),
+                                 self._grid.get_height())
+        self._player = Player(move_count)
+        self._game_information = self.init_game_information()
+        self._win = False
+        self._events = []
+        # Entities taken out of the game, replaced (never changed) as more
+        # are, so a snapshot can share it
+        self._consumed = ()
+        self._initial_state = self.snapshot()
+
+    def get_positions(self, entity):
+        """Returns where every entity of a kind is, in reading order.
+
+        Parameters:
+            entity (str): The id of the entity (KEY, WALL, ...).
+
+        Returns:
+            (list<tuple<int, int>>): The positions, kept up to date as the
+                player moves and picks items up.
+        """
+        if entity in self._positions:
+            return list(self._positions[entity])
+        return self._grid.positions(entity)
+
+    def index_positions(self):
+        """Builds the entity id to positions index for the ids that can
+        change as the game is played.
+
+        Returns:
+            (dict<str, list<tuple<int, int>>>): The positions of each
+                entity id, as lists kept in reading order, so positions
+                are added and removed by bisection.
+        """
+        return {char: self._grid.positions(char) for char in self._INDEXED}
+
+    def init_game_information(self):
+        """ """
+        self._positions = self.index_positions()
+        player_pos = self.get_positions(PLAYER)[0]
+        key_position = self.get_positions(KEY)[0]
+        door_position = self.get_positions(DOOR)[0]
+        move_increase_positions = self.get_positions(MOVE_INCREASE)
+        self._player.set_position(player_pos)
+
+        entities = {
+            key_position: Key(),
+            door_position: Door(),
+        }
+
+        for move_increase in move_increase_positions:
+            entities[move_increase] = MoveIncrease()
+        return GameInformation(self._grid, entities)
+    def get_player(self):
+        """ """
+        return self._player
+
+    def get_entity(self, position):
+        """ """
+        return self._game_information.get(position)
+
+    def remove_entity(self, position):
+        """Takes the entity at position out of the game.
+
+        Parameters:
+            position (tuple<int, int>): Where the entity is.
+
+        Returns:
+            (Entity): The entity that was removed.
+        """
+        entity = self._game_information.pop(position)
+        _discard(self._positions[entity.get_id()], position)
+        self._consumed += ((position, entity),)
+        return entity
+
+    def snapshot(self):
+        """Returns the state the game is in now, for restore to go back to.
+
+        Only what play changes is captured, in time independent of the
+        level's size; the level and its entities are shared.
+
+        Returns:
+            (GameState): The current state.
+        """
+        player = self._player
+        return GameState(player.get_position(), player.moves_remaining(),
+                         tuple(player.get_inventory()), self._consumed,
+                         self._win)
+
+    def restore(self, state):
+        """Put the game back in a state snapshot returned, whether it came
+        before or after the current one.
+
+        Parameters:
+            state (GameState): A snapshot of this game.
+
+        Returns:
+            (set<tuple<int, int>>): The cells that look different now: where
+                the player was and is, and every entity put back or taken
+                out.
+        """
+        changed = {self._player.get_position(), state.position}
+        if state.consumed is not self._consumed:
+            wanted = set(state.consumed)
+            taken = set(self._consumed)
+            for position, entity in self._consumed:
+                if (position, entity) not in wanted:
+                    self._game_information[position] = entity
+                    bisect.insort(self._positions[entity.get_id()], position)
+                    changed.add(position)
+            for position, entity in state.consumed:
+                if (position, entity) not in taken:
+                    del self._game_information[position]
+                    _discard(self._positions[entity.get_id()], position)
+                    changed.add(position)
+            self._consumed = state.consumed
+
+        self.place_player(state.position)
+        player = self._player
+        player.change_move_count(state.moves - player.moves_remaining())
+        player.get_inventory()[:] = state.inventory
+        self._win = state.win
+        self._events = []
+        return changed
+
+    def reset(self):
+        """Put the game back as it was loaded.
+
+        Returns:
+            (set<tuple<int, int>>): The cells that look different now.
+        """
+        return self.restore(self._initial_state)
+
+    def get_entity_in_direction(self, direction):
+        """ """
+        new_position = self.new_position(direction)
+        return self.get_entity(new_position)
+
+    def get_game_information(self):
+        """ """
+        return self._game_information
+
+    def get_dungeon_size(self):
+        """ """
+        return self._dungeon_size
+
+    def get_width(self):
+        """Returns the number of columns in the level."""
+        return self._grid.get_width()
+
+    def get_height(self):
+        """Returns the number of rows in the level."""
+        return self._grid.get_height()
+
+    def get_grid(self):
+        """Returns the level's Grid, as it was loaded."""
+        return self._grid
+
+    def place_player(self, position):
+        """Puts the player at position, keeping the position index up to
+        date.
+
+        Parameters:
+            position (tuple<int, int>): Where the player goes.
+        """
+        players = self._positions[PLAYER]
+        _discard(players, self._player.get_position())
+        bisect.insort(players, position)
+        self._player.set_position(position)
+
+    def move_player(self, direction):
+        """ """
+        self.place_player(self.new_position(direction))
+
+    def collision_check(self, direction):
+        """
+        Check to see if a player can travel in a given direction
+        Parameters:
+            direction (str): a direction for the player to travel in.
+
+        Returns:
+            (bool): False if the player can travel in that direction without colliding otherwise True.
+        """
+        new_pos = self.new_position(direction)
+        entity = self.get_entity(new_pos)
+        if entity is not None and not entity.can_collide():
+            return True
+        
+        return not self._grid.in_bounds(new_pos)
+
+    def new_position(self, direction):
+        """ """
+        x, y = self.get_player().get_position()
+        dx, dy = DIRECTIONS[direction]
+        return x + dx, y + dy
+
+    def check_game_over(self):
+        """ """
+        return self.get_player().moves_remaining() <= 0
+
+    def set_win(self, win):
+        """ """
+        self._win = win
+
+    def won(self):
+        """ """
+        return self._win
+
+    def emit(self, kind, position=None, entity=None):
+        """Records an event for the step being played.
+
+        Parameters:
+            kind (str): What happened (MOVED, PICKED_UP, ...).
+            position (tuple<int, int>): Where it happened.
+            entity (Entity): The entity involved, if any.
+        """
+        self._events.append(Event(kind, position, entity))
+
+    def step(self, action):
+        """Plays one direction, charging a move even if it is blocked.
+
+        Nothing happens once the game is won or out of moves.
+
+        Parameters:
+            action (str): One of the DIRECTIONS keys.
+
+        Returns:
+            (list<Event>): What happened, in order.
+        """
+        self._events = []
+        if self._win or self.check_game_over():
+            return self._events
+
+        if self.collision_check(action):
+            self.emit(BLOCKED, self.new_position(action))
+        else:
+            self.move_player(action)
+            position = self._player.get_position()
+            self.emit(MOVED, position)
+            entity = self.get_entity(position)
+            if entity is not None:
+                entity.on_hit(self)
+
+        self._player.change_move_count(-1)
+        if self._win:
+            self.emit(WON, self._player.get_position())
+        elif self.check_game_over():
+            self.emit(LOST, self._player.get_position())
+        return self._events
+
+    def step_many(self, actions):
+        """Plays directions in order until the game is won or lost.
+
+        Parameters:
+            actions (iterable<str>): DIRECTIONS keys to play.
+
+        Returns:
+            (list<Event>): Every event of every step played.
+        """
+        events = []
+        for action in actions:
+            if self._win or self.check_game_over():
+                break
+            events.extend(self.step(action))
+        return events
+
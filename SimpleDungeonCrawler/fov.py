@@ -0,0 +1,253 @@
+"""What the player can see, and what they have seen.
+
+Walls block sight. FieldOfView finds the cells in view of a position by
+recursive shadowcasting: each of the eight octants around the player is
+scanned row by row outwards, and a run of walls narrows the slopes later
+rows are scanned between, so the cost grows with the area within the
+radius, not with the level. Which cells are walls is read once into a
+bitmap, since walls never move.
+
+Every cell ever in view is remembered as explored. As nothing but the
+player moves and items only vanish when picked up, an explored cell still
+looks as it did when last seen, so by default maps show every explored
+cell and hide only the rest; update() returns just the cells that become
+shown, so a map redraws only those after a move. That also means a
+move can only show something new in the octants that still hold
+unexplored cells within the radius, and none at all back on a cell
+already looked from, so update() only scans those octants, checked a row
+or column at a time against the explored bitmap (kept in both orders
+for that).
+"""
+import math
+
+from engine import WALL
+
+# Cells the player sees in every direction, counting the one they are on
+# as 0
+DEFAULT_RADIUS = 8
+
+# Multipliers turning an octant's (distance out, distance across) into a
+# (row, column) offset, one column per octant
+_OCTANTS = (
+    (1, 0, 0, -1, -1, 0, 0, 1),
+    (0, 1, -1, 0, 0, -1, 1, 0),
+    (0, 1, 1, 0, 0, -1, -1, 0),
+    (1, 0, 0, 1, -1, 0, 0, -1),
+)
+# bytes.translate table marking walls 1 and everything else 0
+_OPAQUE = bytes(byte == ord(WALL) for byte in range(256))
+# Value of a shown cell in the shown mask; hidden cells are 0
+SHOWN = 0xFF
+
+
+class FieldOfView:
+    """The cells in view of the player on one level, and those explored."""
+
+    def __init__(self, grid, radius=DEFAULT_RADIUS, remember=True):
+        """Construct a view that has seen nothing.
+
+        Parameters:
+            grid (Grid): The level, for its walls.
+            radius (int): How far the player sees, or None for as far as
+                walls allow.
+            remember (bool): Whether explored cells stay shown once out of
+                view, or only the cells in view are.
+        """
+        self._width = grid.get_width()
+        self._height = grid.get_height()
+        self._radius = (radius if radius is not None
+                        else max(self._width, self._height))
+        self._remember = remember
+        self._opaque = grid.tobytes().translate(_OPAQUE)
+        # SHOWN for each cell maps should draw, 0 for those they hide
+        self._shown = bytearray(self._width * self._height)
+        # 1 for each explored cell, row by row and column by column
+        self._explored = bytearray(self._width * self._height)
+        self._explored_columns = bytearray(self._width * self._height)
+        # 1 for each cell update has looked from
+        self._looked_from = bytearray(self._width * self._height)
+        # The cells in view, or None until visible() needs them after an
+        # update that skipped octants
+        self._visible = set()
+        self._position = None
+
+    def get_radius(self):
+        """ """
+        return self._radius
+
+    def get_shown(self):
+        """Returns a row-major mask of the level, SHOWN where a cell should
+        be drawn and 0 where it is hidden. It is updated in place."""
+        return self._shown
+
+    def is_visible(self, position):
+        """Returns True if position is in view now."""
+        return position in self._in_view()
+
+    def is_explored(self, position):
+        """Returns True if position has ever been in view."""
+        row, column = position
+        return bool(self._explored[row * self._width + column])
+
+    def is_shown(self, position):
+        """Returns True if maps should draw position."""
+        row, column = position
+        return bool(self._shown[row * self._width + column])
+
+    def visible(self):
+        """Returns the set of cells in view now."""
+        return set(self._in_view())
+
+    def _in_view(self):
+        """Returns the cells in view now, casting every octant if the last
+        update skipped some."""
+        if self._visible is None:
+            self._visible = self.compute(self._position)
+        return self._visible
+
+    def reset(self):
+        """Forget everything seen, as for a new game.
+
+        Returns:
+            (set<tuple<int, int>>): The cells no longer shown.
+        """
+        width = self._width
+        hidden = {divmod(index, width) for index, shown
+                  in enumerate(self._shown) if shown}
+        self._shown[:] = bytes(len(self._shown))
+        self._explored[:] = bytes(len(self._explored))
+        self._explored_columns[:] = bytes(len(self._explored_columns))
+        self._looked_from[:] = bytes(len(self._looked_from))
+        self._visible = set()
+        self._position = None
+        return hidden
+
+    def update(self, position):
+        """Look from where the player now is.
+
+        Parameters:
+            position (tuple<int, int>): The player's position.
+
+        Returns:
+            (set<tuple<int, int>>): The cells shown or hidden that weren't
+                before, all a map needs to redraw.
+        """
+        if position == self._position:
+            return set()
+        width, height = self._width, self._height
+        index = position[0] * width + position[1]
+        if self._remember and self._looked_from[index]:
+            octants = ()
+        elif self._remember:
+            octants = [octant for octant in range(8)
+                       if self._unexplored(position, octant)]
+        else:
+            # Cells going out of view are hidden, so every octant counts
+            octants = range(8)
+        self._looked_from[index] = 1
+        visible = self.compute(position, octants)
+        shown = self._shown
+        changed = set()
+        for row, column in visible:
+            index = row * width + column
+            if not shown[index]:
+                shown[index] = SHOWN
+                self._explored[index] = 1
+                self._explored_columns[column * height + row] = 1
+                changed.add((row, column))
+        if not self._remember:
+            for row, column in self._visible - visible:
+                shown[row * width + column] = 0
+                changed.add((row, column))
+        self._visible = visible if len(octants) == 8 else None
+        self._position = position
+        return changed
+
+    def _unexplored(self, position, octant):
+        """Returns True if some cell of an octant around position within the
+        radius hasn't been explored."""
+        row, column = position
+        width, height, radius = self._width, self._height, self._radius
+        xx, xy, yx, yy = (multipliers[octant] for multipliers in _OCTANTS)
+        for outward in range(1, radius + 1):
+            reach = min(outward, math.isqrt(radius * radius
+                                            - outward * outward))
+            if yy:
+                # Each distance out is part of a row
+                line, length, explored = row - outward * yy, width, \
+                    self._explored
+                first, last = column, column - reach * xx
+            else:
+                line, length, explored = column - outward * xy, height, \
+                    self._explored_columns
+                first, last = row, row - reach * yx
+            if not 0 <= line < (height if yy else width):
+                break
+            first, last = max(0, min(first, last)), \
+                min(length - 1, max(first, last))
+            if explored.find(0, line * length + first,
+                             line * length + last + 1) != -1:
+                return True
+        return False
+
+    def compute(self, position, octants=range(8)):
+        """Returns the set of cells in view of position, itself included,
+        without changing what has been seen.
+
+        Parameters:
+            position (tuple<int, int>): Where to look from.
+            octants (iterable<int>): Which of the eight octants to look
+                into, all by default.
+        """
+        visible = {position}
+        row, column = position
+        for octant in octants:
+            self._cast(row, column, 1, 1.0, 0.0,
+                       *(multipliers[octant] for multipliers in _OCTANTS),
+                       visible)
+        return visible
+
+    def _cast(self, row, column, distance, start, end, xx, xy, yx, yy,
+              visible):
+        """Scan one octant outwards from distance, between the slopes start
+        and end, adding the cells seen to visible."""
+        if start < end:
+            return
+        radius = self._radius
+        radius_squared = radius * radius
+        width, height, opaque = self._width, self._height, self._opaque
+        new_start = start
+        for outward in range(distance, radius + 1):
+            across = -outward - 1
+            offset = -outward
+            blocked = False
+            while across <= 0:
+                across += 1
+                cell_row = row + across * yx + offset * yy
+                cell_column = column + across * xx + offset * xy
+                left_slope = (across - 0.5) / (offset + 0.5)
+                right_slope = (across + 0.5) / (offset - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+                inside = 0 <= cell_row < height and 0 <= cell_column < width
+                if inside and across * across + offset * offset \
+                        <= radius_squared:
+                    visible.add((cell_row, cell_column))
+                # Past the level's edge is as good as a wall
+                wall = not inside or opaque[cell_row * width + cell_column]
+                if blocked:
+                    if wall:
+                        new_start = right_slope
+                        continue
+                    blocked = False
+                    start = new_start
+                elif wall and outward < radius:
+                    blocked = True
+                    self._cast(row, column, outward + 1, start, left_slope,
+                               xx, xy, yx, yy, visible)
+                    new_start = right_slope
+            if blocked:
+                break
+
@@ -0,0 +1,223 @@
+"""Seeded random levels that can always be won.
+
+Each level is a border of walls around randomly scattered ones. The
+player starts on a random open cell; one breadth first search from there
+finds every cell they can reach, and the key, door and MoveIncreases are
+put only on those. A second search, from the key, gives the distance to
+the door, and the budget is the moves the walk from the start to the key
+and on to the door takes, plus any slack asked for. That walk always
+wins, so no level needs solving, though picking up MoveIncreases on the
+way can let a level be won with fewer moves than its budget.
+
+Level i of a run depends only on the seed and i. Levels are written as
+they are made, as text (with their budgets in levels.json), binary .lvl
+files or one level pack:
+
+    python generator.py out/ --count 1000 --size 50
+    python generator.py big.dcpk --count 20 --size 2000 --boosts 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from engine import PLAYER, KEY, DOOR, WALL, MOVE_INCREASE, SPACE
+from distances import distance_field
+from grid import Grid
+from levelpack import EXTENSION as PACK_EXTENSION, PackWriter
+from levels import BUDGETS_FILE, save_binary, save_text
+
+FORMATS = ("txt", "lvl", "pack")
+
+
+def _wall_table(wall_density):
+    """Returns a bytes.translate table making random bytes walls with
+    chance wall_density and open cells otherwise."""
+    threshold = int(wall_density * 256)
+    return bytes(ord(WALL) if byte < threshold else ord(SPACE)
+                 for byte in range(256))
+
+
+def _reachable(field):
+    """Returns the field indices of every cell a field's source can walk
+    to, itself included."""
+    if numpy is not None:
+        distances = numpy.frombuffer(field, dtype=numpy.int32)
+        return numpy.flatnonzero(distances >= 0).tolist()
+    return [index for index, distance in enumerate(field) if distance >= 0]
+
+
+def generate(width, height, seed=0, wall_density=0.25, boosts=0, slack=0):
+    """Make a level that can be won.
+
+    Parameters:
+        width (int): Columns, border included.
+        height (int): Rows, border included. The inside must have at
+            least three cells.
+        seed: Anything random.Random takes; the same seed gives the same
+            level.
+        wall_density (float): Chance an inner cell is a wall.
+        boosts (int): MoveIncreases to place, as many as fit.
+        slack (int): Moves to allow beyond the shortest winning walk.
+
+    Returns:
+        (tuple<Grid, int>): The level and its move budget.
+    """
+    if (width - 2) * (height - 2) < 3:
+        raise ValueError(f"a {width}x{height} level has no room for a "
+                         f"player, key and door inside its walls")
+    if not 0 <= wall_density < 1:
+        raise ValueError(f"wall density {wall_density} isn't in [0, 1)")
+    rng = random.Random(seed)
+    table = _wall_table(wall_density)
+    stride = width + 2
+    while True:
+        cells = bytearray(rng.randbytes(width * height).translate(table))
+        cells[:width] = cells[-width:] = WALL.encode() * width
+        cells[::width] = cells[width - 1::width] = WALL.encode() * height
+        grid = Grid(width, height, cells, copy=False)
+        open_cells = cells.count(ord(SPACE))
+        if open_cells < 3:
+            continue
+        # The first open cell from a random one on, wrapping around
+        index = cells.find(ord(SPACE), rng.randrange(len(cells)))
+        if index == -1:
+            index = cells.find(ord(SPACE))
+        start = divmod(index, width)
+        from_start = distance_field(grid, start)
+        reachable = _reachable(from_start)
+        # The start, key and door need three cells; walls too thick to
+        # leave that many are rolled again
+        if len(reachable) >= 3:
+            break
+
+    start_index = (start[0] + 1) * stride + start[1] + 1
+    reachable.remove(start_index)
+    placed = rng.sample(reachable, min(len(reachable), 2 + boosts))
+    key_index, door_index = placed[:2]
+    key = (key_index // stride - 1, key_index % stride - 1)
+    from_key = distance_field(grid, key)
+    budget = from_start[key_index] + from_key[door_index] + slack
+
+    for index, char in ((start_index, PLAYER), (key_index, KEY),
+                        (door_index, DOOR),
+                        *((index, MOVE_INCREASE) for index in placed[2:])):
+        grid.set((index // stride - 1, index % stride - 1), char)
+    return grid, budget
+
+
+def generate_many(count, width, height, seed=0, **options):
+    """Yields count levels, level i made from seed and i alone.
+
+    Parameters:
+        count (int): How many levels.
+        width (int): Columns of each level.
+        height (int): Rows of each level.
+        seed: The run's seed.
+        options: generate's other arguments.
+
+    Yields:
+        (tuple<Grid, int>): Each level and its budget.
+    """
+    for number in range(count):
+        yield generate(width, height, f"{seed}:{number}", **options)
+
+
+def level_names(count, level_format):
+    """Returns the file names levels are written under, in order."""
+    extension = ".txt" if level_format == "txt" else ".lvl"
+    digits = len(str(max(count - 1, 0)))
+    return [f"level{number:0{digits}d}{extension}" for number in range(count)]
+
+
+def write_levels(target, levels, names, level_format):
+    """Write levels as they come.
+
+    Parameters:
+        target (str): A directory for txt and lvl levels, the pack file
+            for a pack.
+        levels (iterable<tuple<Grid, int>>): The levels and their budgets.
+        names (list<str>): A name for each level.
+        level_format (str): One of FORMATS.
+
+    Returns:
+        (int): The number of levels written.
+    """
+    written = 0
+    if level_format == "pack":
+        with PackWriter(target, names) as writer:
+            for grid, budget in levels:
+                writer.add(grid, budget)
+                written += 1
+        return written
+
+    os.makedirs(target, exist_ok=True)
+    budgets = {}
+    for name, (grid, budget) in zip(names, levels):
+        path = os.path.join(target, name)
+        if level_format == "txt":
+            save_text(grid, path)
+            budgets[name] = budget
+        else:
+            save_binary(grid, path, budget)
+        written += 1
+    if budgets:
+        # Text levels can't hold a budget; simulate.py and levelpack.py
+        # read this file instead
+        budgets_path = os.path.join(target, BUDGETS_FILE)
+        if os.path.exists(budgets_path):
+            with open(budgets_path) as file:
+                budgets = {**json.load(file), **budgets}
+        with open(budgets_path, "w") as file:
+            json.dump(budgets, file, indent=0)
+    return written
+
+
+def main(argv):
+    """Generate levels from the command line."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument("target",
+                        help=f"directory to write levels to, or a "
+                             f"{PACK_EXTENSION} pack")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--size", type=int, default=12,
+                        help="width and height (default 12)")
+    parser.add_argument("--height", type=int,
+                        help="height, if not the same as the width")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--walls", type=float, default=0.25,
+                        help="chance an inner cell is a wall (default 0.25)")
+    parser.add_argument("--boosts", type=int, default=1,
+                        help="MoveIncreases per level (default 1)")
+    parser.add_argument("--slack", type=int, default=0,
+                        help="moves beyond the shortest win (default 0)")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="default: pack for a .dcpk target, else txt")
+    args = parser.parse_args(argv[1:])
+    level_format = args.format or (
+        "pack" if args.target.endswith(PACK_EXTENSION) else "txt")
+    height = args.size if args.height is None else args.height
+
+    start = time.perf_counter()
+    levels = generate_many(args.count, args.size, height, args.seed,
+                           wall_density=args.walls, boosts=args.boosts,
+                           slack=args.slack)
+    written = write_levels(args.target, levels,
+                           level_names(args.count, level_format),
+                           level_format)
+    elapsed = time.perf_counter() - start
+    print(f"{args.target}: {written} {args.size}x{height} levels in "
+          f"{elapsed:.2f}s ({written / elapsed:,.0f} levels/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,131 @@
+"""Compact storage for dungeon levels.
+
+A Grid holds one byte per cell, the character the level file uses for it
+(WALL, KEY, SPACE, ...), in a single row-major bytearray. A level of a
+million cells is a megabyte, not a million Python objects. NumPy is used
+for array views when it is installed but is never required.
+"""
+
+
+class Grid:
+    """A width x height block of cells, each holding one level character."""
+
+    def __init__(self, width, height, cells=None, fill=" ", copy=True):
+        """Construct a grid.
+
+        Parameters:
+            width (int): The number of columns.
+            height (int): The number of rows.
+            cells (bytes): Row-major contents, width * height bytes long.
+                Defaults to every cell holding fill.
+            fill (str): The character of every cell when cells is None.
+            copy (bool): Whether to copy cells. A bytearray passed with
+                copy False becomes the grid's storage.
+        """
+        if cells is None:
+            cells = fill.encode() * (width * height)
+        if len(cells) != width * height:
+            raise ValueError(f"{len(cells)} cells do not make a "
+                             f"{width}x{height} grid")
+        self._width = width
+        self._height = height
+        if copy or not isinstance(cells, bytearray):
+            cells = bytearray(cells)
+        self._cells = cells
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a grid from rows of a level, padding short rows with
+        spaces.
+
+        Parameters:
+            rows (list<bytes>): The rows of the level, one byte per cell.
+        """
+        width = max((len(row) for row in rows), default=0)
+        return cls(width, len(rows),
+                   b"".join(row.ljust(width) for row in rows))
+
+    def get_width(self):
+        """ """
+        return self._width
+
+    def get_height(self):
+        """ """
+        return self._height
+
+    def in_bounds(self, position):
+        """Returns True if position is a cell of the grid."""
+        row, column = position
+        return 0 <= row < self._height and 0 <= column < self._width
+
+    def get(self, position):
+        """Returns the character at position, or None outside the grid.
+
+        Parameters:
+            position (tuple<int, int>): The (row, column) of the cell.
+        """
+        row, column = position
+        if 0 <= row < self._height and 0 <= column < self._width:
+            return chr(self._cells[row * self._width + column])
+        return None
+
+    def set(self, position, char):
+        """Stores char at position.
+
+        Parameters:
+            position (tuple<int, int>): The (row, column) of the cell.
+            char (str): A single level character.
+        """
+        if not self.in_bounds(position):
+            raise IndexError(f"{position} is outside the grid")
+        row, column = position
+        self._cells[row * self._width + column] = ord(char)
+
+    def positions(self, char):
+        """Returns every position holding char, in reading order.
+
+        Parameters:
+            char (str): A single level character.
+
+        Returns:
+            (list<tuple<int, int>>): The (row, column) of each match.
+        """
+        code = ord(char)
+        found = []
+        index = self._cells.find(code)
+        while index != -1:
+            found.append(divmod(index, self._width))
+            index = self._cells.find(code, index + 1)
+        return found
+
+    def count(self, char):
+        """Returns how many cells hold char."""
+        return self._cells.count(ord(char))
+
+    def rows(self):
+        """Yields each row as a str."""
+        for start in range(0, len(self._cells), self._width or 1):
+            yield self._cells[start:start + self._width].decode()
+
+    def tobytes(self):
+        """Returns the row-major cells as bytes."""
+        return bytes(self._cells)
+
+    def as_array(self):
+        """Returns the cells without copying them: a height x width uint8
+        NumPy array when NumPy is installed, else a memoryview."""
+        # Imported here, as loading a level shouldn't wait for NumPy
+        try:
+            import numpy
+        except ImportError:
+            return memoryview(self._cells)
+        return numpy.frombuffer(self._cells, dtype=numpy.uint8).reshape(
+            self._height, self._width)
+
+    def __eq__(self, other):
+        return (isinstance(other, Grid) and self._width == other._width
+                and self._cells == other._cells)
+
+    def __repr__(self):
+        return f"Grid({self._width}, {self._height})"
+
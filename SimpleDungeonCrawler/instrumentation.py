@@ -0,0 +1,394 @@
+"""Opt-in timing and counting of the game loop's hot paths.
+
+Nothing is measured unless a Profiler is installed: installing wraps the
+methods listed in PHASES and COUNTERS on the classes themselves, and
+uninstalling puts the originals back, so a game without a profiler runs
+exactly the code it would without this module.
+
+Set DUNGEON_PROFILE=1 to profile a game started with python a3.py:
+
+* F3 shows or hides an overlay with the latest latencies,
+* F4 (or SIGUSR1) prints the full report to stderr,
+* the report is printed again when the game exits, and
+* the time from a3 starting to import to its first frame being drawn is
+  recorded as the first_frame phase.
+
+Each phase keeps a rolling window of its most recent durations, from
+which the report gives percentiles and a histogram. Counters keep totals,
+reported per move as well.
+"""
+import atexit
+import bisect
+import functools
+import os
+import signal
+import sys
+import time
+import types
+from collections import deque
+
+ENVIRONMENT_VARIABLE = "DUNGEON_PROFILE"
+# Durations kept per phase
+HISTORY = 1000
+# Upper edges of the histogram buckets, in milliseconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)
+# Milliseconds between overlay refreshes
+OVERLAY_INTERVAL = 500
+
+# (phase, "Class.method") timed each call; methods of classes the
+# installed modules don't have are skipped
+PHASES = (
+    ("input", "GameApp.play"),
+    ("input", "GameApp.click"),
+    ("move", "GameApp.move"),
+    ("step", "GameLogic.step"),
+    ("on_hit", "Key.on_hit"),
+    ("on_hit", "MoveIncrease.on_hit"),
+    ("on_hit", "Door.on_hit"),
+    ("render", "GameApp.render"),
+    ("draw_grid", "DungeonMap.draw_grid"),
+    ("draw_grid", "AdvancedDungeonMap.draw_grid"),
+    ("redraw", "DungeonMap.redraw"),
+    ("redraw", "AdvancedDungeonMap.redraw"),
+    ("timer", "GameApp.timer"),
+)
+# (counter, "owner.attribute") counted each call; owners are looked up in
+# the installed modules, then as attributes of them (tk.Canvas). Lazily
+# imported modules that haven't loaded yet are skipped rather than loaded
+COUNTERS = (
+    ("canvas_items", "tk.Canvas.create_image"),
+    ("canvas_items", "tk.Canvas.create_rectangle"),
+    ("canvas_items", "tk.Canvas.create_text"),
+    # Every tile read into the sprite cache, by Tk from the assets cache
+    # or by PIL
+    ("images_decoded", "SpriteCache._load_photo"),
+    ("images_decoded", "SpriteCache._load_image"),
+    ("entities", "Entity.__init__"),
+)
+# The phase that counts as one move, for per move counts
+MOVE_PHASE = "move"
+
+# The installed profiler, if any
+ACTIVE = None
+
+
+class Histogram:
+    """The most recent durations of one phase."""
+
+    def __init__(self, history=HISTORY):
+        """Construct an empty histogram.
+
+        Parameters:
+            history (int): How many durations to keep.
+        """
+        self._samples = deque(maxlen=history)
+        self._calls = 0
+        self._total = 0.0
+
+    def add(self, seconds):
+        """Record one duration."""
+        self._samples.append(seconds)
+        self._calls += 1
+        self._total += seconds
+
+    def calls(self):
+        """Returns the number of durations ever recorded."""
+        return self._calls
+
+    def total(self):
+        """Returns the seconds of every duration ever recorded."""
+        return self._total
+
+    def percentiles(self, *percents):
+        """Returns the durations the given percents of the recent ones are
+        at or under, in seconds, or None for each if there are none."""
+        ordered = sorted(self._samples)
+        if not ordered:
+            return [None] * len(percents)
+        return [ordered[min(len(ordered) - 1,
+                            int(len(ordered) * percent / 100))]
+                for percent in percents]
+
+    def buckets(self):
+        """Returns how many recent durations fall in each of BUCKETS, with
+        one more count for those longer than the last."""
+        counts = [0] * (len(BUCKETS) + 1)
+        for seconds in self._samples:
+            counts[bisect.bisect_left(BUCKETS, seconds * 1000)] += 1
+        return counts
+
+    def summary(self):
+        """Returns the calls, mean and recent percentiles, in
+        milliseconds, and the bucket counts."""
+        percents = (50, 90, 99)
+        recent = {f"p{percent}_ms": (seconds or 0) * 1000 for percent, seconds
+                  in zip(percents, self.percentiles(*percents))}
+        return {
+            "calls": self._calls,
+            "mean_ms": self._total / self._calls * 1000 if self._calls
+            else 0.0,
+            **recent,
+            "max_ms": max(self._samples, default=0) * 1000,
+            "buckets": self.buckets(),
+        }
+
+
+class Profiler:
+    """Per phase timers and counters for the methods it is installed on."""
+
+    def __init__(self, history=HISTORY):
+        """Construct a profiler with nothing recorded.
+
+        Parameters:
+            history (int): How many durations to keep per phase.
+        """
+        self._history = history
+        self._phases = {}
+        self._counters = {}
+        # (owner, attribute, original or None if it was inherited)
+        self._patched = []
+
+    def record(self, phase, seconds):
+        """Record that phase took seconds."""
+        histogram = self._phases.get(phase)
+        if histogram is None:
+            histogram = self._phases[phase] = Histogram(self._history)
+        histogram.add(seconds)
+
+    def count(self, counter, amount=1):
+        """Add amount to a counter."""
+        self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def get_phase(self, phase):
+        """Returns the Histogram of phase, or None if it never ran."""
+        return self._phases.get(phase)
+
+    def get_counter(self, counter):
+        """Returns a counter's total."""
+        return self._counters.get(counter, 0)
+
+    def reset(self):
+        """Forget everything recorded."""
+        self._phases.clear()
+        self._counters.clear()
+
+    def _timed(self, phase, function):
+        """Returns function wrapped to record its duration as phase."""
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(phase, time.perf_counter() - start)
+        return timed
+
+    def _counted(self, counter, function):
+        """Returns function wrapped to count its calls as counter."""
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            self.count(counter)
+            return function(*args, **kwargs)
+        return counted
+
+    def _patch(self, owner, attribute, wrap):
+        """Replace owner.attribute with wrap(owner.attribute)."""
+        original = owner.__dict__.get(attribute) \
+            if isinstance(owner, type) else getattr(owner, attribute)
+        setattr(owner, attribute, wrap(getattr(owner, attribute)))
+        self._patched.append((owner, attribute, original))
+
+    def install(self, *modules):
+        """Start timing PHASES and counting COUNTERS.
+
+        Parameters:
+            modules (module): Where to find the classes named, such as
+                engine and a3. A method is wrapped once even if several
+                modules share its class.
+        """
+        global ACTIVE
+        if ACTIVE is not None:
+            ACTIVE.uninstall()
+        seen = set()
+        for targets, wrapper in ((PHASES, self._timed),
+                                 (COUNTERS, self._counted)):
+            for name, path in targets:
+                *owner_path, attribute = path.split(".")
+                for module in modules:
+                    owner = module
+                    for part in owner_path:
+                        if owner is None or _unloaded(owner):
+                            owner = None
+                            break
+                        owner = getattr(owner, part, None)
+                    if owner is None or _unloaded(owner) \
+                            or not hasattr(owner, attribute) \
+                            or (id(owner), attribute) in seen:
+                        continue
+                    seen.add((id(owner), attribute))
+                    self._patch(owner, attribute,
+                                functools.partial(wrapper, name))
+        ACTIVE = self
+
+    def uninstall(self):
+        """Put back every method install wrapped."""
+        global ACTIVE
+        for owner, attribute, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, original)
+        self._patched.clear()
+        if ACTIVE is self:
+            ACTIVE = None
+
+    def snapshot(self):
+        """Returns everything recorded so far, ready to be written as
+        JSON."""
+        moves = self._phases.get(MOVE_PHASE)
+        moves = moves.calls() if moves is not None else 0
+        return {
+            "phases": {phase: histogram.summary()
+                       for phase, histogram in self._phases.items()},
+            "counters": dict(self._counters),
+            "per_move": {counter: total / moves
+                         for counter, total in self._counters.items()}
+            if moves else {},
+            "buckets_ms": list(BUCKETS),
+        }
+
+    def report(self, histograms=True):
+        """Returns the phases and counters as text.
+
+        Parameters:
+            histograms (bool): Whether to draw each phase's histogram too.
+        """
+        snapshot = self.snapshot()
+        lines = [f"{'phase':<10} {'calls':>7} {'mean':>8} {'p50':>8} "
+                 f"{'p90':>8} {'p99':>8} {'max':>8}  (ms)"]
+        for phase, summary in sorted(snapshot["phases"].items()):
+            lines.append(
+                f"{phase:<10} {summary['calls']:>7} "
+                + " ".join(f"{summary[column]:>8.3f}" for column in
+                           ("mean_ms", "p50_ms", "p90_ms", "p99_ms",
+                            "max_ms")))
+            if histograms:
+                lines.extend(_bars(summary["buckets"]))
+        for counter, total in sorted(snapshot["counters"].items()):
+            per_move = snapshot["per_move"].get(counter)
+            lines.append(f"{counter:<16} {total:>9}"
+                         + (f"  {per_move:.2f} per move"
+                            if per_move is not None else ""))
+        return "\n".join(lines)
+
+    def dump(self, file=None):
+        """Print the report to file, stderr by default."""
+        print(self.report(), file=file or sys.stderr, flush=True)
+
+
+def _unloaded(owner):
+    """Returns True if owner is a lazily imported module (see
+    a3.lazy_import) that hasn't loaded yet, which looking at any of its
+    attributes would load."""
+    # LazyLoader swaps the module's class for ModuleType once it loads
+    return isinstance(owner, types.ModuleType) \
+        and type(owner) is not types.ModuleType
+
+
+def _bars(buckets, width=30):
+    """Returns a text bar for each non-empty bucket."""
+    most = max(buckets)
+    lines = []
+    for index, count in enumerate(buckets):
+        if not count:
+            continue
+        edge = f"<={BUCKETS[index]}" if index < len(BUCKETS) \
+            else f">{BUCKETS[-1]}"
+        bar = "#" * max(1, count * width // most)
+        lines.append(f"  {edge:>7} {bar:<{width}} {count}")
+    return lines
+
+
+class Overlay:
+    """The latest latencies drawn over the top left of a window."""
+
+    def __init__(self, master, profiler, interval=OVERLAY_INTERVAL):
+        """Construct a hidden overlay.
+
+        Parameters:
+            master (tk.Tk): The window to draw over.
+            profiler (Profiler): What to show.
+            interval (int): Milliseconds between refreshes.
+        """
+        import tkinter as tk
+
+        self._master = master
+        self._profiler = profiler
+        self._interval = interval
+        self._label = tk.Label(master, justify=tk.LEFT, anchor="nw",
+                               font="TkFixedFont", bg="black", fg="white")
+        self._pending = None
+
+    def is_shown(self):
+        """Returns True if the overlay is on screen."""
+        return self._pending is not None
+
+    def refresh(self):
+        """Redraw the overlay and schedule the next refresh."""
+        self._label.config(text=self._profiler.report(histograms=False))
+        self._label.lift()
+        self._pending = self._master.after(self._interval, self.refresh)
+
+    def show(self):
+        """Put the overlay on screen."""
+        if not self.is_shown():
+            self._label.place(x=0, y=0)
+            self.refresh()
+
+    def hide(self):
+        """Take the overlay off screen."""
+        if self.is_shown():
+            self._master.after_cancel(self._pending)
+            self._pending = None
+            self._label.place_forget()
+
+    def toggle(self, event=None):
+        """Show the overlay if it is hidden, else hide it."""
+        if self.is_shown():
+            self.hide()
+        else:
+            self.show()
+
+
+def attach(master, profiler):
+    """Bind F3 to the overlay and F4 and SIGUSR1 to dumping the report.
+
+    Returns:
+        (Overlay): The overlay, hidden.
+    """
+    overlay = Overlay(master, profiler)
+    master.bind("<F3>", overlay.toggle)
+    master.bind("<F4>", lambda event: profiler.dump())
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda number, frame: profiler.dump())
+    return overlay
+
+
+def from_environment(*modules):
+    """Install a profiler on modules if DUNGEON_PROFILE is set, dumping its
+    report when the process exits.
+
+    Parameters:
+        modules (module): The modules to profile; engine is always one.
+
+    Returns:
+        (Profiler): The installed profiler, or None when profiling is off.
+    """
+    if os.environ.get(ENVIRONMENT_VARIABLE, "") in ("", "0"):
+        return None
+    import engine
+
+    profiler = Profiler()
+    profiler.install(engine, *modules)
+    atexit.register(profiler.dump)
+    return profiler
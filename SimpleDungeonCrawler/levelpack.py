@@ -0,0 +1,311 @@
+"""Many levels in one file, each readable without reading the others.
+
+A level pack starts with an index of its levels and then holds each level
+in the binary level format levels.py reads. All numbers are little
+endian:
+
+    magic      4 bytes  b"DCPK"
+    version    uint16   1
+    count      uint32   levels in the pack
+    index      uint32   bytes of index that follow
+    then, for each level:
+        name       uint16 length, then UTF-8
+        offset     uint64   where the level starts in the file
+        size       uint32   its length in bytes
+        budget     int32    moves allowed, or -1 if it doesn't say
+        checksum   20 bytes SHA-1 of the level's bytes
+    then the levels themselves
+
+Opening a pack reads only the index. A level in a pack can be played
+anywhere a level file can, as pack.dcpk:name, and its budget comes from
+the index, so adding a level means adding it to a pack, not to
+GAME_LEVELS:
+
+    python levelpack.py build levels.dcpk game1.txt game2.txt game3.txt
+    python levelpack.py list levels.dcpk
+"""
+import hashlib
+import os
+import struct
+import sys
+from collections import namedtuple
+
+from levels import (NO_BUDGET, PACK_SEPARATOR, level_budget, load_level,
+                    parse_binary, to_binary)
+
+MAGIC = b"DCPK"
+VERSION = 1
+EXTENSION = ".dcpk"
+HEADER = struct.Struct("<4sHII")
+_LENGTH = struct.Struct("<H")
+_ENTRY = struct.Struct("<QIi20s")
+
+PackEntry = namedtuple("PackEntry", ["name", "offset", "size", "budget",
+                                     "checksum"])
+PackEntry.__doc__ = """Where a level is in a pack, the moves it allows
+(None if it doesn't say) and the SHA-1 hex digest of its bytes."""
+
+# (absolute path, size, modified time): LevelPack, so every game loaded
+# from a pack shares its index
+_PACKS = {}
+
+
+def is_pack(filename):
+    """Returns True if filename starts like a level pack."""
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+class LevelPack:
+    """The index of a level pack, loading its levels as they're asked
+    for."""
+
+    def __init__(self, filename):
+        """Read a pack's index.
+
+        Raises:
+            ValueError: If filename isn't a pack this version can read.
+        """
+        self._filename = filename
+        self._entries = {}
+        with open(filename, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"{filename} is too short to be a pack")
+            magic, version, count, index_size = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{filename} is not a version {VERSION} "
+                                 f"level pack")
+            index = file.read(index_size)
+        if len(index) != index_size:
+            raise ValueError(f"{filename} ends in the middle of its index")
+        position = 0
+        for _ in range(count):
+            length, = _LENGTH.unpack_from(index, position)
+            position += _LENGTH.size
+            name = index[position:position + length].decode()
+            position += length
+            offset, size, budget, checksum = _ENTRY.unpack_from(index,
+                                                                position)
+            position += _ENTRY.size
+            self._entries[name] = PackEntry(
+                name, offset, size, None if budget == NO_BUDGET else budget,
+                checksum.hex())
+        self._order = list(self._entries)
+
+    def get_filename(self):
+        """ """
+        return self._filename
+
+    def names(self):
+        """Returns the names of the levels, in the order they were
+        packed."""
+        return list(self._order)
+
+    def entries(self):
+        """Returns the PackEntry of every level, in order."""
+        return [self._entries[name] for name in self._order]
+
+    def get_entry(self, name):
+        """Returns the PackEntry of a level.
+
+        Raises:
+            KeyError: If the pack has no level called name.
+        """
+        return self._entries[name]
+
+    def budget(self, name):
+        """Returns the moves a level allows, or None if it doesn't say."""
+        return self._entries[name].budget
+
+    def address(self, name):
+        """Returns the path GameLogic and the other tools load a level
+        by."""
+        return f"{self._filename}{PACK_SEPARATOR}{name}"
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def read(self, name, verify=True):
+        """Returns a level's bytes, read straight from where it is.
+
+        Parameters:
+            name (str): The level.
+            verify (bool): Whether to check them against their checksum.
+
+        Raises:
+            ValueError: If the bytes don't match their checksum.
+        """
+        entry = self._entries[name]
+        with open(self._filename, "rb") as file:
+            file.seek(entry.offset)
+            data = file.read(entry.size)
+        if verify and (len(data) != entry.size or hashlib.sha1(
+                data).hexdigest() != entry.checksum):
+            raise ValueError(f"{self.address(name)} doesn't match its "
+                             f"checksum")
+        return data
+
+    def load(self, name, verify=True):
+        """Read a level.
+
+        Returns:
+            (tuple<Grid, int>): The level and the moves it allows, None if
+                it doesn't say.
+        """
+        grid, budget = parse_binary(self.read(name, verify),
+                                    self.address(name))
+        return grid, self._entries[name].budget if budget is None else budget
+
+
+def open_pack(filename):
+    """Returns the LevelPack for a pack file, opened once for as long as
+    the file is unchanged."""
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    pack = _PACKS.get(key)
+    if pack is None:
+        pack = _PACKS[key] = LevelPack(filename)
+    return pack
+
+
+def _split(address):
+    """Returns the LevelPack and level name of a pack.dcpk:name address."""
+    filename, _, name = address.rpartition(PACK_SEPARATOR)
+    pack = open_pack(filename)
+    if name not in pack:
+        raise FileNotFoundError(f"{filename} has no level called {name}")
+    return pack, name
+
+
+def load_address(address):
+    """Read the level at a pack.dcpk:name address, as levels.load_level
+    does for files."""
+    pack, name = _split(address)
+    return pack.load(name)
+
+
+def address_digest(address):
+    """Returns the SHA-1 hex digest of the level at a pack.dcpk:name
+    address."""
+    pack, name = _split(address)
+    return pack.get_entry(name).checksum
+
+
+def level_addresses(filename):
+    """Returns the address of every level in a pack, in order."""
+    pack = open_pack(filename)
+    return [pack.address(name) for name in pack]
+
+
+class PackWriter:
+    """Writes a pack one level at a time, so levels can be streamed into it
+    as they are made. The names are needed up front to lay out the index,
+    which is filled in when the writer is closed."""
+
+    def __init__(self, filename, names):
+        """Start a pack.
+
+        Parameters:
+            filename (str): The pack to write.
+            names (list<str>): The name of every level that will be added,
+                in order.
+        """
+        self._names = [name.encode() for name in names]
+        for name in names:
+            if PACK_SEPARATOR in name:
+                raise ValueError(f"level names can't contain "
+                                 f"{PACK_SEPARATOR!r}: {name}")
+        self._index_size = sum(_LENGTH.size + len(name) + _ENTRY.size
+                               for name in self._names)
+        self._entries = []
+        self._file = open(filename, "wb")
+        # The index is written over this once every level's size is known
+        self._file.write(bytes(HEADER.size + self._index_size))
+
+    def add(self, grid, budget=None):
+        """Write the next level.
+
+        Parameters:
+            grid (Grid): The level.
+            budget (int): The moves it allows, or None to leave it out.
+        """
+        if len(self._entries) == len(self._names):
+            raise ValueError("every named level has been added")
+        data = to_binary(grid, budget)
+        self._entries.append(_ENTRY.pack(
+            self._file.tell(), len(data),
+            NO_BUDGET if budget is None else budget,
+            hashlib.sha1(data).digest()))
+        self._file.write(data)
+
+    def close(self):
+        """Write the index and finish the pack."""
+        if len(self._entries) != len(self._names):
+            self._file.close()
+            raise ValueError(f"{len(self._entries)} of {len(self._names)} "
+                             f"levels were added")
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(self._names),
+                                     self._index_size))
+        for name, entry in zip(self._names, self._entries):
+            self._file.write(_LENGTH.pack(len(name)) + name + entry)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self._file.close()
+
+
+def write_pack(filename, levels):
+    """Write levels to a new pack.
+
+    Parameters:
+        filename (str): The pack to write.
+        levels (iterable<tuple<str, Grid, int>>): Each level's name, grid
+            and budget (None for none), in the order to pack them.
+    """
+    levels = list(levels)
+    with PackWriter(filename, [name for name, _, _ in levels]) as writer:
+        for _, grid, budget in levels:
+            writer.add(grid, budget)
+
+
+def main(argv):
+    """Build or list level packs from the command line."""
+    if len(argv) < 3 or argv[1] not in ("build", "list") \
+            or (argv[1] == "build" and len(argv) < 4):
+        print(__doc__.strip())
+        return 2
+    if argv[1] == "list":
+        pack = open_pack(argv[2])
+        for entry in pack.entries():
+            print(f"{entry.name}: {entry.size} bytes, budget "
+                  f"{entry.budget}, sha1 {entry.checksum}")
+        print(f"{len(pack)} levels")
+        return 0
+
+    levels = []
+    for path in argv[3:]:
+        grid, budget = load_level(path)
+        if budget is None:
+            budget = level_budget(path)
+        levels.append((os.path.basename(path), grid, budget))
+    write_pack(argv[2], levels)
+    print(f"{argv[2]}: {len(levels)} levels")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
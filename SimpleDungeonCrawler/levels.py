@@ -0,0 +1,296 @@
+"""Reading and writing level files.
+
+Levels come in two formats:
+
+* text, one row per line with the characters load_game reads, and
+* binary, a fixed header followed by one byte per cell, row by row:
+
+      magic    4 bytes  b"DCLV"
+      version  uint16   1
+      width    uint32
+      height   uint32
+      budget   int32    moves allowed, or -1 if the level doesn't say
+
+  All fields are little endian.
+
+Both are read through a memory map straight into a Grid, so a level never
+becomes a list of characters. Text rows may have different lengths; short
+rows are padded with spaces. To convert between the formats:
+
+    python levels.py game1.txt game1.lvl [budget]
+    python levels.py game1.lvl game1.txt
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from grid import Grid
+
+MAGIC = b"DCLV"
+VERSION = 1
+HEADER = struct.Struct("<4sHIIi")
+NO_BUDGET = -1
+# Between a level pack's path and a level's name in it
+PACK_SEPARATOR = ":"
+# Budgets of the text levels in a directory, which can't hold their own,
+# by file name
+BUDGETS_FILE = "levels.json"
+
+# What str.strip takes off each row of a text level
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+def _map(file):
+    """Returns a read only memory map of file, or b"" if it is empty."""
+    if os.fstat(file.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_block(data):
+    """Copy a text level whose rows are all the same length and have no
+    surrounding whitespace straight into a Grid.
+
+    Returns:
+        (Grid): The level, or None if it isn't laid out that way.
+    """
+    width = data.find(b"\n")
+    if width <= 0:
+        return None
+    stride = width + 1
+    height, last = divmod(len(data), stride)
+    if last == width:
+        height += 1
+    elif last:
+        return None
+    newlines = data[width::stride]
+    if newlines.count(b"\n") != len(newlines):
+        return None
+    for edge in (data[::stride], data[width - 1::stride]):
+        if len(edge.translate(None, WHITESPACE)) != len(edge):
+            return None
+
+    cells = bytearray(width * height)
+    view = memoryview(data)
+    try:
+        for row in range(height):
+            start = row * stride
+            cells[row * width:(row + 1) * width] = view[start:start + width]
+    finally:
+        view.release()
+    return Grid(width, height, cells, copy=False)
+
+
+def _read_rows(data):
+    """Read a text level of any shape one line at a time."""
+    rows = []
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = len(data)
+        rows.append(data[start:end].strip())
+        start = end + 1
+    while rows and not rows[-1]:
+        rows.pop()
+    return Grid.from_rows(rows)
+
+
+def load_text(filename):
+    """Read a text level into a Grid.
+
+    Rows are stripped of surrounding whitespace, as load_game does.
+
+    Parameters:
+        filename (str): A string representing the name of the level.
+    """
+    with open(filename, "rb") as file:
+        data = _map(file)
+        try:
+            grid = _read_block(data)
+            if grid is None:
+                grid = _read_rows(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    return grid
+
+
+def parse_binary(data, name="level"):
+    """Read a binary level from a buffer.
+
+    Parameters:
+        data (bytes): The level, header and all.
+        name (str): What to call the level in errors.
+
+    Returns:
+        (tuple<Grid, int>): The level and its move budget, None if the
+            level doesn't give one.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(f"{name} is too short to be a level")
+    magic, version, width, height, budget = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{name} is not a binary level")
+    if version != VERSION:
+        raise ValueError(f"{name} is level format version {version}, "
+                         f"not {VERSION}")
+    if len(data) != HEADER.size + width * height:
+        raise ValueError(f"{name} should hold {width}x{height} cells")
+    view = memoryview(data)
+    try:
+        cells = bytearray(view[HEADER.size:])
+    finally:
+        view.release()
+    return (Grid(width, height, cells, copy=False),
+            None if budget == NO_BUDGET else budget)
+
+
+def load_binary(filename):
+    """Read a binary level.
+
+    Parameters:
+        filename (str): The level's path.
+
+    Returns:
+        (tuple<Grid, int>): The level and its move budget, None if the
+            file doesn't give one.
+    """
+    with open(filename, "rb") as file:
+        data = _map(file)
+        try:
+            return parse_binary(data, filename)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def is_binary(filename):
+    """Returns True if filename starts like a binary level."""
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def is_pack_address(filename):
+    """Returns True if filename names a level in a level pack, as
+    pack.dcpk:name, rather than a file of its own."""
+    pack, separator, _ = filename.rpartition(PACK_SEPARATOR)
+    return bool(separator) and not os.path.exists(filename) \
+        and os.path.isfile(pack)
+
+
+def level_file(filename):
+    """Returns the file a level is read from: the pack, for a level in
+    one."""
+    if is_pack_address(filename):
+        return filename.rpartition(PACK_SEPARATOR)[0]
+    return filename
+
+
+def load_level(filename):
+    """Read a level in either format, or out of a level pack.
+
+    Parameters:
+        filename (str): The level's path, or pack.dcpk:name for a level
+            in a pack.
+
+    Returns:
+        (tuple<Grid, int>): The level and its move budget, None if the
+            file doesn't give one. Text levels never do.
+    """
+    if is_pack_address(filename):
+        from levelpack import load_address
+        return load_address(filename)
+    if is_binary(filename):
+        return load_binary(filename)
+    return load_text(filename), None
+
+
+def level_budget(path):
+    """Returns the move budget BUDGETS_FILE beside path or GAME_LEVELS
+    gives it, or None if neither does."""
+    from engine import GAME_LEVELS
+
+    directory, name = os.path.split(path)
+    budgets_path = os.path.join(directory, BUDGETS_FILE)
+    if os.path.exists(budgets_path):
+        with open(budgets_path) as file:
+            budgets = json.load(file)
+        if name in budgets:
+            return budgets[name]
+    return GAME_LEVELS.get(path, GAME_LEVELS.get(name))
+
+
+def level_digest(filename):
+    """Returns the SHA-1 hex digest of a level file, or of a packed level's
+    bytes."""
+    if is_pack_address(filename):
+        from levelpack import address_digest
+        return address_digest(filename)
+    digest = hashlib.sha1()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_text(grid, filename):
+    """Write grid as a text level, one row per line."""
+    width = grid.get_width()
+    cells = grid.tobytes()
+    with open(filename, "wb") as file:
+        for row in range(grid.get_height()):
+            if row:
+                file.write(b"\n")
+            file.write(cells[row * width:(row + 1) * width])
+
+
+def to_binary(grid, budget=None):
+    """Returns grid and budget (None to leave it out) as a binary level."""
+    return HEADER.pack(MAGIC, VERSION, grid.get_width(), grid.get_height(),
+                       NO_BUDGET if budget is None else budget) \
+        + grid.tobytes()
+
+
+def save_binary(grid, filename, budget=None):
+    """Write grid as a binary level.
+
+    Parameters:
+        grid (Grid): The level.
+        filename (str): Where to write it.
+        budget (int): The moves allowed, or None to leave it out.
+    """
+    with open(filename, "wb") as file:
+        file.write(to_binary(grid, budget))
+
+
+def main(argv):
+    """Convert the level named first to the format of the file named second,
+    which is binary unless it ends in .txt."""
+    if len(argv) not in (3, 4):
+        print(__doc__.strip())
+        return 2
+    source, target = argv[1], argv[2]
+    grid, budget = load_level(source)
+    if len(argv) == 4:
+        budget = int(argv[3])
+    elif budget is None:
+        from engine import GAME_LEVELS
+        budget = GAME_LEVELS.get(os.path.basename(source))
+
+    if target.endswith(".txt"):
+        save_text(grid, target)
+        if budget is not None:
+            print(f"{target}: text levels can't hold a budget, it was "
+                  f"{budget}")
+    else:
+        save_binary(grid, target, budget)
+    print(f"{target}: {grid.get_width()}x{grid.get_height()}, budget {budget}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,367 @@
+"""Recording games and playing them back.
+
+A replay file holds the SHA-1 of the level it was played on, the state
+the game was in when recording started and every action after that with
+the time it was made. All numbers are little endian:
+
+    magic      4 bytes  b"DCRP"
+    version    uint16   1
+    digest     20 bytes SHA-1 of the level file
+    name       uint16 length, then UTF-8: the level's path when recorded
+    budget     int32    moves a fresh game of the level starts with
+    moves      int32    moves left when recording started
+    row, col   int32    where the player was
+    has key    uint8
+    won        uint8
+    removed    uint32 count, then int32 row, col pairs: entities already
+               picked up
+    actions    to the end of the file, one per action: a varint of
+               milliseconds since the previous action and one byte, the
+               action's number in ACTIONS
+
+Actions are read from disk as they are played, so a long recording never
+has to fit in memory. Replays play headless through GameLogic, to check
+what they lead to, or in real time through the GUI:
+
+    python replay.py record game1.txt session.rpl
+    python replay.py check session.rpl other.rpl
+    python replay.py play session.rpl [speed]
+"""
+import os
+import struct
+import sys
+import time
+
+from engine import KEY, DOOR, MOVE_INCREASE, DIRECTIONS, Key, GameLogic
+from levels import level_digest, level_file
+
+MAGIC = b"DCRP"
+VERSION = 1
+# Actions by number; RESTART starts the level afresh, as GameApp's New
+# game button does, and UNDO takes back the last move still standing
+RESTART = "R"
+UNDO = "U"
+ACTIONS = (*DIRECTIONS, RESTART, UNDO)
+ACTION_NUMBERS = {action: number for number, action in enumerate(ACTIONS)}
+
+_START = struct.Struct("<4sH20s")
+_LENGTH = struct.Struct("<H")
+_STATE = struct.Struct("<iiiiBB")
+_COUNT = struct.Struct("<I")
+_POSITION = struct.Struct("<ii")
+
+# (level path, size, modified time): SHA-1, so checking many replays of one
+# level hashes it once
+_DIGESTS = {}
+
+
+def _digest(filename):
+    """Returns level_digest(filename), remembered while the file is
+    unchanged."""
+    stat = os.stat(level_file(filename))
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    digest = _DIGESTS.get(key)
+    if digest is None:
+        digest = _DIGESTS[key] = level_digest(filename)
+    return digest
+
+
+def _bytes(file):
+    """Yields the rest of file a byte at a time, reading it in blocks."""
+    for block in iter(lambda: file.read(1 << 16), b""):
+        yield from block
+
+
+def _read_exactly(file, size):
+    """Read size bytes from file, raising ValueError if it ends first."""
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError(f"{file.name} ends in the middle of its header")
+    return data
+
+
+class ReplayWriter:
+    """Records the actions played on a game to a replay file."""
+
+    def __init__(self, filename, game, dungeon_name, budget=None):
+        """Start a recording from the state game is in now.
+
+        Parameters:
+            filename (str): The replay file to write.
+            game (GameLogic): The game about to be played.
+            dungeon_name (str): The level file the game was loaded from.
+            budget (int): The moves a fresh game starts with, by default
+                the moves game has left now.
+        """
+        player = game.get_player()
+        if budget is None:
+            budget = player.moves_remaining()
+        grid = game.get_grid()
+        removed = []
+        for entity in (KEY, DOOR, MOVE_INCREASE):
+            present = set(game.get_positions(entity))
+            removed.extend(position for position in grid.positions(entity)
+                           if position not in present)
+        name = dungeon_name.encode()
+        row, column = player.get_position()
+
+        self._file = open(filename, "wb")
+        self._file.write(_START.pack(
+            MAGIC, VERSION, bytes.fromhex(_digest(dungeon_name))))
+        self._file.write(_LENGTH.pack(len(name)) + name)
+        self._file.write(_STATE.pack(
+            budget, player.moves_remaining(), row, column,
+            any(item.get_id() == KEY for item in player.get_inventory()),
+            game.won()))
+        self._file.write(_COUNT.pack(len(removed)))
+        for position in removed:
+            self._file.write(_POSITION.pack(*position))
+        self._last = time.perf_counter()
+
+    def record(self, action, timestamp=None):
+        """Append an action.
+
+        Parameters:
+            action (str): A DIRECTIONS key, RESTART or UNDO.
+            timestamp (float): When it was made, in time.perf_counter()
+                seconds; now by default.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        delay = max(0, round((timestamp - self._last) * 1000))
+        self._last = timestamp
+        data = bytearray()
+        while delay > 0x7f:
+            data.append(delay & 0x7f | 0x80)
+            delay >>= 7
+        data.append(delay)
+        data.append(ACTION_NUMBERS[action])
+        self._file.write(data)
+
+    def record_restart(self, timestamp=None):
+        """Append a restart of the level."""
+        self.record(RESTART, timestamp)
+
+    def record_undo(self, timestamp=None):
+        """Append an undo of the last move."""
+        self.record(UNDO, timestamp)
+
+    def flush(self):
+        """Push recorded actions to disk."""
+        self._file.flush()
+
+    def close(self):
+        """Finish the recording."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayReader:
+    """A replay file's header, with its actions streamed from disk."""
+
+    def __init__(self, filename):
+        """Read a replay's header.
+
+        Raises:
+            ValueError: If filename isn't a replay this version can read.
+        """
+        self._filename = filename
+        with open(filename, "rb") as file:
+            magic, version, digest = _START.unpack(
+                _read_exactly(file, _START.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{filename} is not a version {VERSION} "
+                                 f"replay")
+            self.digest = digest.hex()
+            length, = _LENGTH.unpack(_read_exactly(file, _LENGTH.size))
+            self.dungeon_name = _read_exactly(file, length).decode()
+            (self.budget, self.moves, row, column, has_key,
+             won) = _STATE.unpack(_read_exactly(file, _STATE.size))
+            self.position = (row, column)
+            self.has_key = bool(has_key)
+            self.won = bool(won)
+            count, = _COUNT.unpack(_read_exactly(file, _COUNT.size))
+            self.removed = [
+                _POSITION.unpack(_read_exactly(file, _POSITION.size))
+                for _ in range(count)]
+            self._actions_start = file.tell()
+
+    def actions(self):
+        """Yields (milliseconds since recording started, action) for every
+        action, reading the file as it goes. A recording cut off in the
+        middle of an action ends before it."""
+        elapsed = 0
+        with open(self._filename, "rb") as file:
+            file.seek(self._actions_start)
+            stream = _bytes(file)
+            for byte in stream:
+                delay = byte & 0x7f
+                shift = 7
+                while byte is not None and byte & 0x80:
+                    byte = next(stream, None)
+                    if byte is not None:
+                        delay |= (byte & 0x7f) << shift
+                        shift += 7
+                action = next(stream, None)
+                if byte is None or action is None:
+                    return
+                elapsed += delay
+                yield elapsed, ACTIONS[action]
+
+    def new_game(self, dungeon_name=None):
+        """Load the level and put it in the state recording started from.
+
+        Parameters:
+            dungeon_name (str): Where the level is now, if it has moved
+                since recording.
+
+        Raises:
+            ValueError: If the level file isn't the one recorded on.
+        """
+        dungeon_name = dungeon_name or self.dungeon_name
+        if _digest(dungeon_name) != self.digest:
+            raise ValueError(f"{dungeon_name} is not the level this replay "
+                             f"was recorded on")
+        game = GameLogic(dungeon_name, self.budget)
+        for position in self.removed:
+            game.remove_entity(position)
+        player = game.get_player()
+        game.place_player(self.position)
+        player.change_move_count(self.moves - player.moves_remaining())
+        if self.has_key:
+            player.add_item(Key())
+        game.set_win(self.won)
+        return game
+
+    def fresh_game(self, dungeon_name=None):
+        """Load the level as a RESTART leaves it."""
+        return GameLogic(dungeon_name or self.dungeon_name, self.budget)
+
+
+def play_headless(filename, dungeon_name=None):
+    """Fast-forward through a replay with GameLogic.
+
+    Parameters:
+        filename (str): The replay file.
+        dungeon_name (str): Where the level is, if not where it was.
+
+    Returns:
+        (dict): The actions played, whether the last game was won, the
+            moves left and where the player ended up.
+    """
+    reader = ReplayReader(filename)
+    game = reader.new_game(dungeon_name)
+    # Snapshots before each move since the last restart, as GameApp keeps
+    history = []
+    played = 0
+    for _, action in reader.actions():
+        played += 1
+        if action == RESTART:
+            game.reset()
+            history.clear()
+        elif action == UNDO:
+            if history:
+                game.restore(history.pop())
+        else:
+            history.append(game.snapshot())
+            if not game.step(action):
+                history.pop()
+    player = game.get_player()
+    return {
+        "replay": filename,
+        "actions": played,
+        "won": game.won(),
+        "moves_left": player.moves_remaining(),
+        "position": player.get_position(),
+    }
+
+
+def play_gui(filename, root, speed=1.0, dungeon_name=None):
+    """Play a replay back through GameApp at the pace it was recorded.
+
+    Parameters:
+        filename (str): The replay file.
+        root (tk.Tk): The window to play in.
+        speed (float): How many times faster than recorded to play.
+        dungeon_name (str): Where the level is, if not where it was.
+
+    Returns:
+        (GameApp): The game being played.
+    """
+    import a3
+
+    reader = ReplayReader(filename)
+    # GameApp's timer and quit use the module's root window
+    a3.root = root
+    app = a3.GameApp(root, dungeon_name=dungeon_name or reader.dungeon_name,
+                     game=reader.new_game(dungeon_name))
+    actions = reader.actions()
+    start = time.perf_counter()
+
+    def schedule(item):
+        if item is None:
+            return
+        wait = item[0] / speed / 1000 - (time.perf_counter() - start)
+        root.after(max(0, int(wait * 1000)), play, item)
+
+    def play(item):
+        _, action = item
+        if action == RESTART:
+            app.restart()
+        elif action == UNDO:
+            app.undo()
+        else:
+            app.move(action)
+        schedule(next(actions, None))
+
+    schedule(next(actions, None))
+    return app
+
+
+def main(argv):
+    """Record, check or play replays from the command line."""
+    if len(argv) < 3 or argv[1] not in ("record", "check", "play"):
+        print(__doc__.strip())
+        return 2
+    command = argv[1]
+    if command == "check":
+        start = time.perf_counter()
+        for filename in argv[2:]:
+            result = play_headless(filename)
+            print(f"{filename}: {result['actions']} actions, "
+                  f"{'won' if result['won'] else 'not won'}, "
+                  f"{result['moves_left']} moves left at "
+                  f"{result['position']}")
+        elapsed = time.perf_counter() - start
+        print(f"{len(argv) - 2} replays in {elapsed:.3f}s")
+        return 0
+
+    import tkinter as tk
+    import a3
+
+    root = tk.Tk()
+    a3.root = root
+    if command == "record":
+        if len(argv) != 4:
+            print(__doc__.strip())
+            return 2
+        dungeon_name, filename = argv[2], argv[3]
+        game = GameLogic(dungeon_name)
+        with ReplayWriter(filename, game, dungeon_name) as recorder:
+            a3.GameApp(root, dungeon_name=dungeon_name, game=game,
+                       recorder=recorder)
+            root.mainloop()
+    else:
+        speed = float(argv[3]) if len(argv) > 3 else 1.0
+        play_gui(argv[2], root, speed)
+        root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,448 @@
+"""Many games at once over sockets, one process and one thread.
+
+Each connection is a session with a game of its own, but sessions on the
+same level share one GameLogic: a session holds only its GameState, and
+the shared game is restored to it before each of its moves (see
+GameLogic.snapshot). An idle session costs its socket and a few small
+objects; the level is loaded once however many play it.
+
+The protocol is lines of text. A client sends one action of
+VALID_ACTIONS per line:
+
+    W, A, S or D     move
+    I W (or A, S, D) say what is next to the player that way
+    H                list the actions
+    Q                end the session
+
+On connecting, a client is sent the level whole:
+
+    level <name> <rows> <columns>
+    <rows lines of the map, as Display draws it>
+    moves <moves left>
+
+and every action after that is answered with only what changed, one line
+per event of the step, then the moves left, which ends every reply:
+
+    moved <row> <column>
+    picked_up <row> <column> <entity id>
+    blocked <row> <column>      (or locked, won, lost)
+    investigate <row> <column> <entity id, or - for nothing>
+    help <HELP_MESSAGE>
+    invalid <INVALID>
+    moves <moves left>
+
+Serve levels on a TCP port or a Unix socket, and load a server with many
+sessions to see how it holds up:
+
+    python server.py serve game2.txt --port 8765 --moves 1000000
+    python server.py load --port 8765 --sessions 10000 --active 200
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from engine import (DIRECTIONS, INVESTIGATE, QUIT, HELP, HELP_MESSAGE,
+                    INVALID, PICKED_UP, Display, GameLogic)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Longest line a client may send; anything longer ends its session
+MAX_LINE = 64
+# Word sent for an empty cell, which has no entity id
+NOTHING = "-"
+# The line that ends every reply
+END = b"moves "
+
+
+def _raise_file_limit():
+    """Allow this process as many open sockets as the system lets it."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Level:
+    """A level shared by every session playing it."""
+
+    def __init__(self, dungeon_name, move_count=None):
+        """Load a level.
+
+        Parameters:
+            dungeon_name (str): A level file or pack address.
+            move_count (int): Moves each session starts with, by default
+                the level's budget.
+        """
+        self._name = dungeon_name
+        self._game = GameLogic(dungeon_name, move_count)
+        self._start = self._game.snapshot()
+        self._display = Display(self._game.get_game_information(),
+                                self._game.get_height(),
+                                self._game.get_width())
+
+    def get_name(self):
+        """ """
+        return self._name
+
+    def start(self):
+        """Returns the GameState every session starts from."""
+        return self._start
+
+    def greeting(self, state):
+        """Returns the lines a session in state is sent when it connects:
+        the level's size, its map and the moves left."""
+        game = self._game
+        game.restore(state)
+        return [f"level {self._name} {game.get_height()} "
+                f"{game.get_width()}",
+                *self._display.render_rows(state.position),
+                f"moves {state.moves}"]
+
+    def play(self, state, action):
+        """Play one direction from state.
+
+        Returns:
+            (tuple<GameState, list<str>>): The state after it and the
+                reply's lines.
+        """
+        game = self._game
+        game.restore(state)
+        lines = []
+        for event in game.step(action):
+            row, column = event.position
+            if event.kind == PICKED_UP:
+                lines.append(f"{event.kind} {row} {column} "
+                             f"{event.entity.get_id()}")
+            else:
+                lines.append(f"{event.kind} {row} {column}")
+        state = game.snapshot()
+        lines.append(f"moves {state.moves}")
+        return state, lines
+
+    def investigate(self, state, direction):
+        """Returns the reply's lines for what is next to the player in a
+        direction."""
+        game = self._game
+        game.restore(state)
+        row, column = game.new_position(direction)
+        entity = game.get_entity((row, column))
+        return [f"investigate {row} {column} "
+                f"{NOTHING if entity is None else entity.get_id()}",
+                f"moves {state.moves}"]
+
+
+class Session(asyncio.Protocol):
+    """One connection and the state of its game."""
+
+    def __init__(self, server, level):
+        """Construct a session that has not connected yet.
+
+        Parameters:
+            server (GameServer): The server it belongs to.
+            level (Level): The level it plays.
+        """
+        self._server = server
+        self._level = level
+        self._state = level.start()
+        self._transport = None
+        self._buffer = b""
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._server.opened(self)
+        self._send(self._level.greeting(self._state))
+
+    def connection_lost(self, exc):
+        self._server.closed(self)
+
+    def pause_writing(self):
+        # A client not reading its replies stops being read from too
+        self._transport.pause_reading()
+
+    def resume_writing(self):
+        self._transport.resume_reading()
+
+    def data_received(self, data):
+        *lines, self._buffer = (self._buffer + data).split(b"\n")
+        if len(self._buffer) > MAX_LINE:
+            self._transport.close()
+            return
+        reply = []
+        for line in lines:
+            action = line.decode(errors="replace").strip().upper()
+            if not action:
+                continue
+            if action == QUIT:
+                self._send(reply)
+                self._transport.close()
+                return
+            reply.extend(self.handle(action))
+        if reply:
+            self._send(reply)
+
+    def handle(self, action):
+        """Play one line a client sent.
+
+        Parameters:
+            action (str): The line, stripped and upper cased.
+
+        Returns:
+            (list<str>): The lines to reply with.
+        """
+        if action in DIRECTIONS:
+            self._state, lines = self._level.play(self._state, action)
+            self._server.count_move()
+            return lines
+        moves = f"moves {self._state.moves}"
+        if action == HELP:
+            return [f"help {HELP_MESSAGE}", moves]
+        command, _, direction = action.partition(" ")
+        if command == INVESTIGATE and direction.strip() in DIRECTIONS:
+            return self._level.investigate(self._state, direction.strip())
+        return [f"invalid {INVALID}", moves]
+
+    def _send(self, lines):
+        """Write lines to the client in one go."""
+        if lines:
+            self._transport.write(("\n".join(lines) + "\n").encode())
+
+
+class GameServer:
+    """Sessions on a rotation of shared levels."""
+
+    def __init__(self, levels):
+        """Construct a server with nobody connected.
+
+        Parameters:
+            levels (list<Level>): The levels, given to sessions in turn.
+        """
+        self._levels = levels
+        self._next = 0
+        self._sessions = set()
+        self._peak = 0
+        self._moves = 0
+
+    def session(self):
+        """Returns a Session for a new connection, on the next level."""
+        level = self._levels[self._next]
+        self._next = (self._next + 1) % len(self._levels)
+        return Session(self, level)
+
+    def opened(self, session):
+        """Note a session connecting."""
+        self._sessions.add(session)
+        self._peak = max(self._peak, len(self._sessions))
+
+    def closed(self, session):
+        """Note a session disconnecting."""
+        self._sessions.discard(session)
+
+    def count_move(self):
+        """Note a move played."""
+        self._moves += 1
+
+    def stats(self):
+        """Returns the sessions now and at most and the moves played."""
+        return {"sessions": len(self._sessions), "peak": self._peak,
+                "moves": self._moves}
+
+    async def serve(self, host=HOST, port=PORT, unix=None, every=None):
+        """Accept sessions until cancelled.
+
+        Parameters:
+            host (str): Address to listen on.
+            port (int): TCP port to listen on.
+            unix (str): A Unix socket path to listen on instead.
+            every (float): Seconds between printed stats, or None for none.
+        """
+        loop = asyncio.get_running_loop()
+        if unix is not None:
+            listener = await loop.create_unix_server(self.session, unix,
+                                                     backlog=4096)
+        else:
+            listener = await loop.create_server(self.session, host, port,
+                                                backlog=4096)
+        async with listener:
+            names = ", ".join(level.get_name() for level in self._levels)
+            print(f"serving {names} on {unix or f'{host}:{port}'}",
+                  flush=True)
+            if every is None:
+                await listener.serve_forever()
+            last = self._moves
+            while True:
+                await asyncio.sleep(every)
+                stats = self.stats()
+                print(f"{stats['sessions']} sessions (peak {stats['peak']}), "
+                      f"{(stats['moves'] - last) / every:,.0f} moves/s, "
+                      f"max RSS {_max_rss_mb():.0f} MB", flush=True)
+                last = stats["moves"]
+
+
+def _max_rss_mb():
+    """Returns the most memory this process has held, in megabytes."""
+    if resource is None:
+        return 0.0
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** (2 if sys.platform == "darwin" else 1)
+
+
+class _LoadClient(asyncio.Protocol):
+    """A session of the load generator, counting replies as they end."""
+
+    def __init__(self):
+        self.transport = None
+        self.ready = asyncio.get_running_loop().create_future()
+        self._waiter = None
+        self._buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        for future in (self.ready, self._waiter):
+            if future is not None and not future.done():
+                future.set_exception(ConnectionError("server hung up"))
+
+    def data_received(self, data):
+        self._buffer += data
+        complete, _, self._buffer = self._buffer.rpartition(b"\n")
+        if complete and (b"\n" + complete).count(b"\n" + END):
+            if not self.ready.done():
+                self.ready.set_result(None)
+            elif self._waiter is not None and not self._waiter.done():
+                self._waiter.set_result(None)
+
+    async def send(self, line):
+        """Send a line and wait for its reply to end."""
+        self._waiter = asyncio.get_running_loop().create_future()
+        self.transport.write(line)
+        await self._waiter
+
+
+async def load(sessions, active, seconds, host=HOST, port=PORT, unix=None,
+               seed=0):
+    """Hold many sessions open while some of them play as fast as they can.
+
+    Parameters:
+        sessions (int): Sessions to open and keep open.
+        active (int): How many of them play random directions.
+        seconds (float): How long to play for.
+        host, port, unix: Where the server is, as for GameServer.serve.
+        seed (int): Seed of the directions played.
+
+    Returns:
+        (dict): Sessions, connect time, moves played and moves per second,
+            and reply latency percentiles in milliseconds.
+    """
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    clients = []
+    # Connect in batches, so the server's backlog isn't overrun
+    for first in range(0, sessions, 500):
+        connecting = [loop.create_unix_connection(_LoadClient, unix)
+                      if unix is not None
+                      else loop.create_connection(_LoadClient, host, port)
+                      for _ in range(first, min(sessions, first + 500))]
+        for _, client in await asyncio.gather(*connecting):
+            clients.append(client)
+        await asyncio.gather(*(client.ready for client in
+                               clients[first:]))
+    connected = time.perf_counter() - start
+
+    latencies = []
+    directions = [f"{action}\n".encode() for action in DIRECTIONS]
+    deadline = time.perf_counter() + seconds
+
+    async def play(client):
+        while time.perf_counter() < deadline:
+            sent = time.perf_counter()
+            await client.send(rng.choice(directions))
+            latencies.append(time.perf_counter() - sent)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play(client) for client in
+                           clients[:min(active, sessions)]))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.transport.close()
+
+    latencies.sort()
+
+    def percentile(percent):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1,
+                             int(len(latencies) * percent / 100))] * 1000
+
+    return {
+        "sessions": len(clients),
+        "connect_s": connected,
+        "active": min(active, sessions),
+        "moves": len(latencies),
+        "moves_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(50),
+        "p99_ms": percentile(99),
+    }
+
+
+def main(argv):
+    """Serve games, or load a server, from the command line."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="host levels")
+    serve.add_argument("levels", nargs="+",
+                       help="level files or pack addresses, given to "
+                            "sessions in turn")
+    serve.add_argument("--moves", type=int,
+                       help="moves each session starts with (default: "
+                            "each level's budget)")
+    serve.add_argument("--stats", type=float, metavar="SECONDS",
+                       help="print sessions and moves/s this often")
+    generate = commands.add_parser("load", help="load a running server")
+    generate.add_argument("--sessions", type=int, default=1000)
+    generate.add_argument("--active", type=int, default=100,
+                          help="sessions playing; the rest stay idle "
+                               "(default 100)")
+    generate.add_argument("--seconds", type=float, default=10)
+    generate.add_argument("--seed", type=int, default=0)
+    for command in (serve, generate):
+        command.add_argument("--host", default=HOST)
+        command.add_argument("--port", type=int, default=PORT)
+        command.add_argument("--unix", metavar="PATH",
+                             help="a Unix socket instead of TCP")
+    args = parser.parse_args(argv[1:])
+    _raise_file_limit()
+
+    if args.command == "serve":
+        server = GameServer([Level(name, args.moves)
+                             for name in args.levels])
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix,
+                                     args.stats))
+        except KeyboardInterrupt:
+            stats = server.stats()
+            print(f"{stats['moves']} moves, peak {stats['peak']} sessions")
+        return 0
+
+    result = asyncio.run(load(args.sessions, args.active, args.seconds,
+                              args.host, args.port, args.unix, args.seed))
+    print(f"{result['sessions']} sessions connected in "
+          f"{result['connect_s']:.2f}s; {result['active']} played "
+          f"{result['moves']} moves, {result['moves_per_s']:,.0f} moves/s, "
+          f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
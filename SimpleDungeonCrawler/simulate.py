@@ -0,0 +1,351 @@
+"""Play many action sequences on many levels across worker processes.
+
+Each level's runs are split into chunks, and the chunks are spread over a
+process pool. A worker loads each level once and plays a whole chunk at a
+time with a BatchEngine. Each chunk's totals are written as a JSON line
+as soon as it finishes, and a summary line follows for each level:
+
+    python simulate.py levels/ --runs 10000 --length 60
+    python simulate.py game1.txt game2.txt --actions scripts.txt -o out.jsonl
+
+Runs are random directions unless --actions names a file with one
+sequence per line (like DDWSSA), which every level then plays. Level
+packs play every level in them. A level's move budget comes from its
+binary header or pack index, then from a levels.json file next to it
+mapping file names to budgets, then from GAME_LEVELS.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import batch
+import levelpack
+from engine import DIRECTIONS, GameLogic
+from levels import BUDGETS_FILE, level_budget
+
+LEVEL_EXTENSIONS = (".txt", ".lvl", levelpack.EXTENSION)
+
+# Direction characters to their action numbers, for bytes.translate. Any
+# other byte becomes a number past the end of ACTIONS, which no engine
+# will step with
+_NOT_AN_ACTION = 255
+_ACTION_BYTES = bytes(batch.ACTION_NUMBERS.get(chr(byte), _NOT_AN_ACTION)
+                      for byte in range(256))
+
+# Random bytes to directions, evenly as 256 is a multiple of four
+_RANDOM_DIRECTIONS = bytes(ord(batch.ACTIONS[byte % len(batch.ACTIONS)])
+                           for byte in range(256))
+
+# Per worker process: (level path, budget) -> GameLogic as loaded
+_GAMES = {}
+# Per worker process: (level path, budget, players) -> BatchEngine
+_ENGINES = {}
+
+
+def find_levels(paths):
+    """Expand directories into the level files in them, sorted by name,
+    and level packs into the addresses of the levels in them.
+
+    Parameters:
+        paths (list<str>): Level files, level packs and directories of
+            them.
+
+    Returns:
+        (list<str>): The level files and pack.dcpk:name addresses.
+    """
+    levels = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = sorted(os.path.join(path, name)
+                           for name in os.listdir(path)
+                           if name.endswith(LEVEL_EXTENSIONS))
+        else:
+            found = [path]
+        for level in found:
+            if os.path.isfile(level) and levelpack.is_pack(level):
+                levels.extend(levelpack.level_addresses(level))
+            else:
+                levels.append(level)
+    return levels
+
+
+def load(path, budget=None):
+    """Load a level for simulation.
+
+    Parameters:
+        path (str): The level file.
+        budget (int): Moves allowed, overriding any the level has.
+    """
+    if budget is None:
+        try:
+            return GameLogic(path)
+        except KeyError:
+            budget = level_budget(path)
+        if budget is None:
+            raise ValueError(f"{path} has no move budget; give it one in "
+                             f"{BUDGETS_FILE} or with --budget")
+    return GameLogic(path, budget)
+
+
+def check_sequence(sequence):
+    """Raise ValueError if sequence holds anything but DIRECTIONS keys."""
+    invalid = sorted(set(sequence) - DIRECTIONS.keys())
+    if invalid:
+        raise ValueError(f"{sequence!r} holds {''.join(invalid)!r}, not "
+                         f"only the directions {''.join(DIRECTIONS)}")
+
+
+def _engine(path, budget, players):
+    """Returns this worker's BatchEngine for a level, reset and ready."""
+    engine = _ENGINES.get((path, budget, players))
+    if engine is None:
+        game = _GAMES.get((path, budget))
+        if game is None:
+            game = _GAMES[(path, budget)] = load(path, budget)
+        engine = _ENGINES[(path, budget, players)] = batch.BatchEngine(
+            game, players)
+    else:
+        engine.reset()
+    return engine
+
+
+def play_chunk(path, chunk, budget, sequences=None, runs=0, length=0,
+               seed=0):
+    """Play one chunk of runs on a level. Runs in a worker process.
+
+    Parameters:
+        path (str): The level file.
+        chunk (int): The chunk's number within the level.
+        budget (int): Moves allowed, or None for the level's own budget.
+        sequences (list<str>): One string of DIRECTIONS keys per run, or
+            None to play random runs. Anything else in them raises
+            ValueError.
+        runs (int): How many random runs to play.
+        length (int): Directions in each random run.
+        seed (int): Seed for the random runs.
+
+    Returns:
+        (dict): The chunk's totals, ready to be written as JSON.
+    """
+    start = time.perf_counter()
+    if sequences is None:
+        sequences = _random_sequences(seed, path, chunk, runs, length)
+    else:
+        for sequence in sequences:
+            check_sequence(sequence)
+    players = len(sequences)
+    engine = _engine(path, budget, players)
+    lengths = [len(sequence) for sequence in sequences]
+    longest = max(lengths, default=0)
+    # Runs stop counting once their own sequence runs out, while the
+    # engine carries on stepping them with filler directions
+    padded = [sequence.ljust(longest, batch.ACTIONS[0])
+              for sequence in sequences]
+
+    if batch.numpy is not None:
+        totals = _count_arrays(engine, padded, lengths)
+    else:
+        totals = _count_lists(engine, padded, lengths)
+    moves_used, key_steps, won = totals
+
+    got_key = [steps for steps in key_steps if steps]
+    return {
+        "level": path,
+        "chunk": chunk,
+        "runs": players,
+        "wins": int(sum(won)),
+        "moves_used": sum(moves_used),
+        "keys": len(got_key),
+        "key_steps": sum(got_key),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _count_arrays(engine, padded, lengths):
+    """Step engine through padded sequences, counting each run's moves,
+    the step it picked up the key on (0 for never) and whether it won by
+    the end of its own sequence."""
+    numpy = batch.numpy
+    lengths = numpy.array(lengths)
+    moves_used = numpy.zeros(len(padded), dtype=numpy.int64)
+    key_steps = numpy.zeros(len(padded), dtype=numpy.int64)
+    won = engine.won().copy()
+    holding = engine.has_key().copy()
+    actions = numpy.frombuffer(
+        "".join(padded).encode().translate(_ACTION_BYTES),
+        dtype=numpy.uint8).reshape(len(padded), -1).astype(numpy.int64)
+    for step in range(actions.shape[1]):
+        result = engine.step(actions[:, step])
+        counting = step < lengths
+        moves_used += (result.moved | result.blocked) & counting
+        picked = engine.has_key() & ~holding & counting
+        key_steps[picked] = step + 1
+        holding |= picked
+        won = numpy.where(counting, engine.won(), won)
+    return moves_used.tolist(), key_steps.tolist(), won.tolist()
+
+
+def _count_lists(engine, padded, lengths):
+    """_count_arrays, one run at a time."""
+    players = len(padded)
+    moves_used = [0] * players
+    key_steps = [0] * players
+    won = list(engine.won())
+    holding = list(engine.has_key())
+    for step in range(len(padded[0]) if padded else 0):
+        result = engine.step([sequence[step] for sequence in padded])
+        has_key = engine.has_key()
+        for player in range(players):
+            if step >= lengths[player]:
+                continue
+            if result.moved[player] or result.blocked[player]:
+                moves_used[player] += 1
+            if has_key[player] and not holding[player]:
+                holding[player] = True
+                key_steps[player] = step + 1
+            won[player] = engine.won()[player]
+    return moves_used, key_steps, won
+
+
+def _random_sequences(seed, path, chunk, runs, length):
+    """Returns runs random sequences, the same for the same arguments."""
+    if length <= 0:
+        return [""] * runs
+    rng = random.Random(f"{seed}:{os.path.basename(path)}:{chunk}")
+    directions = rng.randbytes(runs * length).translate(
+        _RANDOM_DIRECTIONS).decode()
+    return [directions[start:start + length]
+            for start in range(0, runs * length, length)]
+
+
+def _tasks(levels, runs, length, seed, sequences, chunk_size):
+    """Yields (path, chunk, sequences, runs) for every chunk of every
+    level, with sequences None for random runs."""
+    for path in levels:
+        if sequences is not None:
+            for chunk, start in enumerate(range(0, len(sequences),
+                                                chunk_size)):
+                yield path, chunk, sequences[start:start + chunk_size], 0
+        else:
+            for chunk, start in enumerate(range(0, runs, chunk_size)):
+                yield path, chunk, None, min(chunk_size, runs - start)
+
+
+def simulate(levels, runs=1000, length=100, seed=0, sequences=None,
+             workers=None, chunk_size=4096, budget=None):
+    """Play runs on every level across a process pool.
+
+    Parameters:
+        levels (list<str>): Level files.
+        runs (int): Random runs per level, when sequences is None.
+        length (int): Directions in each random run.
+        seed (int): Seed for the random runs.
+        sequences (list<str>): Scripted runs to play on every level instead.
+        workers (int): Worker processes, default one per CPU.
+        chunk_size (int): Most runs a worker plays in one go.
+        budget (int): Moves allowed on every level, overriding their own.
+
+    Yields:
+        (dict): Each chunk's totals, in the order the chunks finish.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, path, chunk, budget,
+                               chunk_sequences, count, length, seed)
+                   for path, chunk, chunk_sequences, count in _tasks(
+                       levels, runs, length, seed, sequences, chunk_size)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summarize(records):
+    """Combine chunk totals into one summary per level.
+
+    Parameters:
+        records (iterable<dict>): Results of play_chunk.
+
+    Returns:
+        (list<dict>): Per level, in the order levels were first seen: the
+            runs played, win rate, mean moves used, the share of runs that
+            picked up the key and the mean steps it took them.
+    """
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record["level"], dict.fromkeys(
+            ("runs", "wins", "moves_used", "keys", "key_steps"), 0))
+        for field in total:
+            total[field] += record[field]
+    summaries = []
+    for level, total in totals.items():
+        runs = total["runs"]
+        keys = total["keys"]
+        summaries.append({
+            "level": level,
+            "summary": True,
+            "runs": runs,
+            "win_rate": total["wins"] / runs if runs else 0.0,
+            "mean_moves_used": total["moves_used"] / runs if runs else 0.0,
+            "key_rate": keys / runs if runs else 0.0,
+            "mean_time_to_key": total["key_steps"] / keys if keys else None,
+        })
+    return summaries
+
+
+def main(argv):
+    """Run the simulator from the command line."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument("levels", nargs="+",
+                        help="level files or directories of them")
+    parser.add_argument("--runs", type=int, default=1000,
+                        help="random runs per level (default 1000)")
+    parser.add_argument("--length", type=int, default=100,
+                        help="directions per random run (default 100)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--actions",
+                        help="file of scripted runs, one per line")
+    parser.add_argument("--budget", type=int,
+                        help="moves allowed on every level")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("-o", "--output",
+                        help="JSONL file to write (default: stdout)")
+    args = parser.parse_args(argv[1:])
+
+    sequences = None
+    if args.actions:
+        sequences = []
+        with open(args.actions) as file:
+            for number, line in enumerate(file, 1):
+                sequence = line.strip().upper()
+                if not sequence:
+                    continue
+                try:
+                    check_sequence(sequence)
+                except ValueError as error:
+                    parser.error(f"{args.actions} line {number}: {error}")
+                sequences.append(sequence)
+    levels = find_levels(args.levels)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        records = []
+        for record in simulate(levels, args.runs, args.length, args.seed,
+                               sequences, args.workers, args.chunk_size,
+                               args.budget):
+            records.append(record)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+        for summary in summarize(records):
+            output.write(json.dumps(summary) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
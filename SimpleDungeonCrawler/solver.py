@@ -0,0 +1,486 @@
+"""Shortest winning action sequences for a game in progress.
+
+Only the cells where something happens matter to a winning route: the
+start, the key, the door and the MoveIncrease pickups. The solver runs A*
+over those waypoints, with legs between them measured by breadth first
+search, so a state is just (waypoint, has key, bitmask of pickups used,
+moves left). Pickups too far off the way to pay for themselves are never
+tried: a route can only pick up as many as it has moves to walk to, and
+into and out of, each one. A state is dropped when an earlier one at the
+same waypoint, with the same pickups still worth going to left unused,
+had at least as many moves left. Even so, a route may pick up hundreds
+of pickups, each of which has to be weighed at every state, and proving
+a level dense with them can't be won with a budget well short of its
+straight route can take longer than is worth waiting for, so searches
+can be capped at a number of states or seconds.
+
+    python solver.py game1.txt game2.txt
+"""
+import heapq
+import sys
+import time
+
+from engine import DIRECTIONS, KEY, DOOR, WALL, MOVE_INCREASE, GameLogic
+
+UNREACHABLE = -1
+# What solve and winnable return when they give up at max_states or
+# max_seconds
+UNKNOWN = "unknown"
+
+
+class Solver:
+    """Searches for the shortest way to win a game from its current state.
+
+    The walkable cells are held as one int bitmask laid out row by row with
+    an always blocked column after each row, so a whole breadth first wave
+    is a handful of shifts and masks and moves can't wrap between rows.
+    """
+
+    def __init__(self, game):
+        """Read the level and the player's state out of a game.
+
+        Parameters:
+            game (GameLogic): The game to solve; it is not changed.
+        """
+        grid = game.get_grid()
+        width, height = grid.get_width(), grid.get_height()
+        self._stride = stride = width + 1
+        # One bit per cell, walls clear, with the blocked column after
+        # each row left clear as well
+        table = bytes(0x30 if byte == ord(WALL) else 0x31
+                      for byte in range(256))
+        cells = grid.tobytes().translate(table)
+        bits = bytearray(b"0") * (height * stride)
+        for row in range(height):
+            bits[row * stride:row * stride + width] = (
+                cells[row * width:(row + 1) * width])
+        self._passable = int(bits[::-1], 2)
+
+        def bit_index(position):
+            row, column = position
+            return row * stride + column
+        keys = game.get_positions(KEY)
+        doors = game.get_positions(DOOR)
+        self._key = bit_index(keys[0]) if keys else None
+        self._door = bit_index(doors[0]) if doors else None
+        # bit index: (bit in the used mask, moves given)
+        self._boosts = {}
+        for position in game.get_positions(MOVE_INCREASE):
+            self._boosts[bit_index(position)] = (
+                1 << len(self._boosts), game.get_entity(position).get_moves())
+        self._max_gain = max((gain for _, gain in self._boosts.values()),
+                             default=0)
+
+        player = game.get_player()
+        row, column = player.get_position()
+        self._start = row * stride + column
+        self._moves = player.moves_remaining()
+        self._has_key = any(item.get_id() == KEY
+                            for item in player.get_inventory())
+
+        self._waypoints = 0
+        for index in (self._key, self._door, self._start, *self._boosts):
+            if index is not None:
+                self._waypoints |= 1 << index
+        # bit index: {waypoint bit index: distance}
+        self._distances = {}
+        # (bit index, has key): the boosts in reach, in _detours' orders
+        self._detour_cache = {}
+        # bit index of a boost: steps to the nearest other waypoint, and
+        # to the nearest two
+        self._nearest_cache = {}
+        self._offsets = {action: dx * stride + dy
+                         for action, (dx, dy) in DIRECTIONS.items()}
+
+    def _grow(self, frontier, visited):
+        """Return the walkable, unvisited cells next to frontier."""
+        stride = self._stride
+        grown = (frontier << 1 | frontier >> 1
+                 | frontier << stride | frontier >> stride)
+        return grown & self._passable & ~visited
+
+    def distances(self, source):
+        """Return the distance from source to every reachable waypoint.
+
+        Parameters:
+            source (int): The bit index to measure from.
+
+        Returns:
+            (dict<int, int>): Steps to each waypoint that can be reached.
+        """
+        found = self._distances.get(source)
+        if found is not None:
+            return found
+        found = {source: 0}
+        frontier = visited = 1 << source
+        remaining = self._waypoints & ~frontier
+        step = 0
+        while frontier and remaining:
+            step += 1
+            frontier = self._grow(frontier, visited)
+            visited |= frontier
+            hits = frontier & remaining
+            remaining &= ~hits
+            while hits:
+                lowest = hits & -hits
+                found[lowest.bit_length() - 1] = step
+                hits ^= lowest
+        self._distances[source] = found
+        return found
+
+    def add_distances(self, source, distances):
+        """Supply distances measured elsewhere, so they aren't searched for.
+
+        Parameters:
+            source (tuple<int, int>): The position measured from.
+            distances (dict<tuple<int, int>, int>): Steps from source to
+                every waypoint (start, key, door and MoveIncreases) that can
+                be reached.
+        """
+        stride = self._stride
+        self._distances[source[0] * stride + source[1]] = {
+            row * stride + column: steps
+            for (row, column), steps in distances.items()}
+
+    def solve(self, moves=None, max_states=None, max_seconds=None):
+        """Find the shortest winning sequence of directions.
+
+        Parameters:
+            moves (int): Moves to solve with instead of the player's. The
+                distances measured are kept, so one Solver can be asked
+                about several budgets cheaply.
+            max_states (int): Most states to expand before giving up, or
+                None to search until the answer is found. Proving a level
+                thick with MoveIncreases can't be won with a budget well
+                short of its straight route can take far longer than
+                minutes, and each state takes longer the more of them
+                there are.
+            max_seconds (float): Longest to search before giving up, or
+                None for no limit.
+
+        Returns:
+            (list<str>): The directions to play, None when the game cannot
+                be won with the moves available, or UNKNOWN if max_states
+                or max_seconds ran out first.
+        """
+        found = self._search(moves, max_states, max_seconds)
+        if found is None or found is UNKNOWN:
+            return found
+        return self._actions(*found)
+
+    def winnable(self, moves=None, max_states=None, max_seconds=None):
+        """Returns True if the game can be won, without working out the
+        directions, False if it can't, or UNKNOWN if max_states or
+        max_seconds ran out first.
+
+        Parameters:
+            moves (int): Moves to solve with instead of the player's.
+            max_states (int): As for solve.
+            max_seconds (float): As for solve.
+        """
+        found = self._search(moves, max_states, max_seconds)
+        return found if found is UNKNOWN else found is not None
+
+    def _search(self, moves, max_states=None, max_seconds=None):
+        """Run the A* search.
+
+        Returns:
+            (tuple<list, int>): The labels and the label that wins, None
+                when the game cannot be won, or UNKNOWN when more than
+                max_states labels would have to be expanded or the search
+                runs past max_seconds.
+        """
+        if max_seconds is not None:
+            deadline = time.perf_counter() + max_seconds
+        if self._door is None or (self._key is None and not self._has_key):
+            return None
+        self._to_door = self.distances(self._door)
+        self._to_key = (self.distances(self._key) if self._key is not None
+                        else self._to_door)
+        self._key_to_door = self._to_door.get(self._key, UNREACHABLE)
+
+        # Each label is (bit index, has key, used mask, parent label)
+        labels = [(self._start, self._has_key, 0, None)]
+        best = {(self._start, self._has_key, 0): 0}
+        # (bit index, has key, boosts worth going to left unused): the
+        # most moves any label expanded there had
+        expanded = {}
+        searched = 0
+        # Ties go to the deeper label, which is closer to the door
+        queue = [(self._estimate(self._start, self._has_key), 0, 0,
+                  self._moves if moves is None else moves)]
+        while queue:
+            _, steps, label, moves = heapq.heappop(queue)
+            steps = -steps
+            index, has_key, used, _ = labels[label]
+            if has_key and index == self._door and label:
+                return labels, label
+            if max_seconds is not None and time.perf_counter() > deadline:
+                return UNKNOWN
+            limit, targets, relevant = self._targets(index, has_key, used,
+                                                     moves)
+            if self._dominated(expanded, index, has_key, moves, used,
+                               relevant):
+                continue
+            searched += 1
+            if max_states is not None and searched > max_states:
+                return UNKNOWN
+
+            for target, distance in targets:
+                next_moves = moves - distance
+                next_used = used
+                if target in self._boosts:
+                    bit, gain = self._boosts[target]
+                    next_used |= bit
+                    next_moves += gain
+                next_key = has_key or target == self._key
+                won = next_key and target == self._door
+                if next_moves <= 0 and not won:
+                    continue
+                left = self._estimate(target, next_key)
+                if left == UNREACHABLE or distance + left > limit:
+                    continue
+                state = (target, next_key, next_used)
+                if best.get(state, steps + distance + 1) <= steps + distance:
+                    continue
+                best[state] = steps + distance
+                labels.append((target, next_key, next_used, label))
+                heapq.heappush(queue, (steps + distance + left,
+                                       -steps - distance, len(labels) - 1,
+                                       next_moves))
+        return None
+
+    def _estimate(self, index, has_key):
+        """Return the fewest steps left to win from a waypoint, or
+        UNREACHABLE if there is no way."""
+        if has_key:
+            return self._to_door.get(index, UNREACHABLE)
+        if index not in self._to_key or self._key_to_door == UNREACHABLE:
+            return UNREACHABLE
+        return self._to_key[index] + self._key_to_door
+
+    def _nearest(self, boost):
+        """Return the steps from a boost to the nearest other waypoint and
+        the sum of the steps to the nearest two. A route must walk the
+        first to pick the boost up, and a route passing through it walks
+        in and out along two different ways."""
+        nearest = self._nearest_cache.get(boost)
+        if nearest is not None:
+            return nearest
+        others = self._waypoints & ~(1 << boost)
+        frontier = visited = 1 << boost
+        found = []
+        step = 0
+        while frontier and len(found) < 2:
+            step += 1
+            frontier = self._grow(frontier, visited)
+            visited |= frontier
+            hits = frontier & others
+            found.extend([step] * min(2, bin(hits).count("1")))
+        found.extend([step] * 2)
+        nearest = self._nearest_cache[boost] = (found[0], found[0] + found[1])
+        return nearest
+
+    def _detours(self, index, has_key):
+        """Return the boosts reachable from a waypoint, nearest to the way
+        first, and again nearest, cheapest to walk into and cheapest to
+        walk through first.
+
+        Returns:
+            (tuple<list, list, list, list>): (length of the shortest winning
+                route through the boost, mask bit, moves given, bit index,
+                distance) for each boost, sorted by route length; then
+                (distance, route length, mask bit), (steps from the
+                nearest other waypoint, route length, mask bit) and (steps
+                from the nearest two, route length, mask bit), each sorted
+                by steps.
+        """
+        detours = self._detour_cache.get((index, has_key))
+        if detours is not None:
+            return detours
+        distances = self.distances(index)
+        start_to_key = distances.get(self._key, UNREACHABLE)
+        detours = ([], [], [], [])
+        by_route, by_distance, by_entry, by_passing = detours
+        for boost, (bit, gain) in self._boosts.items():
+            distance = distances.get(boost)
+            if (distance is None or boost == index
+                    or boost not in self._to_door):
+                continue
+            if has_key:
+                through = distance + self._to_door[boost]
+            elif UNREACHABLE in (start_to_key, self._key_to_door):
+                continue
+            else:
+                # The boost is picked up either before or after the key
+                through = min(
+                    distance + self._to_key[boost] + self._key_to_door,
+                    start_to_key + self._to_key[boost] + self._to_door[boost])
+            entry, passing = self._nearest(boost)
+            by_route.append((through, bit, gain, boost, distance))
+            by_distance.append((distance, through, bit))
+            by_entry.append((entry, through, bit))
+            by_passing.append((passing, through, bit))
+        for detour in detours:
+            detour.sort()
+        self._detour_cache[(index, has_key)] = detours
+        return detours
+
+    def _targets(self, index, has_key, used, moves):
+        """Work out where a label can usefully go next.
+
+        No route from here is longer than the moves left plus the boosts it
+        picks up, and a boost can only be picked up if going through it on
+        the way to winning is no longer than that. Nor can a route pick up
+        its i-th boost before it has walked to it and into i boosts, paid
+        for by the moves left and the boosts before, or pass through more
+        boosts than the steps into and out of them allow. Boosts ruled out
+        are dropped until that limit settles.
+
+        Returns:
+            (tuple<int, list<tuple<int, int>>, int>): The most steps a
+                winning route from here could take, (waypoint, distance)
+                pairs for the key or door and each boost in reach worth
+                going to, and the mask of every boost that could still be
+                worth going to.
+        """
+        by_route, by_distance, by_entry, by_passing = self._detours(
+            index, has_key)
+        gain = self._max_gain
+        limit = moves + gain * len(by_route)
+        # The route through the nearest boost to the way not yet used
+        nearest = next((through for through, bit, _, _, _ in by_route
+                        if not used & bit), limit)
+        while nearest <= limit:
+            # Boosts taken nearest, or cheapest, first, as any others
+            # would leave fewer moves
+            reached = 0
+            for distance, through, bit in by_distance:
+                if through > limit or used & bit:
+                    continue
+                if distance > moves + gain * reached:
+                    break
+                reached += 1
+            picked = walked = 0
+            for entry, through, bit in by_entry:
+                if picked == reached:
+                    break
+                if through > limit or used & bit:
+                    continue
+                walked += entry
+                if walked > moves + gain * picked:
+                    break
+                picked += 1
+            # Every step of a route is on the way into or out of at most
+            # two boosts
+            passed = fits = count = 0
+            for passing, through, bit in by_passing:
+                if fits == picked:
+                    break
+                if through > limit or used & bit:
+                    continue
+                count += 1
+                passed += passing
+                if passed <= 2 * (moves + gain * count):
+                    fits = count
+                elif passing >= 2 * gain:
+                    break
+            settled = moves + gain * fits
+            if settled == limit:
+                break
+            limit = settled
+        else:
+            limit = moves
+
+        targets = []
+        relevant = 0
+        for through, bit, _, boost, distance in by_route:
+            if through > limit:
+                break
+            if used & bit:
+                continue
+            relevant |= bit
+            if distance <= moves:
+                targets.append((boost, distance))
+        goal = self._door if has_key else self._key
+        distance = self.distances(index).get(goal, moves + 1)
+        if distance <= moves:
+            targets.append((goal, distance))
+        return limit, targets, relevant
+
+    @staticmethod
+    def _dominated(expanded, index, has_key, moves, used, relevant):
+        """Record a label being expanded, unless an earlier expanded label at
+        the same waypoint, with the same boosts still worth going to left
+        unused, had at least as many moves left."""
+        state = (index, has_key, relevant & ~used)
+        if expanded.get(state, -1) >= moves:
+            return True
+        expanded[state] = moves
+        return False
+
+    def _actions(self, labels, label):
+        """Turn the chain of waypoints ending at label into directions."""
+        waypoints = []
+        while label is not None:
+            index, _, _, label = labels[label]
+            waypoints.append(index)
+        waypoints.reverse()
+
+        actions = []
+        for source, target in zip(waypoints, waypoints[1:]):
+            actions.extend(self._leg(source, target))
+        return actions
+
+    def _leg(self, source, target):
+        """Return the directions of a shortest walk from source to target."""
+        waves = [1 << target]
+        visited = waves[0]
+        while not waves[-1] >> source & 1:
+            waves.append(self._grow(waves[-1], visited))
+            visited |= waves[-1]
+        waves.pop()
+
+        actions = []
+        index = source
+        while waves:
+            wave = waves.pop()
+            for action, offset in self._offsets.items():
+                if index + offset >= 0 and wave >> (index + offset) & 1:
+                    actions.append(action)
+                    index += offset
+                    break
+        return actions
+
+
+def solve(game, max_states=None, max_seconds=None):
+    """Find the shortest winning sequence of directions for a game.
+
+    Parameters:
+        game (GameLogic): The game to solve from its current state.
+        max_states (int): As for Solver.solve.
+        max_seconds (float): As for Solver.solve.
+
+    Returns:
+        (list<str>): The directions to play, None if it cannot be won, or
+            UNKNOWN if max_states or max_seconds ran out first.
+    """
+    return Solver(game).solve(max_states=max_states, max_seconds=max_seconds)
+
+
+def main(argv):
+    """Print the shortest solution of each level named on the command line."""
+    if len(argv) < 2:
+        print(__doc__.strip())
+        return 2
+    for dungeon_name in argv[1:]:
+        actions = solve(GameLogic(dungeon_name))
+        if actions is None:
+            print(f"{dungeon_name}: cannot be won")
+        else:
+            print(f"{dungeon_name}: {len(actions)} moves {''.join(actions)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,74 @@
+"""Tests for a3.py's maps: redrawing only the cells that changed must
+leave a map looking as it does after redrawing every cell."""
+import random
+
+import pytest
+
+import a3
+import benchmarks
+from engine import DIRECTIONS, PICKED_UP, GameLogic
+from fov import FieldOfView
+
+# Options that decide how a canvas item looks
+OPTIONS = ("state", "fill", "text", "image")
+
+
+def shown(dungeon_map):
+    """Returns how every item of a map's canvas looks, and the composited
+    frame for maps drawn as one image."""
+    canvas = dungeon_map._dungeon_map_frame
+    items = [(tuple(canvas.coords(item)),
+              tuple(str(canvas.itemcget(item, option)) for option in OPTIONS))
+             for item in canvas.find_all()]
+    tiles = getattr(dungeon_map, "_tiles", None)
+    if isinstance(tiles, a3.CompositeFrame):
+        return items, tiles._frame.tobytes()
+    return items, None
+
+
+MAPS = {
+    "cells": a3.DungeonMap,
+    "items": lambda root, game: a3.AdvancedDungeonMap(root, game,
+                                                      a3.TileItems),
+    "composite": lambda root, game: a3.AdvancedDungeonMap(
+        root, game, a3.CompositeFrame),
+    "fog": lambda root, game: a3.AdvancedDungeonMap(
+        root, game, a3.TileItems, FieldOfView(game.get_grid(), 4)),
+    "composite fog": lambda root, game: a3.AdvancedDungeonMap(
+        root, game, a3.CompositeFrame, FieldOfView(game.get_grid(), 4)),
+}
+
+
+@pytest.fixture(scope="module")
+def window():
+    pytest.importorskip("tkinter")
+    with benchmarks._window() as (root, _):
+        yield root
+
+
+@pytest.mark.parametrize("size", [12, 60])
+@pytest.mark.parametrize("kind", list(MAPS))
+def test_redraw_matches_full_redraw(tmp_path, window, kind, size):
+    if "composite" in kind:
+        pytest.importorskip("PIL")
+    rows = benchmarks.generate_level(size, seed=size, boost_density=0.05)
+    path = benchmarks.write_level(rows, str(tmp_path), "level.txt")
+    game = GameLogic(path, 1000)
+    dungeon_map = MAPS[kind](window, game)
+    rng = random.Random(0)
+    states = [game.snapshot()]
+    for step in range(150):
+        if step % 25 == 24:
+            # Undo back to an earlier state, as GameApp does
+            changed = game.restore(rng.choice(states))
+        else:
+            events = game.step(rng.choice(tuple(DIRECTIONS)))
+            changed = [event.position for event in events
+                       if event.kind == PICKED_UP]
+            states.append(game.snapshot())
+        dungeon_map.redraw(changed)
+        window.update()
+        redrawn = shown(dungeon_map)
+        dungeon_map.draw_grid()
+        window.update()
+        assert redrawn == shown(dungeon_map)
@@ -0,0 +1,86 @@
+"""Tests for batch.py, played against GameLogic one player at a time."""
+import random
+
+import pytest
+
+import batch
+import generator
+from engine import DIRECTIONS, KEY, GameLogic
+from levels import save_binary
+
+# A level with no wall around it, so players can bump into its edges, and
+# the door next to the start so some walk into it before having the key
+OPEN_LEVEL = "OD  \n M  \n  M \nK  M\n"
+
+
+def levels(tmp_path):
+    """Yields (level file, moves) pairs to play."""
+    path = tmp_path / "open.txt"
+    path.write_text(OPEN_LEVEL)
+    yield str(path), 12
+    for seed in range(6):
+        grid, budget = generator.generate(9, 9, seed, wall_density=0.2,
+                                          boosts=6)
+        path = str(tmp_path / f"level{seed}.lvl")
+        save_binary(grid, path, budget)
+        yield path, budget
+
+
+def summary(events):
+    """Returns events with entities replaced by their ids, as two games
+    never share entities."""
+    return [(event.kind, event.position,
+             event.entity.get_id() if event.entity is not None else None)
+            for event in events]
+
+
+@pytest.fixture(params=["numpy", "lists"])
+def arrays(request, monkeypatch):
+    """Runs a test with NumPy arrays, if installed, and with lists."""
+    if request.param == "numpy" and batch.numpy is None:
+        pytest.skip("NumPy isn't installed")
+    if request.param == "lists":
+        monkeypatch.setattr(batch, "numpy", None)
+    return request.param
+
+
+def test_matches_game_logic(tmp_path, arrays):
+    rng = random.Random(0)
+    players = 24
+    for path, moves in levels(tmp_path):
+        engine = batch.BatchEngine(GameLogic(path, moves), players)
+        games = [GameLogic(path, moves) for _ in range(players)]
+        for _ in range(moves * 3):
+            actions = [rng.choice(batch.ACTIONS) for _ in range(players)]
+            result = engine.step(actions)
+            for player, game in enumerate(games):
+                events = game.step(actions[player])
+                assert summary(engine.events(result, player, actions)) == (
+                    summary(events))
+                assert engine.get_positions()[player] == (
+                    game.get_player().get_position())
+                assert engine.moves_remaining()[player] == (
+                    game.get_player().moves_remaining())
+                assert bool(engine.has_key()[player]) == any(
+                    item.get_id() == KEY
+                    for item in game.get_player().get_inventory())
+                assert bool(engine.won()[player]) == game.won()
+                assert bool(engine.finished()[player]) == (
+                    game.won() or game.check_game_over())
+
+
+def test_reset_starts_again(tmp_path, arrays):
+    path, moves = next(levels(tmp_path))
+    engine = batch.BatchEngine(GameLogic(path, moves), 2)
+    first = [engine.step("SS") for _ in range(3)]
+    engine.reset()
+    south = batch.ACTION_NUMBERS["S"]
+    again = [engine.step([south, south]) for _ in range(3)]
+    assert [[list(flags) for flags in result] for result in first] == (
+        [[list(flags) for flags in result] for result in again])
+    with pytest.raises(ValueError):
+        engine.step("S")
+
+
+def test_actions_are_directions():
+    assert set(batch.ACTIONS) == set(DIRECTIONS)
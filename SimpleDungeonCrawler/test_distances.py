@@ -0,0 +1,41 @@
+"""Tests for distances.py."""
+import time
+
+import distances
+import generator
+import solver
+from engine import GameLogic
+from levels import save_binary
+
+
+def make_level(tmp_path, size, seed, boosts):
+    grid, budget = generator.generate(size, size, seed, wall_density=0.25,
+                                      boosts=boosts)
+    path = str(tmp_path / f"level{seed}.lvl")
+    save_binary(grid, path, budget)
+    return path, budget
+
+
+def test_min_budget_is_the_fewest_moves_that_win(tmp_path):
+    for seed in range(20):
+        path, budget = make_level(tmp_path, 12, seed, 4)
+        fields = distances.DistanceFields.build(GameLogic(path))
+        fewest = fields.min_budget()
+        assert solver.Solver(GameLogic(path)).winnable(fewest)
+        assert not solver.Solver(GameLogic(path)).winnable(fewest - 1)
+        assert fields.winnable(fewest)
+        assert not fields.winnable(fewest - 1)
+
+
+def test_dense_boosts_give_a_range_in_time(tmp_path):
+    path, budget = make_level(tmp_path, 200, 0, 400)
+    game = GameLogic(path)
+    fields = distances.DistanceFields.build(game)
+    began = time.perf_counter()
+    low, high = distances._budgets(game, fields)
+    assert time.perf_counter() - began < 2 * distances.BUDGET_SECONDS
+    assert low <= high == budget
+    assert fields.winnable(budget)
+    fields.save(str(tmp_path / "dense.dist"))
+    read = distances.DistanceFields.read(str(tmp_path / "dense.dist"))
+    assert read.budget_range() == fields.budget_range()
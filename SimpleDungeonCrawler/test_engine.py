@@ -0,0 +1,75 @@
+"""Tests for engine.py's snapshot and restore, checked against playing the
+same directions again from the start."""
+import random
+
+import generator
+from engine import DIRECTIONS, PLAYER, KEY, DOOR, MOVE_INCREASE, GameLogic
+from levels import save_binary
+
+
+def observed(game):
+    """Returns everything play can change that can be seen from outside."""
+    player = game.get_player()
+    return (player.get_position(), player.moves_remaining(),
+            [item.get_id() for item in player.get_inventory()], game.won(),
+            {position: entity.get_id() for position, entity
+             in game.get_game_information().get_entities().items()},
+            [game.get_positions(entity)
+             for entity in (PLAYER, KEY, DOOR, MOVE_INCREASE)])
+
+
+def replayed(path, moves, actions):
+    """Returns a fresh game with actions played on it."""
+    game = GameLogic(path, moves)
+    for action in actions:
+        game.step(action)
+    return game
+
+
+def test_restore_matches_replay(tmp_path):
+    grid, _ = generator.generate(20, 20, 0, wall_density=0.1, boosts=40)
+    path = str(tmp_path / "level.lvl")
+    save_binary(grid, path)
+    moves = 60
+    rng = random.Random(0)
+    game = GameLogic(path, moves)
+    actions = [rng.choice(list(DIRECTIONS)) for _ in range(300)]
+    states = [game.snapshot()]
+    for action in actions:
+        game.step(action)
+        states.append(game.snapshot())
+    assert game.get_game_information().get_entities() != (
+        GameLogic(path, moves).get_game_information().get_entities())
+
+    # Back and forth between states in any order, each compared with the
+    # game played up to it from the start
+    for step in rng.sample(range(len(states)), 40) + [len(states) - 1, 0]:
+        changed = game.restore(states[step])
+        expected = replayed(path, moves, actions[:step])
+        assert observed(game) == observed(expected)
+        assert game.snapshot() == states[step]
+        assert game.get_player().get_position() in changed
+
+    game.restore(states[len(states) // 2])
+    game.reset()
+    assert observed(game) == observed(GameLogic(path, moves))
+
+
+def test_play_on_after_restore(tmp_path):
+    grid, _ = generator.generate(12, 12, 1, wall_density=0.1, boosts=10)
+    path = str(tmp_path / "level.lvl")
+    # Enough moves to last past the halfway point
+    save_binary(grid, path, 150)
+    rng = random.Random(1)
+    actions = [rng.choice(list(DIRECTIONS)) for _ in range(200)]
+    middle = len(actions) // 2
+    game = GameLogic(path)
+    for action in actions[:middle]:
+        game.step(action)
+    halfway = game.snapshot()
+    for action in actions[middle:]:
+        game.step(action)
+    game.restore(halfway)
+    for action in actions[middle:]:
+        game.step(action)
+    assert observed(game) == observed(replayed(path, None, actions))
@@ -0,0 +1,72 @@
+"""Tests for levelpack.py: packs read back the levels written to them."""
+import pytest
+
+import generator
+import levelpack
+import levels
+import simulate
+from engine import GameLogic
+
+
+def pack_levels():
+    """Returns (name, grid, budget) for a few levels, one without a
+    budget."""
+    packed = []
+    for seed in range(5):
+        grid, budget = generator.generate(6 + seed * 5, 8, seed, boosts=seed)
+        packed.append((f"level{seed}", grid, None if seed == 2 else budget))
+    return packed
+
+
+def test_pack_reads_back(tmp_path):
+    path = str(tmp_path / f"levels{levelpack.EXTENSION}")
+    packed = pack_levels()
+    levelpack.write_pack(path, packed)
+    assert levelpack.is_pack(path)
+
+    pack = levelpack.LevelPack(path)
+    assert pack.names() == [name for name, _, _ in packed]
+    assert len(pack) == len(packed)
+    for name, grid, budget in packed:
+        assert name in pack
+        assert pack.budget(name) == budget
+        assert pack.load(name) == (grid, budget)
+        address = pack.address(name)
+        assert levels.load_level(address) == (grid, budget)
+        assert levels.level_digest(address) == pack.get_entry(name).checksum
+    assert levelpack.level_addresses(path) == simulate.find_levels([path])
+    assert "level5" not in pack
+
+
+def test_levels_in_a_pack_play(tmp_path):
+    path = str(tmp_path / f"levels{levelpack.EXTENSION}")
+    packed = pack_levels()
+    levelpack.write_pack(path, packed)
+    name, grid, budget = packed[0]
+    game = GameLogic(levelpack.open_pack(path).address(name))
+    assert game.get_grid() == grid
+    assert game.get_player().moves_remaining() == budget
+
+
+def test_damaged_pack_is_rejected(tmp_path):
+    path = tmp_path / f"levels{levelpack.EXTENSION}"
+    levelpack.write_pack(str(path), pack_levels())
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(data)
+    pack = levelpack.LevelPack(str(path))
+    with pytest.raises(ValueError):
+        pack.load(pack.names()[-1])
+    pack.load(pack.names()[0])
+    with pytest.raises(FileNotFoundError):
+        levels.load_level(f"{path}{levels.PACK_SEPARATOR}missing")
+
+
+def test_writer_wants_every_named_level(tmp_path):
+    path = str(tmp_path / f"levels{levelpack.EXTENSION}")
+    (name, grid, budget), *_ = pack_levels()
+    with pytest.raises(ValueError):
+        with levelpack.PackWriter(path, [name, "other"]) as writer:
+            writer.add(grid, budget)
+    with pytest.raises(ValueError):
+        levelpack.PackWriter(path, [f"bad{levels.PACK_SEPARATOR}name"])
@@ -0,0 +1,69 @@
+"""Tests for levels.py: each format reads back what was written to it."""
+import os
+
+import pytest
+
+import generator
+import levels
+from grid import Grid
+
+
+def some_levels():
+    """Yields grids of several shapes, with and without MoveIncreases."""
+    for seed, (width, height) in enumerate([(5, 5), (5, 9), (30, 7),
+                                            (64, 64)]):
+        yield generator.generate(width, height, seed, wall_density=0.2,
+                                 boosts=seed * 3)[0]
+
+
+@pytest.mark.parametrize("budget", [None, 0, 57])
+def test_binary_reads_back(tmp_path, budget):
+    path = str(tmp_path / "level.lvl")
+    for grid in some_levels():
+        levels.save_binary(grid, path, budget)
+        assert levels.is_binary(path)
+        assert levels.load_binary(path) == (grid, budget)
+        assert levels.load_level(path) == (grid, budget)
+        assert levels.parse_binary(levels.to_binary(grid, budget)) == (
+            grid, budget)
+
+
+def test_text_reads_back(tmp_path):
+    path = str(tmp_path / "level.txt")
+    for grid in some_levels():
+        levels.save_text(grid, path)
+        assert not levels.is_binary(path)
+        assert levels.load_text(path) == grid
+        assert levels.load_level(path) == (grid, None)
+
+
+def test_text_reads_the_shipped_levels(tmp_path):
+    for name in ("game1.txt", "game2.txt", "game3.txt"):
+        shipped = os.path.join(os.path.dirname(__file__), name)
+        grid = levels.load_text(shipped)
+        with open(shipped, "rb") as file:
+            rows = [row.strip() for row in file.read().splitlines()]
+        while rows and not rows[-1]:
+            rows.pop()
+        assert grid == Grid.from_rows(rows)
+        path = str(tmp_path / name)
+        levels.save_text(grid, path)
+        assert levels.load_text(path) == grid
+
+
+def test_text_ignores_surrounding_whitespace(tmp_path):
+    grid = next(some_levels())
+    path = tmp_path / "level.txt"
+    path.write_text("\r\n".join(f"  {row} \t" for row in grid.rows())
+                    + "\r\n\r\n", newline="")
+    assert levels.load_text(str(path)) == grid
+
+
+def test_binary_rejects_damaged_levels():
+    data = levels.to_binary(next(some_levels()), 10)
+    with pytest.raises(ValueError):
+        levels.parse_binary(data[:-1])
+    with pytest.raises(ValueError):
+        levels.parse_binary(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        levels.parse_binary(data[:levels.HEADER.size - 1])
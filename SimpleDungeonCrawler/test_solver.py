@@ -0,0 +1,93 @@
+"""Tests for solver.py, checked against a breadth first search of the game
+itself."""
+import random
+import time
+from collections import deque
+
+import generator
+import solver
+from engine import DIRECTIONS, GameLogic
+from levels import save_binary
+
+
+def brute_force(game):
+    """Returns the fewest directions that win game, or None, by playing
+    every direction from every state the game can get into."""
+    start = game.snapshot()
+    seen = {(start.position, start.inventory, frozenset(start.consumed))}
+    queue = deque([(start, 0)])
+    while queue:
+        state, steps = queue.popleft()
+        for action in DIRECTIONS:
+            game.restore(state)
+            game.step(action)
+            if game.won():
+                return steps + 1
+            after = game.snapshot()
+            if after.moves <= 0:
+                continue
+            seen_as = (after.position, after.inventory,
+                       frozenset(after.consumed))
+            if seen_as not in seen:
+                seen.add(seen_as)
+                queue.append((after, steps + 1))
+    return None
+
+
+def small_levels(tmp_path, count):
+    """Yields (level file, straight route budget) for small levels, some
+    with no MoveIncreases and some crowded with them."""
+    rng = random.Random(0)
+    for seed in range(count):
+        size = rng.randint(5, 10)
+        grid, budget = generator.generate(size, size, seed, wall_density=0.3,
+                                          boosts=rng.randint(0, 6))
+        path = str(tmp_path / f"small{seed}.lvl")
+        save_binary(grid, path, budget)
+        yield path, budget
+
+
+def test_matches_brute_force(tmp_path):
+    for path, budget in small_levels(tmp_path, 40):
+        for moves in range(1, budget + 4, 2):
+            fewest = brute_force(GameLogic(path, moves))
+            actions = solver.solve(GameLogic(path, moves))
+            assert solver.Solver(GameLogic(path, moves)).winnable() == (
+                fewest is not None)
+            if fewest is None:
+                assert actions is None
+                continue
+            assert len(actions) == fewest
+            game = GameLogic(path, moves)
+            game.step_many(actions)
+            assert game.won()
+
+
+def test_other_budgets_match_a_new_solver(tmp_path):
+    for path, budget in small_levels(tmp_path, 10):
+        reused = solver.Solver(GameLogic(path))
+        for moves in range(budget + 4, 0, -3):
+            expected = solver.solve(GameLogic(path, moves))
+            actions = reused.solve(moves)
+            assert (actions is None) == (expected is None)
+            assert actions is None or len(actions) == len(expected)
+
+
+def test_dense_boosts_give_up_in_time(tmp_path):
+    # 400 MoveIncreases on a 200x200 level, which can't be proven
+    # unwinnable with a quarter of the straight route's moves in any time
+    # worth waiting
+    grid, budget = generator.generate(200, 200, 0, wall_density=0.25,
+                                      boosts=400)
+    path = str(tmp_path / "dense.lvl")
+    save_binary(grid, path, budget)
+    dense = solver.Solver(GameLogic(path))
+
+    began = time.perf_counter()
+    assert dense.winnable(budget // 4, max_seconds=0.25) in (False,
+                                                              solver.UNKNOWN)
+    assert time.perf_counter() - began < 1
+
+    began = time.perf_counter()
+    assert len(dense.solve(max_seconds=5)) == budget
+    assert time.perf_counter() - began < 1
@@ -0,0 +1,203 @@
+"""The dungeon in a terminal, for playing over ssh.
+
+TerminalRenderer draws a window onto the level that follows the player,
+sized to the terminal. On a terminal that understands ANSI escape codes
+only the cells that changed since the last frame are sent, each run of
+them after a cursor move; anywhere else (a pipe, a dumb terminal) every
+frame is printed whole, as Display.display_game does.
+
+    python textview.py game1.txt [rows columns] [--fog radius]
+
+With --fog, only cells the player has seen are drawn; the rest are FOG.
+
+Type any number of W, A, S and D and press enter to move, or Q to quit.
+"""
+import os
+import shutil
+import sys
+
+from engine import (DIRECTIONS, QUIT, BLOCKED, LOCKED, WON, LOST, INVALID,
+                    NO_KEY_TEXT, WIN_TEXT, LOSE_TEXT, Display, GameLogic)
+from fov import FieldOfView
+
+# Cursor to the top left, then clear the screen
+CLEAR = "\x1b[H\x1b[2J"
+# Clear from the cursor to the end of the screen, where the player types
+CLEAR_BELOW = "\x1b[J"
+# Lines below the map: moves left and the last message
+STATUS_LINES = 2
+
+# What the status line says after each kind of event
+MESSAGES = {
+    BLOCKED: INVALID,
+    LOCKED: NO_KEY_TEXT,
+    WON: WIN_TEXT,
+    LOST: LOSE_TEXT,
+}
+
+
+def supports_ansi(stream):
+    """Returns True if stream is a terminal that takes ANSI escape codes."""
+    isatty = getattr(stream, "isatty", None)
+    return bool(isatty and isatty()) and os.environ.get(
+        "TERM", "") not in ("", "dumb")
+
+
+def _move_to(row, column):
+    """Returns the escape code moving the cursor to a 0 based cell."""
+    return f"\x1b[{row + 1};{column + 1}H"
+
+
+class TerminalRenderer:
+    """Draws a game as text, sending only what changed between frames."""
+
+    def __init__(self, game, rows=None, columns=None, stream=None,
+                 ansi=None, fog_radius=None):
+        """Construct a renderer that has drawn nothing yet.
+
+        Parameters:
+            game (GameLogic): The game to draw.
+            rows (int): Rows of the level to show, by default as many as
+                fit in the terminal.
+            columns (int): Columns of the level to show, likewise.
+            stream (file): Where to draw, stdout by default.
+            ansi (bool): Whether stream takes escape codes, by default
+                worked out from stream and $TERM.
+            fog_radius (int): How far the player sees, hiding the cells
+                they haven't seen; None draws every cell.
+        """
+        self._game = game
+        self._stream = sys.stdout if stream is None else stream
+        self._ansi = supports_ansi(self._stream) if ansi is None else ansi
+        if rows is None or columns is None:
+            size = shutil.get_terminal_size()
+            rows = size.lines - STATUS_LINES - 1 if rows is None else rows
+            columns = size.columns if columns is None else columns
+        self._rows = max(1, min(rows, game.get_height()))
+        self._columns = max(1, min(columns, game.get_width()))
+        self._field_of_view = None
+        if fog_radius is not None:
+            self._field_of_view = FieldOfView(game.get_grid(), fog_radius)
+        self._display = Display(game.get_game_information(),
+                                game.get_height(), game.get_width(),
+                                self._field_of_view)
+        self._message = ""
+        # The lines on screen, None until the first full frame
+        self._drawn = None
+
+    def viewport(self):
+        """Returns the (top, left) cell of the window, centred on the
+        player as far as the level's edges allow."""
+        row, column = self._game.get_player().get_position()
+        top = min(max(0, row - self._rows // 2),
+                  self._game.get_height() - self._rows)
+        left = min(max(0, column - self._columns // 2),
+                   self._game.get_width() - self._columns)
+        return top, left
+
+    def set_message(self, message):
+        """Show message on the status line from the next frame on."""
+        self._message = message
+
+    def frame(self):
+        """Returns the lines of the next frame: the window onto the level,
+        then the status lines, all padded to the same width."""
+        player = self._game.get_player()
+        if self._field_of_view is not None:
+            self._field_of_view.update(player.get_position())
+        top, left = self.viewport()
+        lines = self._display.render_rows(player.get_position(), top, left,
+                                          self._rows, self._columns)
+        lines.append(f"Moves left: {player.moves_remaining()}")
+        lines.append(self._message)
+        width = max(self._columns, *(len(line) for line in lines[-2:]))
+        return [line.ljust(width) for line in lines]
+
+    def invalidate(self):
+        """Draw the next frame whole, as after the screen was cleared."""
+        self._drawn = None
+
+    def render(self):
+        """Draw the game as it is now.
+
+        Returns:
+            (int): The characters written.
+        """
+        lines = self.frame()
+        if not self._ansi:
+            output = "\n".join(lines) + "\n"
+        elif self._drawn is None or len(self._drawn) != len(lines) \
+                or len(self._drawn[0]) != len(lines[0]):
+            output = CLEAR + "\n".join(lines)
+        else:
+            output = "".join(_changes(self._drawn, lines))
+        if self._ansi:
+            output += _move_to(len(lines), 0) + CLEAR_BELOW
+            self._drawn = lines
+        self._stream.write(output)
+        self._stream.flush()
+        return len(output)
+
+
+def _changes(old, new):
+    """Yields the escape codes and text turning lines old into new, one
+    cursor move per changed run within a line."""
+    for row, (before, after) in enumerate(zip(old, new)):
+        if before == after:
+            continue
+        column = 0
+        end = len(after)
+        while column < end:
+            if before[column] == after[column]:
+                column += 1
+                continue
+            start = column
+            while column < end and before[column] != after[column]:
+                column += 1
+            yield _move_to(row, start) + after[start:column]
+
+
+def play(game, renderer, lines):
+    """Play lines of typed directions until the game ends or Q is typed.
+
+    Parameters:
+        game (GameLogic): The game to play.
+        renderer (TerminalRenderer): Where to show it.
+        lines (iterable<str>): What the player types, a line per turn.
+    """
+    renderer.render()
+    for line in lines:
+        for action in line.strip().upper():
+            if action == QUIT:
+                return
+            if action not in DIRECTIONS:
+                renderer.set_message(INVALID)
+                continue
+            renderer.set_message("")
+            for event in game.step(action):
+                if event.kind in MESSAGES:
+                    renderer.set_message(MESSAGES[event.kind])
+        renderer.render()
+        if game.won() or game.check_game_over():
+            return
+
+
+def main(argv):
+    """Play a level in the terminal."""
+    fog_radius = None
+    if len(argv) > 2 and argv[-2] == "--fog":
+        fog_radius = int(argv[-1])
+        argv = argv[:-2]
+    if len(argv) not in (2, 4):
+        print(__doc__.strip())
+        return 2
+    game = GameLogic(argv[1])
+    rows, columns = (int(argv[2]), int(argv[3])) if len(argv) == 4 \
+        else (None, None)
+    play(game, TerminalRenderer(game, rows, columns, fog_radius=fog_radius),
+         sys.stdin)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))